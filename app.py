@@ -8,13 +8,13 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
 from backend.app import create_app
 
-# 创建应用实例
-app = create_app()
-
 def open_browser():
     webbrowser.open("http://127.0.0.1:3737")
 
 if __name__ == '__main__':
+    # 创建应用实例（放在主模块保护内：缩略图进程池以 spawn 方式启动子进程时会重新导入本文件）
+    app = create_app()
+
     # 从后端配置中导入必要的常量
     from backend.config import IMAGE_DIR, THUMBNAIL_DIR
     print("🎨 守望影神图集案器 v0.1 启动中...")
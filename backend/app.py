@@ -5,7 +5,10 @@ import logging
 from flask import Flask
 from .config import IMAGE_DIR, THUMBNAIL_DIR
 from .routes import register_routes
-from .utils import generate_all_thumbnails
+from .compression import compress_response
+from . import catalog, tree_cache
+from .thumbnails import on_catalog_changed, generate_all_thumbnails
+from .watcher import start_watcher
 
 def create_app():
     """创建Flask应用"""
@@ -15,10 +18,27 @@ def create_app():
     log = logging.getLogger('werkzeug')
     log.setLevel(logging.ERROR)
     
+    # 初始化单元索引并与文件系统增量对账（首次运行即为全量建立）
+    catalog.init_catalog()
+    catalog.reconcile_catalog()
+    
+    # 之后的索引变化（监听器推送、接口写入）按子树失效目录树缓存，并触发缩略图生成
+    catalog.add_listener(tree_cache.on_catalog_changed)
+    catalog.add_listener(on_catalog_changed)
+    start_watcher()
+    
     # 注册路由
     register_routes(app)
     
+    # 较大的 JSON 响应按 Accept-Encoding 压缩
+    app.after_request(compress_response)
+    
     # 添加全局错误处理，确保API端点始终返回JSON
+    @app.errorhandler(400)
+    def bad_request(error):
+        # 参数校验通过 abort(400, 说明) 报告，说明原样返回给前端
+        return {'error': error.description}, 400
+    
     @app.errorhandler(404)
     def not_found(error):
         return {'error': 'API端点不存在'}, 404
@@ -0,0 +1,776 @@
+# 单元目录索引模块
+# 将所有单元（图片 + txt）持久化到 SQLite，读接口直接查询索引，不在请求中遍历文件系统
+import os
+import json
+import stat
+import base64
+import sqlite3
+import threading
+import time
+from .config import IMAGE_DIR, CATALOG_DB
+from .utils import (scan_directory, scan_single_unit, same_unit_stats, prompt_tag_tokens, prompt_word_text, name_trigrams_json,
+                    source_version)
+
+# 每个线程持有独立连接，写操作通过锁串行化
+_local = threading.local()
+_write_lock = threading.Lock()
+
+# 最近一次对账的统计信息
+last_reconcile = {}
+
+# 索引变化监听器（目录树、缩略图队列等订阅）
+_listeners = []
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    value TEXT NOT NULL DEFAULT '',
+    modified REAL NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    txt_modified REAL NOT NULL DEFAULT 0,
+    txt_size INTEGER NOT NULL DEFAULT 0,
+    natural_name TEXT NOT NULL DEFAULT '',
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_units_folder ON units(folder, path);
+CREATE INDEX IF NOT EXISTS idx_units_modified ON units(modified, path);
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    name TEXT NOT NULL,
+    modified REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders(parent);
+CREATE TABLE IF NOT EXISTS thumbnails (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    source_modified REAL NOT NULL,
+    source_size INTEGER NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL DEFAULT 0,
+    served REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_thumbnails_path ON thumbnails(path, profile);
+"""
+
+# 提示词倒排索引（FTS5），通过触发器随 units 表自动增量更新
+PROMPT_INDEX_SCHEMA = """
+CREATE VIRTUAL TABLE prompt_index USING fts5(tags, words, tokenize="unicode61 tokenchars '_'");
+CREATE TRIGGER units_prompt_insert AFTER INSERT ON units BEGIN
+    INSERT INTO prompt_index (rowid, tags, words) VALUES (new.rowid, prompt_tags(new.value), prompt_words(new.value));
+END;
+CREATE TRIGGER units_prompt_delete AFTER DELETE ON units BEGIN
+    DELETE FROM prompt_index WHERE rowid = old.rowid;
+END;
+CREATE TRIGGER units_prompt_update AFTER UPDATE OF value ON units BEGIN
+    UPDATE prompt_index SET tags = prompt_tags(new.value), words = prompt_words(new.value) WHERE rowid = new.rowid;
+END;
+INSERT INTO prompt_index (rowid, tags, words) SELECT rowid, prompt_tags(value), prompt_words(value) FROM units;
+"""
+
+# 名称三元组索引（单元名 kind=0，文件夹名 kind=1），用于容错的模糊搜索，同样由触发器维护
+NAME_INDEX_SCHEMA = """
+CREATE TABLE name_grams (
+    gram TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (gram, kind, id)
+) WITHOUT ROWID;
+CREATE TRIGGER units_name_insert AFTER INSERT ON units BEGIN
+    INSERT OR IGNORE INTO name_grams SELECT value, 0, new.rowid FROM json_each(name_trigrams(new.name));
+END;
+CREATE TRIGGER units_name_delete AFTER DELETE ON units BEGIN
+    DELETE FROM name_grams WHERE kind = 0 AND id = old.rowid
+        AND gram IN (SELECT value FROM json_each(name_trigrams(old.name)));
+END;
+CREATE TRIGGER units_name_update AFTER UPDATE OF name ON units BEGIN
+    DELETE FROM name_grams WHERE kind = 0 AND id = old.rowid
+        AND gram IN (SELECT value FROM json_each(name_trigrams(old.name)));
+    INSERT OR IGNORE INTO name_grams SELECT value, 0, new.rowid FROM json_each(name_trigrams(new.name));
+END;
+CREATE TRIGGER folders_name_insert AFTER INSERT ON folders WHEN new.parent IS NOT NULL BEGIN
+    INSERT OR IGNORE INTO name_grams SELECT value, 1, new.rowid FROM json_each(name_trigrams(new.name));
+END;
+CREATE TRIGGER folders_name_delete AFTER DELETE ON folders BEGIN
+    DELETE FROM name_grams WHERE kind = 1 AND id = old.rowid
+        AND gram IN (SELECT value FROM json_each(name_trigrams(old.name)));
+END;
+CREATE TRIGGER folders_name_update AFTER UPDATE OF name ON folders BEGIN
+    DELETE FROM name_grams WHERE kind = 1 AND id = old.rowid
+        AND gram IN (SELECT value FROM json_each(name_trigrams(old.name)));
+    INSERT OR IGNORE INTO name_grams SELECT value, 1, new.rowid FROM json_each(name_trigrams(new.name))
+        WHERE new.parent IS NOT NULL;
+END;
+INSERT OR IGNORE INTO name_grams SELECT g.value, 0, u.rowid FROM units u, json_each(name_trigrams(u.name)) g;
+INSERT OR IGNORE INTO name_grams SELECT g.value, 1, f.rowid FROM folders f, json_each(name_trigrams(f.name)) g
+    WHERE f.parent IS NOT NULL;
+"""
+
+# 早期版本建表后新增的列：表名 -> [(列名, 列定义)]，初始化时补齐
+ADDED_COLUMNS = {
+    'thumbnails': [('served', 'REAL NOT NULL DEFAULT 0')],
+    'units': [('natural_name', "TEXT NOT NULL DEFAULT ''"), ('width', 'INTEGER'), ('height', 'INTEGER')],
+}
+
+# 单元排序方式：名称 -> 排序表达式，每种方式在 (folder, 表达式, path) 上建有索引，深翻页也只走索引
+UNIT_ORDERS = {
+    'name': 'path',
+    'natural': 'natural_name',
+    'date': 'modified',
+    'size': 'size',
+    'dimensions': 'width * height',
+    'prompt': 'length(value)',
+}
+DEFAULT_UNIT_ORDER = 'name-asc'
+
+# 排序索引（依赖新增列，在补齐列之后创建）：按文件夹的索引用于单个文件夹，全局索引用于整个子树（按名称排序直接走主键）
+ORDER_INDEX_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_units_folder_natural ON units(folder, natural_name, path);
+CREATE INDEX IF NOT EXISTS idx_units_folder_date ON units(folder, modified, path);
+CREATE INDEX IF NOT EXISTS idx_units_folder_size ON units(folder, size, path);
+CREATE INDEX IF NOT EXISTS idx_units_folder_dimensions ON units(folder, width * height, path);
+CREATE INDEX IF NOT EXISTS idx_units_folder_prompt ON units(folder, length(value), path);
+CREATE INDEX IF NOT EXISTS idx_units_natural ON units(natural_name, path);
+CREATE INDEX IF NOT EXISTS idx_units_size ON units(size, path);
+CREATE INDEX IF NOT EXISTS idx_units_dimensions ON units(width * height, path);
+CREATE INDEX IF NOT EXISTS idx_units_prompt ON units(length(value), path);
+"""
+
+UNIT_COLUMNS = ('path', 'folder', 'name', 'ext', 'value', 'modified', 'size', 'txt_modified', 'txt_size',
+                'natural_name', 'width', 'height')
+
+def get_connection():
+    """获取当前线程的数据库连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(CATALOG_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # INSERT OR REPLACE 隐式删除旧行时也要触发索引维护触发器
+        conn.execute('PRAGMA recursive_triggers=ON')
+        conn.create_function('prompt_tags', 1, prompt_tag_tokens, deterministic=True)
+        conn.create_function('prompt_words', 1, prompt_word_text, deterministic=True)
+        conn.create_function('name_trigrams', 1, name_trigrams_json, deterministic=True)
+        _local.conn = conn
+    return conn
+
+def init_catalog():
+    """初始化索引表结构"""
+    conn = get_connection()
+    with _write_lock:
+        conn.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    if table == 'units':
+                        # 已有单元缺少新字段：清空目录 mtime，下次对账重新列出所有目录并补齐
+                        conn.execute("UPDATE folders SET modified = 0")
+        conn.executescript(ORDER_INDEX_SCHEMA)
+        conn.commit()
+        # 附加索引首次创建时从现有数据回填，当前 SQLite 不支持时跳过对应功能
+        optional_indexes = (
+            ('prompt_index', PROMPT_INDEX_SCHEMA, '当前 SQLite 不支持 FTS5，提示词内容搜索不可用'),
+            ('name_grams', NAME_INDEX_SCHEMA, '当前 SQLite 不支持 JSON1，名称模糊搜索不可用'),
+        )
+        for name, schema, message in optional_indexes:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+            if exists:
+                continue
+            try:
+                conn.executescript(f"BEGIN;{schema}COMMIT;")
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                print(f"{message}: {e}")
+
+def has_prompt_index():
+    """提示词倒排索引是否可用"""
+    row = get_connection().execute("SELECT 1 FROM sqlite_master WHERE name = 'prompt_index'").fetchone()
+    return row is not None
+
+def has_name_index():
+    """名称三元组索引是否可用"""
+    row = get_connection().execute("SELECT 1 FROM sqlite_master WHERE name = 'name_grams'").fetchone()
+    return row is not None
+
+def normalize_path(path):
+    """规范化相对路径（统一使用 / 分隔，去掉首尾 /）"""
+    return (path or '').replace('\\', '/').strip('/')
+
+def parent_of(path):
+    """获取相对路径的父目录"""
+    return path.rsplit('/', 1)[0] if '/' in path else ''
+
+def folder_record(rel_path):
+    """读取文件夹的索引记录"""
+    full_path = os.path.join(IMAGE_DIR, rel_path) if rel_path else IMAGE_DIR
+    try:
+        modified = os.path.getmtime(full_path)
+    except OSError:
+        modified = 0
+    return {
+        'path': rel_path,
+        'parent': parent_of(rel_path) if rel_path else None,
+        'name': rel_path.rsplit('/', 1)[-1],
+        'modified': modified
+    }
+
+def row_to_file(row):
+    """将索引行转换为前端使用的文件结构"""
+    return {
+        'name': row['name'],
+        'path': row['path'],
+        'value': row['value'],
+        'modified': row['modified'],
+        'version': source_version(row['modified'], row['size'])
+    }
+
+def _insert_units(conn, units):
+    conn.executemany(
+        f"INSERT OR REPLACE INTO units ({', '.join(UNIT_COLUMNS)}) VALUES ({', '.join('?' * len(UNIT_COLUMNS))})",
+        [tuple(unit[column] for column in UNIT_COLUMNS) for unit in units]
+    )
+
+def _insert_folders(conn, folders):
+    conn.executemany(
+        "INSERT OR REPLACE INTO folders (path, parent, name, modified) VALUES (?, ?, ?, ?)",
+        [(f['path'], f['parent'], f['name'], f['modified']) for f in folders]
+    )
+
+def add_listener(callback):
+    """注册索引变化监听器
+
+    callback(changed, removed, folders)：新增或变化的单元路径、移除的单元路径、子目录列表发生变化的文件夹
+    """
+    _listeners.append(callback)
+
+def _notify(changed=(), removed=(), folders=()):
+    if not (changed or removed or folders):
+        return
+    for callback in list(_listeners):
+        try:
+            callback(list(changed), list(removed), list(folders))
+        except Exception as e:
+            print(f"索引监听器处理失败: {e}")
+
+def _diff_directory(conn, rel_dir, full_dir):
+    """列出单个目录并与索引比较，返回 (变化的单元, 移除的单元路径, 子目录相对路径列表, 未变化的单元数)"""
+    known = {row['path']: row for row in conn.execute("SELECT * FROM units WHERE folder = ?", (rel_dir,))}
+    units, subdirs = scan_directory(full_dir, known)
+    current = set()
+    changed = []
+    for unit in units:
+        current.add(unit['path'])
+        if not same_unit_stats(unit, known.get(unit['path'])):
+            changed.append(unit)
+    removed = list(known.keys() - current)
+    subdirs = [f"{rel_dir}/{name}" if rel_dir else name for name in subdirs]
+    return changed, removed, subdirs, len(units) - len(changed)
+
+def reconcile_catalog(full=False, root='', quiet=False):
+    """增量对账：根据目录 mtime 只重新列出变化的目录，只重新读取 mtime 或大小变化的文件
+
+    目录 mtime 只在增删改名时变化，原地修改的txt需要 full=True 才能发现（此时列出全部目录，
+    但未变化的文件仍然不会重新读取）。root 可限定只对某个子树对账，quiet 时不打印无变化的结果。
+    返回扫描、变化和跳过的计数。
+    """
+    started = time.time()
+    root = normalize_path(root)
+    conn = get_connection()
+    if root:
+        rows = conn.execute(
+            f"SELECT path, modified FROM folders WHERE {_subtree_clause('path')}", _subtree_params(root)
+        )
+    else:
+        rows = conn.execute("SELECT path, modified FROM folders")
+    stored_folders = {row['path']: row['modified'] for row in rows}
+    children = {}
+    for path in stored_folders:
+        if path:
+            children.setdefault(parent_of(path), []).append(path)
+
+    stats = {
+        'scanned_dirs': 0,   # stat 过的目录
+        'listed_dirs': 0,    # 重新列出的目录
+        'scanned_files': 0,  # 列出目录中遇到的单元
+        'changed': 0,        # 新增或变化而重新读取的单元
+        'skipped': 0,        # 未变化而跳过读取的单元
+        'removed': 0         # 已不存在而移除的单元
+    }
+    seen = set()
+    changed_folders = set()
+    pending_folders = []
+    pending_units = []
+    pending_removed = []
+
+    def flush():
+        if not (pending_folders or pending_units or pending_removed):
+            return
+        with _write_lock:
+            with conn:
+                conn.executemany("DELETE FROM units WHERE path = ?", [(p,) for p in pending_removed])
+                _insert_units(conn, pending_units)
+                _insert_folders(conn, pending_folders)
+        _notify([u['path'] for u in pending_units], pending_removed, changed_folders)
+        pending_folders.clear()
+        pending_units.clear()
+        pending_removed.clear()
+        changed_folders.clear()
+
+    def keep_subtree(rel_dir):
+        # 目录暂时无法访问（权限、文件被占用、网络共享中断等）：保留索引中的整个子树，不当作已删除
+        pending = [rel_dir]
+        while pending:
+            path = pending.pop()
+            seen.add(path)
+            pending.extend(children.get(path, []))
+
+    stack = [root]
+    while stack:
+        rel_dir = stack.pop()
+        full_dir = os.path.join(IMAGE_DIR, rel_dir) if rel_dir else IMAGE_DIR
+        try:
+            dir_stat = os.stat(full_dir)
+        except FileNotFoundError:
+            # 确认已不存在的目录留给下面统一移除；对账起点缺失时（如网络共享未挂载）保留原有索引
+            if rel_dir == root:
+                keep_subtree(rel_dir)
+            continue
+        except OSError as e:
+            print(f"无法访问目录: {full_dir}, 错误: {e}")
+            keep_subtree(rel_dir)
+            continue
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            continue
+        stats['scanned_dirs'] += 1
+        seen.add(rel_dir)
+
+        # 目录 mtime 未变：内容列表未变，沿用已知的子目录
+        if not full and stored_folders.get(rel_dir) == dir_stat.st_mtime:
+            stack.extend(children.get(rel_dir, []))
+            continue
+
+        stats['listed_dirs'] += 1
+        try:
+            changed, removed, subdirs, skipped = _diff_directory(conn, rel_dir, full_dir)
+        except PermissionError:
+            print(f"无权限访问目录: {full_dir}")
+            keep_subtree(rel_dir)
+            continue
+        except Exception as e:
+            print(f"读取目录文件时出错: {full_dir}, 错误: {e}")
+            keep_subtree(rel_dir)
+            continue
+
+        stats['scanned_files'] += len(changed) + skipped
+        stats['changed'] += len(changed)
+        stats['skipped'] += skipped
+        stats['removed'] += len(removed)
+        pending_units.extend(changed)
+        pending_removed.extend(removed)
+        # 新文件夹或 mtime 变化会影响父级的子目录列表（含按时间排序），子目录增减影响自身
+        if stored_folders.get(rel_dir) != dir_stat.st_mtime:
+            changed_folders.add(parent_of(rel_dir))
+        if rel_dir in stored_folders and set(subdirs) != set(children.get(rel_dir, [])):
+            changed_folders.add(rel_dir)
+
+        # 记录列出前的 mtime，列出期间发生的变化留给下次对账
+        record = folder_record(rel_dir)
+        record['modified'] = dir_stat.st_mtime
+        pending_folders.append(record)
+        stack.extend(subdirs)
+
+        if len(pending_folders) >= 200:
+            flush()
+    flush()
+
+    # 确认已经不存在的文件夹连同其单元一并移除（无法列出的目录及其子树已计入 seen）
+    vanished = [path for path in stored_folders if path not in seen]
+    if vanished:
+        removed = []
+        with _write_lock:
+            with conn:
+                for path in vanished:
+                    removed.extend(row[0] for row in conn.execute("SELECT path FROM units WHERE folder = ?", (path,)))
+                    conn.execute("DELETE FROM units WHERE folder = ?", (path,))
+                    conn.execute("DELETE FROM folders WHERE path = ?", (path,))
+        stats['removed'] += len(removed)
+        _notify(removed=removed, folders={parent_of(path) for path in vanished})
+
+    stats['elapsed'] = round(time.time() - started, 3)
+    if not root:
+        if not quiet or stats['listed_dirs']:
+            print(f"单元索引对账完成: 扫描目录 {stats['scanned_dirs']}，重新列出 {stats['listed_dirs']}，"
+                  f"变化 {stats['changed']}，跳过 {stats['skipped']}，移除 {stats['removed']}，用时 {stats['elapsed']}s")
+        last_reconcile.clear()
+        last_reconcile.update(stats, finished=time.time())
+    return stats
+
+def refresh_directory(rel_dir):
+    """重新列出单个目录并同步：单元按 mtime/大小增量更新，新出现的子目录整体收录，消失的子目录整体移除"""
+    rel_dir = normalize_path(rel_dir)
+    full_dir = os.path.join(IMAGE_DIR, rel_dir) if rel_dir else IMAGE_DIR
+    if not os.path.isdir(full_dir):
+        remove_folder(rel_dir)
+        return
+    conn = get_connection()
+    try:
+        dir_stat = os.stat(full_dir)
+        changed, removed, subdirs, _ = _diff_directory(conn, rel_dir, full_dir)
+    except OSError as e:
+        print(f"读取目录文件时出错: {full_dir}, 错误: {e}")
+        return
+    known_subdirs = {row[0] for row in conn.execute("SELECT path FROM folders WHERE parent = ?", (rel_dir,))}
+    stored = conn.execute("SELECT modified FROM folders WHERE path = ?", (rel_dir,)).fetchone()
+    record = folder_record(rel_dir)
+    record['modified'] = dir_stat.st_mtime
+    with _write_lock:
+        with conn:
+            conn.executemany("DELETE FROM units WHERE path = ?", [(p,) for p in removed])
+            _insert_units(conn, changed)
+            _insert_folders(conn, [record])
+            _ensure_ancestors(conn, rel_dir)
+    folders = []
+    if stored is None or stored[0] != dir_stat.st_mtime:
+        folders.append(parent_of(rel_dir))
+    if known_subdirs != set(subdirs):
+        folders.append(rel_dir)
+    _notify([u['path'] for u in changed], removed, folders)
+
+    for path in known_subdirs - set(subdirs):
+        remove_folder(path)
+    for path in set(subdirs) - known_subdirs:
+        reconcile_catalog(root=path)
+
+def refresh_unit(rel_path):
+    """根据文件系统当前状态更新单个单元"""
+    rel_path = normalize_path(rel_path)
+    folder = parent_of(rel_path)
+    full_dir = os.path.join(IMAGE_DIR, folder) if folder else IMAGE_DIR
+    unit = scan_single_unit(full_dir, rel_path.rsplit('/', 1)[-1])
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            conn.execute("DELETE FROM units WHERE path = ?", (rel_path,))
+            if unit:
+                _insert_units(conn, [unit])
+    if unit:
+        _notify(changed=[rel_path])
+    else:
+        _notify(removed=[rel_path])
+
+def remove_unit(rel_path):
+    """从索引中删除单元"""
+    rel_path = normalize_path(rel_path)
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            conn.execute("DELETE FROM units WHERE path = ?", (rel_path,))
+    _notify(removed=[rel_path])
+
+def _subtree_clause(column):
+    # '/' 的下一个字符是 '0'，用范围查询命中整个子树并利用索引
+    return f"({column} = ? OR ({column} >= ? AND {column} < ?))"
+
+def _subtree_params(rel_path):
+    return (rel_path, rel_path + '/', rel_path + '0')
+
+def _ensure_ancestors(conn, rel_path):
+    # 缺失的父级记为 mtime=0，下次对账时会被重新列出
+    current = parent_of(rel_path) if rel_path else None
+    while current is not None:
+        conn.execute(
+            "INSERT OR IGNORE INTO folders (path, parent, name, modified) VALUES (?, ?, ?, 0)",
+            (current, parent_of(current) if current else None, current.rsplit('/', 1)[-1])
+        )
+        current = parent_of(current) if current else None
+
+def add_folder(rel_path):
+    """登记新建的文件夹"""
+    rel_path = normalize_path(rel_path)
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            _insert_folders(conn, [folder_record(rel_path)])
+            _ensure_ancestors(conn, rel_path)
+    _notify(folders=[parent_of(rel_path)])
+
+def remove_folder(rel_path):
+    """删除文件夹及其子树下的所有索引记录"""
+    rel_path = normalize_path(rel_path)
+    if not rel_path:
+        return
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            removed = [row[0] for row in conn.execute(
+                f"SELECT path FROM units WHERE {_subtree_clause('folder')}", _subtree_params(rel_path)
+            )]
+            conn.execute(f"DELETE FROM units WHERE {_subtree_clause('folder')}", _subtree_params(rel_path))
+            conn.execute(f"DELETE FROM folders WHERE {_subtree_clause('path')}", _subtree_params(rel_path))
+    _notify(removed=removed, folders=[parent_of(rel_path)])
+
+def rename_folder(old_path, new_path):
+    """重命名文件夹，批量改写子树中的路径前缀"""
+    old_path = normalize_path(old_path)
+    new_path = normalize_path(new_path)
+    old_len = len(old_path)
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            removed = [row[0] for row in conn.execute(
+                f"SELECT path FROM units WHERE {_subtree_clause('folder')}", _subtree_params(old_path)
+            )]
+            conn.execute(
+                f"UPDATE units SET path = ? || substr(path, ?), folder = ? || substr(folder, ?) "
+                f"WHERE {_subtree_clause('folder')}",
+                (new_path, old_len + 1, new_path, old_len + 1) + _subtree_params(old_path)
+            )
+            conn.execute(
+                f"UPDATE folders SET path = ? || substr(path, ?), parent = ? || substr(parent, ?) "
+                f"WHERE {_subtree_clause('path')} AND path != ?",
+                (new_path, old_len + 1, new_path, old_len + 1) + _subtree_params(old_path) + (old_path,)
+            )
+            conn.execute("DELETE FROM folders WHERE path = ?", (old_path,))
+            _insert_folders(conn, [folder_record(new_path)])
+            _ensure_ancestors(conn, new_path)
+    changed = [new_path + path[old_len:] for path in removed]
+    _notify(changed, removed, [parent_of(old_path), parent_of(new_path)])
+
+def record_thumbnail(key, rel_path, profile, source_modified, source_size, size):
+    """登记缩略图，返回同一单元同一规格下被取代的旧缩略图键"""
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            superseded = [row[0] for row in conn.execute(
+                "SELECT key FROM thumbnails WHERE path = ? AND profile = ? AND key != ?", (rel_path, profile, key)
+            )]
+            conn.execute("DELETE FROM thumbnails WHERE path = ? AND profile = ? AND key != ?", (rel_path, profile, key))
+            conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (key, path, profile, source_modified, source_size, bytes, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, rel_path, profile, source_modified, source_size, size, time.time())
+            )
+    return superseded
+
+def list_thumbnails(rel_path):
+    """列出单元（或文件夹子树内所有单元）已登记的缩略图"""
+    rel_path = normalize_path(rel_path)
+    rows = get_connection().execute(
+        f"SELECT * FROM thumbnails WHERE {_subtree_clause('path')}", _subtree_params(rel_path)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def rekey_thumbnails(moves):
+    """单元路径变化后改写缩略图登记：moves 为 (旧键, 新键, 新路径) 列表"""
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            conn.executemany("UPDATE thumbnails SET key = ?, path = ? WHERE key = ?",
+                             [(new_key, path, old_key) for old_key, new_key, path in moves])
+
+def pop_thumbnails(paths):
+    """删除单元（或文件夹子树）的缩略图登记，返回被删除的键"""
+    keys = []
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            for rel_path in paths:
+                params = _subtree_params(normalize_path(rel_path))
+                keys.extend(row[0] for row in conn.execute(
+                    f"SELECT key FROM thumbnails WHERE {_subtree_clause('path')}", params
+                ))
+                conn.execute(f"DELETE FROM thumbnails WHERE {_subtree_clause('path')}", params)
+    return keys
+
+def touch_thumbnails(served):
+    """记录缩略图最近被请求的时间：served 为 键 -> 时间"""
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            conn.executemany("UPDATE thumbnails SET served = ? WHERE key = ?",
+                             [(when, key) for key, when in served.items()])
+
+def get_thumbnail_totals():
+    """已登记缩略图的数量与总字节数"""
+    row = get_connection().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM thumbnails").fetchone()
+    return row[0], row[1]
+
+def list_thumbnail_records():
+    """列出所有缩略图登记（键、字节数、规格标识），以及原图是否已不存在、是否已变化"""
+    rows = get_connection().execute(
+        "SELECT t.key, t.bytes, t.profile, u.path IS NULL AS gone, "
+        "u.path IS NOT NULL AND (u.modified != t.source_modified OR u.size != t.source_size) AS outdated "
+        "FROM thumbnails t LEFT JOIN units u ON u.path = t.path"
+    )
+    return [dict(row) for row in rows]
+
+def iter_thumbnails_by_use():
+    """按最近使用时间从旧到新列出缩略图 (键, 字节数)，从未被请求的按生成时间计"""
+    return get_connection().execute(
+        "SELECT key, bytes FROM thumbnails ORDER BY MAX(served, created), key"
+    )
+
+def delete_thumbnail_records(keys):
+    """删除缩略图登记"""
+    conn = get_connection()
+    with _write_lock:
+        with conn:
+            conn.executemany("DELETE FROM thumbnails WHERE key = ?", [(key,) for key in keys])
+
+def _table_disk_bytes(conn, pattern):
+    """表（含索引、FTS5 影子表）在数据库文件中占用的字节数，SQLite 未启用 dbstat 时返回 None"""
+    try:
+        row = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE ?", (pattern,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] or 0
+
+def get_index_sizes():
+    """附加索引的规模：行数、磁盘占用，以及每个连接的 SQLite 页缓存上限（索引不额外常驻内存）"""
+    conn = get_connection()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    # cache_size 为负数时单位是 KiB，否则是页数
+    cache_bytes = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+    sizes = {'cache_limit_bytes': cache_bytes}
+    if has_prompt_index():
+        sizes['prompt_index'] = {
+            'rows': conn.execute("SELECT COUNT(*) FROM prompt_index").fetchone()[0],
+            'disk_bytes': _table_disk_bytes(conn, 'prompt_index%')
+        }
+    if has_name_index():
+        sizes['name_grams'] = {
+            'rows': conn.execute("SELECT COUNT(*) FROM name_grams").fetchone()[0],
+            'disk_bytes': _table_disk_bytes(conn, 'name_grams')
+        }
+    return sizes
+
+def get_status():
+    """索引规模与最近一次对账信息"""
+    conn = get_connection()
+    return {
+        'units': conn.execute("SELECT COUNT(*) FROM units").fetchone()[0],
+        'folders': conn.execute("SELECT COUNT(*) FROM folders").fetchone()[0],
+        'indexes': get_index_sizes(),
+        'last_reconcile': dict(last_reconcile)
+    }
+
+def get_unit(rel_path):
+    """查询单个单元"""
+    row = get_connection().execute(
+        "SELECT * FROM units WHERE path = ?", (normalize_path(rel_path),)
+    ).fetchone()
+    return row_to_file(row) if row else None
+
+def _folder_filter(folder, recursive):
+    """文件夹条件：recursive 时按路径范围命中整个子树（根目录为全部单元）"""
+    folder = normalize_path(folder)
+    if not recursive:
+        return "folder = ?", [folder]
+    if not folder:
+        return "1", []
+    return "path >= ? AND path < ?", [folder + '/', folder + '0']
+
+def count_units(folder, recursive=False):
+    """统计文件夹下（recursive 时为整个子树）的单元数量"""
+    sql, params = _folder_filter(folder, recursive)
+    row = get_connection().execute(f"SELECT COUNT(*) FROM units WHERE {sql}", params).fetchone()
+    return row[0]
+
+def count_units_by_folder(folders):
+    """批量统计多个文件夹下的单元数量"""
+    counts = {}
+    conn = get_connection()
+    folders = list(folders)
+    # 分批查询，避免超过 SQLite 参数数量上限
+    for start in range(0, len(folders), 500):
+        batch = folders[start:start + 500]
+        rows = conn.execute(
+            f"SELECT folder, COUNT(*) FROM units WHERE folder IN ({', '.join('?' * len(batch))}) GROUP BY folder",
+            batch
+        )
+        counts.update((row[0], row[1]) for row in rows)
+    return counts
+
+def parse_unit_order(order):
+    """解析排序参数（如 date-desc），返回 (排序表达式, ASC/DESC)，无效时抛出 ValueError"""
+    key, _, direction = (order or DEFAULT_UNIT_ORDER).partition('-')
+    direction = direction or 'asc'
+    if key not in UNIT_ORDERS or direction not in ('asc', 'desc'):
+        raise ValueError(f"无效的排序方式: {order}")
+    return UNIT_ORDERS[key], direction.upper()
+
+def encode_unit_cursor(order, row):
+    """根据一页最后一个单元生成翻页游标（不透明字符串，记录排序方式、排序值和路径）"""
+    raw = json.dumps([order, row['sort_key'], row['path']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_unit_cursor(cursor, order):
+    """解析翻页游标，返回 (排序值, 路径)；游标无效或与 order 排序方式不一致时抛出 ValueError"""
+    try:
+        cursor_order, value, path = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError(f"无效的游标: {cursor}")
+    # 排序值只可能是数字、字符串或 NULL，其他类型无法作为查询参数
+    if (not isinstance(path, str) or isinstance(value, bool)
+            or (value is not None and not isinstance(value, (int, float, str)))):
+        raise ValueError(f"无效的游标: {cursor}")
+    if not isinstance(cursor_order, str) or parse_unit_order(cursor_order) != parse_unit_order(order):
+        raise ValueError(f"游标与排序方式不一致: {cursor}")
+    return value, path
+
+def unit_order_clause(order, after=None):
+    """生成单元排序的 SQL 片段，返回 (排序表达式, 游标条件, 条件参数, ORDER BY 子句)
+
+    after 为 (排序值, 路径) 时游标条件只保留该单元之后的行，否则条件为 None
+    """
+    expression, direction = parse_unit_order(order)
+    columns = ['path'] if expression == 'path' else [expression, 'path']
+    condition = None
+    params = []
+    if after is not None:
+        # 沿排序索引从游标位置继续，不需要跳过前面的行；期间增删的单元不会让后续页错位
+        comparison = '>' if direction == 'ASC' else '<'
+        if expression == 'path':
+            condition = f"path {comparison} ?"
+            params.append(after[1])
+        else:
+            # 单独的范围条件让表达式索引（如 width * height）也能直接定位，行值比较只用于同值的单元
+            condition = f"{expression} {comparison}= ? AND ({expression}, path) {comparison} (?, ?)"
+            params.extend([after[0], after[0], after[1]])
+    order_by = ', '.join(f"{column} {direction}" for column in columns)
+    return expression, condition, params, order_by
+
+def _select_units(folder, offset, limit, order, after, recursive=False):
+    """按排序方式查询文件夹下（recursive 时为整个子树）的单元行（附带排序值 sort_key），
+    after 为 (排序值, 路径) 时从该单元之后继续
+    """
+    expression, condition, order_params, order_by = unit_order_clause(order, after)
+    sql, params = _folder_filter(folder, recursive)
+    if condition:
+        sql += f" AND {condition}"
+        params.extend(order_params)
+    return get_connection().execute(
+        f"SELECT *, {expression} AS sort_key FROM units WHERE {sql} ORDER BY {order_by} LIMIT ? OFFSET ?",
+        params + [-1 if limit is None else limit, offset]
+    ).fetchall()
+
+def list_units(folder, offset=0, limit=None, order=DEFAULT_UNIT_ORDER, after=None, recursive=False):
+    """分页列出文件夹下的单元（order 为排序方式，见 UNIT_ORDERS，同值按路径排序；after 为解析后的游标；
+    recursive 时列出整个子树）
+    """
+    return [row_to_file(row) for row in _select_units(folder, offset, limit, order, after, recursive)]
+
+def page_units(folder, limit, order=DEFAULT_UNIT_ORDER, offset=0, after=None, recursive=False):
+    """列出一页单元，返回 (单元列表, 下一页游标)，没有下一页时游标为 None"""
+    rows = _select_units(folder, offset, limit + 1, order, after, recursive)
+    next_cursor = encode_unit_cursor(order, rows[limit - 1]) if len(rows) > limit else None
+    return [row_to_file(row) for row in rows[:limit]], next_cursor
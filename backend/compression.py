@@ -0,0 +1,47 @@
+# 响应压缩模块
+# 较大的文本类响应（JSON、MessagePack 等）按 Accept-Encoding 压缩：优先 brotli（需安装 brotli 包），否则 gzip
+import gzip
+from flask import request
+from .config import COMPRESSION_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 参与压缩的响应类型（图片和缩略图包本身已经压缩过，不再处理）
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/msgpack', 'text/html', 'text/css',
+                          'application/javascript', 'text/javascript'}
+# 压缩级别：列表响应每次请求都要压缩，取速度与压缩率的折中
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def choose_encoding():
+    """按 Accept-Encoding 选择压缩方式，客户端不接受压缩时返回 None"""
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    """after_request 钩子：压缩较大的文本类响应；压缩后 ETag 改为弱校验值（同一内容的不同编码）"""
+    if (not COMPRESSION_MIN_SIZE or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = choose_encoding() if len(data) >= COMPRESSION_MIN_SIZE else None
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
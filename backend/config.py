@@ -8,8 +8,43 @@ VERSION = "v0.1"
 # 配置
 IMAGE_DIR = 'images'
 THUMBNAIL_DIR = 'thumbnails'
+CATALOG_DB = 'catalog.db'  # 单元索引数据库
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
 
+# 缩略图规格：名称 -> 最大尺寸、输出格式、质量与两步缩小的余量倍数（规格参与缓存键，修改后自动重新生成）
+# reducing_gap 越小越快、越大越接近全程 LANCZOS，None 表示不做快速的第一步缩小
+# srcset 为 True 的规格出现在列表的 srcset 候选中，prerender 为 True 的规格在启动时为所有单元预生成
+THUMBNAIL_PROFILES = {
+    'grid': {'size': (220, 264), 'format': 'JPEG', 'quality': 85, 'reducing_gap': 2.0,
+             'srcset': True, 'prerender': True},
+    'grid2x': {'size': (440, 528), 'format': 'JPEG', 'quality': 80, 'reducing_gap': 2.0, 'srcset': True},
+    'preview': {'size': (1280, 1280), 'format': 'JPEG', 'quality': 88, 'reducing_gap': 3.0},
+}
+THUMBNAIL_DEFAULT_PROFILE = 'grid'
+# 按 Accept 请求头协商的缩略图格式及编码参数（按优先级排列，当前 Pillow 不支持的格式自动跳过），
+# 不接受这些格式的客户端使用规格自身的格式；每种格式的缩略图分别缓存
+THUMBNAIL_ACCEPT_FORMATS = {
+    'AVIF': {'quality': 60, 'speed': 8},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+# 启动时和单元变化时为所有单元预生成的格式（None 表示规格自身的格式，其余须在 THUMBNAIL_ACCEPT_FORMATS 中），
+# 未列出的格式在首次请求时按需生成；AVIF 编码约为 JPEG 的百倍耗时，默认不预生成
+THUMBNAIL_PRERENDER_FORMATS = [None, 'WEBP']
+THUMBNAIL_WORKERS = 0  # 缩略图生成进程数，0 表示使用全部 CPU 核心
+THUMBNAIL_BATCH_CACHE_PAGES = 16  # 内存中缓存的缩略图包（按文件夹分页打包）数量
+THUMBNAIL_MEMORY_CACHE_MB = 64  # 常用缩略图在内存中缓存的容量（MB），0 表示不缓存
+THUMBNAIL_BUDGET_MB = 0  # 缩略图存储的容量上限（MB），超出时淘汰最久未被请求的缩略图，0 表示不限制
+THUMBNAIL_BACKOFF = 0.5  # 按需生成缩略图的请求结束后，后台生成任务继续让出进程池的时间（秒）
+
+# 超过该大小（字节）的 JSON 等文本响应按 Accept-Encoding 压缩（安装 brotli 包后优先使用 brotli），0 表示不压缩
+COMPRESSION_MIN_SIZE = 1024
+
+# 文件系统监听：auto（优先 inotify，不可用时轮询）/ inotify / polling / off
+WATCHER_BACKEND = 'auto'
+WATCHER_POLL_INTERVAL = 5  # 轮询间隔（秒）
+WATCHER_FULL_INTERVAL = 60  # 轮询模式下完整对账的间隔（秒），用于发现原地修改的txt（不改变目录 mtime），0 表示不做
+WATCHER_DEBOUNCE = 0.5     # 事件合并窗口（秒）
+
 # 确保目录存在
 os.makedirs(IMAGE_DIR, exist_ok=True)
 os.makedirs(THUMBNAIL_DIR, exist_ok=True)
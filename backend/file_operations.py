@@ -1,27 +1,32 @@
 # 文件操作模块
 import os
 import base64
-from .config import IMAGE_DIR, THUMBNAIL_DIR, file_lock
-from .utils import get_safe_filename, create_thumbnail
+from .config import IMAGE_DIR, file_lock
+from .utils import get_safe_filename, create_thumbnail, read_prompt
+from .thumbnails import rename_thumbnails
+from . import catalog
 
 def get_unit_details(path):
     """获取单个单元详情"""
+    # 优先从单元索引读取
+    unit = catalog.get_unit(path)
+    if unit:
+        return {
+            'name': unit['name'],
+            'path': path,
+            'value': unit['value'],
+            'version': unit['version']
+        }
+    
     full_path = os.path.join(IMAGE_DIR, path)
     
     if not os.path.exists(full_path):
         return None
     
-    # 获取文件名和txt内容
+    # 索引中尚未收录时回退到文件系统
     name = os.path.splitext(os.path.basename(path))[0]
     txt_path = os.path.join(os.path.dirname(full_path), f"{name}.txt")
-    txt_content = ""
-    
-    if os.path.exists(txt_path):
-        try:
-            with open(txt_path, 'r', encoding='utf-8') as f:
-                txt_content = f.read().strip()
-        except Exception as e:
-            print(f"读取txt文件失败: {e}")
+    txt_content = read_prompt(txt_path)
     
     return {
         'name': name,
@@ -29,6 +34,19 @@ def get_unit_details(path):
         'value': txt_content
     }
 
+def renamed_path(old_path, new_name, ext):
+    """单元改名后的相对路径"""
+    folder = catalog.parent_of(catalog.normalize_path(old_path))
+    return f"{folder}/{new_name}{ext}" if folder else f"{new_name}{ext}"
+
+def sync_renamed_unit(old_path, new_name, ext):
+    """单元更新后同步索引（名称可能已改变）"""
+    old_path = catalog.normalize_path(old_path)
+    new_path = renamed_path(old_path, new_name, ext)
+    if new_path != old_path:
+        catalog.remove_unit(old_path)
+    catalog.refresh_unit(new_path)
+
 def create_unit(path, name, value, image_data):
     """创建新单元"""
     # 确定保存目录
@@ -62,6 +80,11 @@ def create_unit(path, name, value, image_data):
                 os.remove(image_path)
             return {'error': f'文本文件保存失败: {str(e)}'}, 500
     
+    # 同步单元索引
+    if path:
+        catalog.add_folder(path)
+    catalog.refresh_unit(f"{path}/{name}.png" if path else f"{name}.png")
+    
     return {'message': '单元创建成功'}, 201
 
 def update_unit_with_image(old_path, new_name, new_value, new_image_data=None):
@@ -97,14 +120,9 @@ def update_unit_with_image(old_path, new_name, new_value, new_image_data=None):
                 except Exception as e:
                     return {'error': f'新图片保存失败: {str(e)}'}, 500
                 
-                # 如果文件名改变了，删除旧文件
+                # 如果文件名改变了，删除旧文件（旧缩略图随索引同步一并删除）
                 if new_name != old_name and os.path.exists(old_full_path):
                     os.remove(old_full_path)
-                
-                # 删除旧缩略图
-                old_thumbnail = os.path.join(THUMBNAIL_DIR, old_path.replace(ext, '.jpg'))
-                if os.path.exists(old_thumbnail):
-                    os.remove(old_thumbnail)
             else:
                 # 重命名文件（仅当名称改变时）
                 if new_name != old_name:
@@ -114,10 +132,8 @@ def update_unit_with_image(old_path, new_name, new_value, new_image_data=None):
                     if os.path.exists(old_txt_path):
                         os.rename(old_txt_path, new_txt_path)
                     
-                    # 删除旧缩略图
-                    old_thumbnail = os.path.join(THUMBNAIL_DIR, old_path.replace(ext, '.jpg'))
-                    if os.path.exists(old_thumbnail):
-                        os.remove(old_thumbnail)
+                    # 图片内容未变，迁移已有缩略图
+                    rename_thumbnails(old_path, renamed_path(old_path, new_name, ext))
             
             # 更新txt内容
             # 使用新的路径或旧的路径来保存txt文件
@@ -128,6 +144,9 @@ def update_unit_with_image(old_path, new_name, new_value, new_image_data=None):
         except Exception as e:
             return {'error': f'更新失败: {str(e)}'}, 500
     
+    # 同步单元索引
+    sync_renamed_unit(old_path, new_name, ext)
+    
     return {'message': '单元更新成功'}, 200
 
 def delete_unit(path):
@@ -147,12 +166,9 @@ def delete_unit(path):
             txt_path = os.path.join(os.path.dirname(full_path), f"{name}.txt")
             if os.path.exists(txt_path):
                 os.remove(txt_path)
-            
-            # 删除缩略图
-            thumbnail_path = os.path.join(THUMBNAIL_DIR, path.replace(os.path.splitext(path)[1], '.jpg'))
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
         
+        # 从索引中移除，缩略图随之删除
+        catalog.remove_unit(path)
         return {'message': '单元删除成功'}, 200
         
     except Exception as e:
@@ -189,10 +205,8 @@ def update_unit(old_path, new_name, new_value):
                 if os.path.exists(old_txt_path):
                     os.rename(old_txt_path, new_txt_path)
                 
-                # 删除旧缩略图
-                old_thumbnail = os.path.join(THUMBNAIL_DIR, old_path.replace(ext, '.jpg'))
-                if os.path.exists(old_thumbnail):
-                    os.remove(old_thumbnail)
+                # 图片内容未变，迁移已有缩略图
+                rename_thumbnails(old_path, renamed_path(old_path, new_name, ext))
             
             # 更新txt内容
             # 使用新的路径或旧的路径来保存txt文件
@@ -203,4 +217,7 @@ def update_unit(old_path, new_name, new_value):
         except Exception as e:
             return {'error': f'更新失败: {str(e)}'}, 500
     
+    # 同步单元索引
+    sync_renamed_unit(old_path, new_name, ext)
+    
     return {'message': '单元更新成功'}, 200
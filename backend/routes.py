@@ -1,10 +1,28 @@
 # 路录模块
 import os
+import json
 import time
-from flask import jsonify, request, send_from_directory, abort
-from .config import IMAGE_DIR, THUMBNAIL_DIR, file_lock
-from .utils import get_directory_tree, get_files_in_directory, search_all_files, create_thumbnail
+import hashlib
+import itertools
+from stat import S_ISREG
+from flask import jsonify, request, send_from_directory, send_file, abort, Response, stream_with_context
+from .config import IMAGE_DIR, THUMBNAIL_PROFILES
+from .thumbnails import (ensure_thumbnail, rename_thumbnails, get_engine_status, resolve_profile, get_srcset_profiles,
+                         get_accept_formats, negotiate_format, thumbnail_mimetype, pack_thumbnails,
+                         schedule_thumbnails, PRIORITY_VISIBLE, collect_garbage, locate_thumbnail, read_thumbnail,
+                         touch_thumbnails)
+from .search_index import iter_search, search_page, fuzzy_search, DEFAULT_SEARCH_ORDER
 from .file_operations import get_unit_details, create_unit, update_unit, delete_unit, update_unit_with_image
+from .utils import source_version, source_etag, pack_columns
+from . import catalog, tree_cache
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 分页参数允许的最大页码
+MAX_PAGE = 1000000
 
 def register_routes(app):
     """注册所有路由"""
@@ -25,139 +43,359 @@ def register_routes(app):
         src_path = os.path.join(project_root, 'src')
         return send_from_directory(src_path, filename)
     
-    @app.route('/api/data')
-    def api_data():
-        """获取目录树和文件数据（支持分页）"""
-        path = request.args.get('path', '').strip('/')
-        # 获取排序参数
-        sort_type = request.args.get('sort', 'name-asc')
-        # 获取页码和每页数量参数，设置默认值
+    def parse_pagination():
+        """解析分页参数"""
         try:
             page = int(request.args.get('page', 1))
             per_page = int(request.args.get('per_page', 200))  # 修改每页数量从70到200
-            # 限制每页最大数量
-            per_page = min(per_page, 200)  # 修改最大数量限制从100到200
+            # 限制每页最大数量（排序和分页都在索引中完成，大页也不会逐个读取文件）
+            per_page = min(per_page, 1000)
         except ValueError:
             page, per_page = 1, 200  # 修改默认每页数量从70到200
+        # 限制页码上限，避免换算出的 OFFSET 超出 SQLite 整数范围
+        return min(max(page, 1), MAX_PAGE), max(per_page, 1)
+    
+    def parse_thumbnail_variant():
+        """解析缩略图规格（profile 或 w）与输出格式（format 参数，未指定时按 Accept 请求头协商）"""
+        try:
+            width = int(request.args.get('w', 0))
+        except ValueError:
+            abort(400, '无效的宽度')
+        profile = resolve_profile(request.args.get('profile'), width)
+        if profile is None:
+            abort(400, '无效的缩略图规格')
+        image_format = request.args.get('format', '').upper() or None
+        if image_format == 'JPG':
+            image_format = 'JPEG'
+        if image_format is None:
+            # 只认客户端明确列出的图片类型，*/* 不算接受
+            image_format = negotiate_format({value for value, quality in request.accept_mimetypes if quality > 0})
+        elif image_format not in get_accept_formats() + [THUMBNAIL_PROFILES[profile]['format']]:
+            abort(400, '不支持的缩略图格式')
+        return profile, image_format
+    
+    def parse_image_path():
+        """解析 path 参数为 IMAGE_DIR 下的相对路径（/ 分隔），缺失或越出 IMAGE_DIR 时返回 400"""
+        path = request.args.get('path', '')
+        if not path:
+            abort(400, '路径参数必需')
         
-        # 获取目录树（支持排序）
-        tree = get_directory_tree(IMAGE_DIR, sort_type)
+        # URL解码路径参数
+        from urllib.parse import unquote
+        path = unquote(path)
         
-        # 获取当前路径下的文件
-        current_dir = os.path.join(IMAGE_DIR, path) if path else IMAGE_DIR
-        all_files = get_files_in_directory(current_dir)
+        # 规范化路径分隔符，确保在Windows上正确处理
+        path = path.replace('/', os.sep).replace('\\', os.sep)
         
-        # 分页处理
-        total = len(all_files)
-        start = (page - 1) * per_page
-        end = start + per_page
-        files = all_files[start:end]
+        # 规范化完整路径以防止路径遍历攻击
+        full_path = os.path.normpath(os.path.join(IMAGE_DIR, path))
         
-        return jsonify({
+        # 确保请求的文件在IMAGE_DIR目录内（使用相对路径检查）
+        try:
+            rel_path = os.path.relpath(full_path, os.path.abspath(IMAGE_DIR))
+        except ValueError:
+            # 当路径在不同驱动器上时会抛出ValueError
+            abort(400, '无效的路径')
+        # 检查相对路径是否在上级目录中（防止路径遍历）
+        if rel_path.startswith('..') or rel_path == '.':
+            abort(400, '无效的路径')
+        return rel_path.replace(os.sep, '/')
+    
+    def is_not_modified(etag, modified):
+        """条件请求：有 If-None-Match 时只比较 ETag，否则按秒比较 If-Modified-Since"""
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+        since = request.if_modified_since
+        return since is not None and int(modified) <= since.timestamp()
+    
+    def set_image_cache(response, version):
+        """带版本号（v 参数）且与当前版本一致的地址内容不会再变化，缓存一年；其余地址每次使用前按 ETag 确认"""
+        if request.args.get('v') == version:
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+    
+    def parse_prompt_preview():
+        """解析 preview 参数：大于 0 时列表中的提示词只返回前 N 个字符（完整内容通过 /api/unit 获取）"""
+        try:
+            return max(int(request.args.get('preview', 0)), 0)
+        except ValueError:
+            return 0
+    
+    def preview_prompts(files, preview):
+        """按 preview 截断列表中的提示词，被截断的条目标记 truncated"""
+        if preview:
+            for file in files:
+                value = file.get('value')
+                if value and len(value) > preview:
+                    file['value'] = value[:preview]
+                    file['truncated'] = True
+        return files
+    
+    def parse_unit_order(default=catalog.DEFAULT_UNIT_ORDER):
+        """解析单元排序参数 order（排序方式-asc/desc，如 date-desc，见 catalog.UNIT_ORDERS），无效时返回 400"""
+        order = request.args.get('order') or default
+        try:
+            catalog.parse_unit_order(order)
+        except ValueError:
+            abort(400, '无效的排序方式')
+        return order
+    
+    def parse_unit_cursor(order):
+        """解析翻页游标参数 cursor（上一页返回的 next_cursor），无效或与排序方式不一致时返回 400"""
+        cursor = request.args.get('cursor')
+        if not cursor:
+            return None
+        try:
+            return catalog.decode_unit_cursor(cursor, order)
+        except ValueError:
+            abort(400, '无效的游标')
+    
+    def list_response(payload):
+        """返回单元列表响应：compact=1 时 files 改为列式结构（见 utils.pack_columns）；
+        客户端明确接受 application/msgpack 且已安装 msgpack 时以 MessagePack 编码，否则为 JSON
+        """
+        if request.args.get('compact') in ('1', 'true'):
+            payload['files'] = pack_columns(payload['files'])
+        accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+        if msgpack is not None and 'application/msgpack' in accepted:
+            response = Response(msgpack.packb(payload, use_bin_type=True), mimetype='application/msgpack')
+        else:
+            response = jsonify(payload)
+        response.vary.add('Accept')
+        return response
+    
+    def parse_recursive():
+        """解析 recursive 参数：为 1 时列出文件夹整个子树下的单元"""
+        return request.args.get('recursive') in ('1', 'true')
+    
+    def list_files_page(path, page, per_page):
+        """分页查询文件夹下的单元（按 order 参数排序；带 cursor 时从游标位置继续，不再按页码跳过前面的单元；
+        recursive=1 时包含所有子文件夹中的单元）
+        """
+        order = parse_unit_order()
+        after = parse_unit_cursor(order)
+        recursive = parse_recursive()
+        total = catalog.count_units(path, recursive)
+        start = 0 if after else (page - 1) * per_page
+        files, next_cursor = catalog.page_units(path, per_page, order, offset=start, after=after, recursive=recursive)
+        files = preview_prompts(files, parse_prompt_preview())
+        # 正在浏览的页面插队到后台缩略图队列最前面
+        schedule_thumbnails([file['path'] for file in files], PRIORITY_VISIBLE)
+        return files, {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor
+        }
+    
+    @app.route('/api/data')
+    def api_data():
+        """获取目录树和文件数据（支持分页，保留用于兼容）"""
+        path = request.args.get('path', '').strip('/')
+        # 获取排序参数
+        sort_type = request.args.get('sort', 'name-asc')
+        page, per_page = parse_pagination()
+        
+        # 获取目录树（支持排序，内存缓存）
+        tree = tree_cache.get_tree(sort_type)
+        files, pagination = list_files_page(path, page, per_page)
+        
+        return list_response({
             'tree': tree,
             'files': files,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total,
-                'has_more': end < total
-            }
+            'pagination': pagination,
+            'thumbnails': get_srcset_profiles()
+        })
+    
+    @app.route('/api/files')
+    def api_files():
+        """只获取文件夹下的单元（page 或 cursor 分页，order 指定排序，recursive=1 包含子文件夹），不携带目录树；
+        preview=N 时提示词只返回前 N 个字符，compact=1 时单元列表为列式结构
+        """
+        path = request.args.get('path', '').strip('/')
+        page, per_page = parse_pagination()
+        files, pagination = list_files_page(path, page, per_page)
+        return list_response({
+            'files': files,
+            'pagination': pagination,
+            'thumbnails': get_srcset_profiles()
         })
     
+    @app.route('/api/tree')
+    def api_tree():
+        """获取目录树（带 ETag，未变化时返回 304）
+
+        depth=1 时只返回 path 下一层的子文件夹（含子文件夹数量和 has_children 标记），用于按需展开
+        """
+        sort_type = request.args.get('sort', 'name-asc')
+        if request.args.get('depth') == '1':
+            path = request.args.get('path', '').strip('/')
+            body = json.dumps({
+                'path': path,
+                'children': tree_cache.get_level(path, sort_type)
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            etag = hashlib.sha1(body).hexdigest()
+        else:
+            etag, body = tree_cache.get_tree_payload(sort_type)
+        # 响应压缩后 ETag 为弱校验值，按弱比较确认
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
     @app.route('/api/search')
     def api_search():
-        """搜索功能"""
+        """搜索功能
+
+        不带分页参数时返回全部结果数组（兼容旧版）；
+        带 page/per_page/cursor 时返回一页结果和分页信息（compact=1 时为列式结构）；
+        format=ndjson 时逐行流式输出结果，不等待整个结果集；
+        fuzzy=1 时按名称容错匹配，返回相似度最高的 limit 个结果；
+        preview=N 时提示词只返回前 N 个字符（截断的条目带 truncated 标记）；
+        order 指定单元的排序方式（同 /api/files，默认 date-desc），文件夹始终排在最前
+        """
         query = request.args.get('q', '').strip()
         
-        if not query:
-            return jsonify([])
+        if request.args.get('fuzzy') in ('1', 'true'):
+            try:
+                limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+            except ValueError:
+                limit = 20
+            return jsonify(preview_prompts(fuzzy_search(query, limit), parse_prompt_preview()) if query else [])
+        paged = any(key in request.args for key in ('page', 'per_page', 'cursor'))
+        order = parse_unit_order(DEFAULT_SEARCH_ORDER)
+        
+        if request.args.get('format') == 'ndjson':
+            if not query:
+                return Response('', mimetype='application/x-ndjson')
+            results = iter_search(query, order)
+            if paged:
+                page, per_page = parse_pagination()
+                results = itertools.islice(results, (page - 1) * per_page, page * per_page)
+            
+            preview = parse_prompt_preview()
+            
+            def generate():
+                for item in results:
+                    yield json.dumps(preview_prompts([item], preview)[0], ensure_ascii=False) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
-        results = search_all_files(query)
-        return jsonify(results)
+        if not paged:
+            return jsonify(preview_prompts(list(iter_search(query, order)), parse_prompt_preview()) if query else [])
+        
+        page, per_page = parse_pagination()
+        after = parse_unit_cursor(order)
+        if not query:
+            return list_response({
+                'files': [],
+                'pagination': {'page': page, 'per_page': per_page, 'total': 0, 'folders': 0,
+                               'has_more': False, 'next_cursor': None}
+            })
+        files, pagination = search_page(query, page, per_page, after, order)
+        preview_prompts(files, parse_prompt_preview())
+        return list_response({
+            'files': files,
+            'pagination': pagination,
+            'thumbnails': get_srcset_profiles()
+        })
+    
+    @app.route('/api/catalog/status')
+    def api_catalog_status():
+        """单元索引状态"""
+        return jsonify(catalog.get_status())
+    
+    @app.route('/api/catalog/reconcile', methods=['POST'])
+    def api_catalog_reconcile():
+        """与文件系统增量对账（full=1 时检查所有目录，path 限定只对该文件夹及其子文件夹对账）"""
+        full = request.args.get('full', '0') in ('1', 'true')
+        root = parse_image_path() if request.args.get('path') else ''
+        return jsonify(catalog.reconcile_catalog(full=full, root=root))
     
     @app.route('/api/thumbnail')
     def api_thumbnail():
-        """获取缩略图"""
-        path = request.args.get('path', '')
+        """获取缩略图（profile 指定规格，或 w 指定所需宽度，由服务端选择宽度足够的最小规格）
+
+        输出格式按 Accept 请求头协商（AVIF/WebP 等），也可用 format 参数指定。
+        校验值由原图 mtime、大小、inode 和规格得出，条件请求命中时只 stat 一次就返回 304；
+        常用缩略图从内存缓存返回，不读磁盘
+        """
+        rel_path = parse_image_path()
+        profile, image_format = parse_thumbnail_variant()
         
-        if not path:
-            return abort(400, '路径参数必需')
+        located = locate_thumbnail(rel_path, profile, image_format)
+        if located is None:
+            return abort(404, '原始图片文件不存在')
+        stat, key = located
+        # 缩略图键已包含路径、mtime、大小和规格，再加上 inode
+        etag = f"{os.path.splitext(key)[0]}-{stat.st_ino:x}"
         
-        try:
-            # URL解码路径参数
-            from urllib.parse import unquote
-            path = unquote(path)
-            
-            # 规范化路径分隔符，确保在Windows上正确处理
-            path = path.replace('/', os.sep).replace('\\', os.sep)
-            
-            # 构建完整路径
-            full_path = os.path.join(IMAGE_DIR, path)
-            
-            # 规范化完整路径以防止路径遍历攻击
-            full_path = os.path.normpath(full_path)
-            image_dir_abs = os.path.abspath(IMAGE_DIR)
-            
-            # 确保请求的文件在IMAGE_DIR目录内（使用相对路径检查）
-            try:
-                rel_path = os.path.relpath(full_path, image_dir_abs)
-                # 检查相对路径是否在上级目录中（防止路径遍历）
-                if rel_path.startswith('..'):
-                    return abort(400, '无效的路径')
-            except ValueError:
-                # 当路径在不同驱动器上时会抛出ValueError
-                return abort(400, '无效的路径')
-            
-            if not os.path.exists(full_path):
-                return abort(404, f'原始图片文件不存在: {full_path}')
-            
-            # 缩略图路径
-            name, ext = os.path.splitext(path)
-            # 确保缩略图文件名安全
-            from .utils import get_safe_filename
-            thumbnail_name = get_safe_filename(name) + '.jpg'
-            thumbnail_path = os.path.join(THUMBNAIL_DIR, thumbnail_name)
-            thumbnail_dir = os.path.dirname(thumbnail_path)
-            
-            # 确保缩略图目录存在
-            os.makedirs(thumbnail_dir, exist_ok=True)
-            
-            # 检查缩略图是否需要重新生成
-            if not os.path.exists(thumbnail_path) or os.path.getmtime(full_path) > os.path.getmtime(thumbnail_path):
-                with file_lock:
-                    # 双重检查，防止并发创建
-                    if not os.path.exists(thumbnail_path) or os.path.getmtime(full_path) > os.path.getmtime(thumbnail_path):
-                        from .utils import create_thumbnail
-                        thumbnail = create_thumbnail(full_path)
-                        if thumbnail:
-                            thumbnail.save(thumbnail_path, 'JPEG', quality=85)
-                            print(f"缩略图已生成: {thumbnail_path}")
-                        else:
-                            return abort(500, f'缩略图生成失败: {full_path}')
-            
-            # 确保缩略图文件存在
-            if not os.path.exists(thumbnail_path):
-                return abort(500, f'缩略图文件不存在: {thumbnail_path}')
-            
-            # 检查缩略图目录和文件
-            thumbnail_dir = os.path.dirname(thumbnail_path)
-            if not os.path.exists(thumbnail_dir):
-                return abort(500, f'缩略图目录不存在: {thumbnail_dir}')
-            
-            if not os.path.exists(thumbnail_path):
-                return abort(500, f'缩略图文件不存在: {thumbnail_path}')
-            
-            print(f"发送缩略图: {thumbnail_path}")
-            # 添加HTTP缓存头
-            response = send_from_directory(os.path.abspath(thumbnail_dir), os.path.basename(thumbnail_path))
-            response.headers['Cache-Control'] = 'public, max-age=86400'  # 缓存1天
-            response.headers['ETag'] = str(os.path.getmtime(thumbnail_path))
-            return response
-        except Exception as e:
-            print(f"缩略图处理错误: {e}")
-            import traceback
-            traceback.print_exc()
-            return abort(500, f'服务器内部错误: {str(e)}')
+        if is_not_modified(etag, stat.st_mtime):
+            touch_thumbnails([key])
+            response = Response(status=304)
+        else:
+            data = read_thumbnail(key)
+            if data is None:
+                # 生成（或复用）缩略图；生成期间原图可能再次变化，以实际生成的键为准
+                try:
+                    thumbnail_path = ensure_thumbnail(rel_path, profile, image_format)
+                except Exception as e:
+                    print(f"缩略图处理错误: {e}")
+                    thumbnail_path = None
+                if not thumbnail_path:
+                    return abort(500, '缩略图生成失败')
+                key = os.path.basename(thumbnail_path)
+                data = read_thumbnail(key)
+                if data is None:
+                    return abort(500, '缩略图文件不存在')
+            else:
+                touch_thumbnails([key])
+            response = Response(data, mimetype=thumbnail_mimetype(key))
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        set_image_cache(response, source_version(stat.st_mtime, stat.st_size))
+        # 同一地址按 Accept 返回不同格式，缓存需区分
+        response.vary.add('Accept')
+        return response
+
+    @app.route('/api/thumbnails/batch')
+    def api_thumbnails_batch():
+        """一次返回文件夹一页单元的缩略图（分页与排序参数与 /api/files 相同，规格与格式参数与 /api/thumbnail 相同）
+
+        响应体为 4 字节大端序索引长度 + JSON 索引 + 拼接的缩略图数据，尚未生成的缩略图列在索引的 missing 中，
+        索引的 next_cursor 与 /api/files 同一页的 next_cursor 相同
+        """
+        path = request.args.get('path', '').strip('/')
+        page, per_page = parse_pagination()
+        profile, image_format = parse_thumbnail_variant()
+        order = parse_unit_order()
+        after = parse_unit_cursor(order)
+        offset = 0 if after else (page - 1) * per_page
+        signature, body = pack_thumbnails(path, offset, per_page, profile, image_format, order, after, parse_recursive())
+        if request.if_none_match.contains(signature):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/octet-stream')
+        response.set_etag(signature)
+        # 成员可能随时变化，每次使用前按签名确认
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+        return response
+
+    @app.route('/api/thumbnails/gc', methods=['GET', 'POST'])
+    def api_thumbnails_gc():
+        """缩略图清理：GET 只返回可清理项的报告（dry-run），POST 执行清理并返回同样的报告"""
+        return jsonify(collect_garbage(dry_run=request.method != 'POST'))
+
+    @app.route('/api/thumbnails/status')
+    def api_thumbnails_status():
+        """缩略图生成引擎状态（进程数、累计生成数、后台队列深度与等待时间）"""
+        return jsonify(get_engine_status())
 
     # 添加一个简单的健康检查端点
     @app.route('/api/health')
@@ -173,58 +411,25 @@ def register_routes(app):
     
     @app.route('/api/image')
     def api_image():
-        """获取原图"""
-        path = request.args.get('path', '')
-        
-        if not path:
-            return abort(400, '路径参数必需')
-        
+        """获取原图（ETag 由 mtime、大小和 inode 得出，条件请求命中时只 stat 一次就返回 304）"""
+        rel_path = parse_image_path()
+        full_path = os.path.join(IMAGE_DIR, rel_path)
         try:
-            # URL解码路径参数
-            from urllib.parse import unquote
-            path = unquote(path)
-            
-            # 构建完整路径
-            full_path = os.path.join(IMAGE_DIR, path)
-            
-            # 规范化完整路径以防止路径遍历攻击
-            full_path = os.path.normpath(full_path)
-            image_dir_abs = os.path.abspath(IMAGE_DIR)
-            
-            # 确保请求的文件在IMAGE_DIR目录内（使用相对路径检查）
-            try:
-                rel_path = os.path.relpath(full_path, image_dir_abs)
-                # 检查相对路径是否在上级目录中（防止路径遍历）
-                if rel_path.startswith('..'):
-                    return abort(400, '无效的路径')
-            except ValueError:
-                # 当路径在不同驱动器上时会抛出ValueError
-                return abort(400, '无效的路径')
-            
-            if not os.path.exists(full_path):
-                return abort(404, f'文件不存在: {full_path}')
-            
-            # 获取文件名和目录
-            directory = os.path.dirname(full_path)
-            filename = os.path.basename(full_path)
-            
-            # 添加调试信息
-            print(f"原图请求路径: {path}")
-            print(f"完整文件路径: {full_path}")
-            print(f"目录: {directory}")
-            print(f"文件名: {filename}")
-            print(f"目录绝对路径: {os.path.abspath(directory)}")
-            
-            # 添加HTTP缓存头
-            response = send_from_directory(os.path.abspath(directory), filename)
-            response.headers['Cache-Control'] = 'public, max-age=3600'  # 缓存1小时
-            response.headers['ETag'] = str(os.path.getmtime(full_path))
-            return response
-        except Exception as e:
-            print(f"原图处理错误: {e}")
-            import traceback
-            traceback.print_exc()
-            return abort(500, f'服务器内部错误: {str(e)}')
+            file_stat = os.stat(full_path)
+        except OSError:
+            return abort(404, '文件不存在')
+        if not S_ISREG(file_stat.st_mode):
+            return abort(404, '文件不存在')
+        etag = source_etag(file_stat)
+        
+        if is_not_modified(etag, file_stat.st_mtime):
+            response = Response(status=304)
+        else:
+            response = send_file(os.path.abspath(full_path), conditional=False, etag=False)
+        response.set_etag(etag)
+        response.last_modified = file_stat.st_mtime
+        set_image_cache(response, source_version(file_stat.st_mtime, file_stat.st_size))
+        return response
     
     @app.route('/api/unit', methods=['GET'])
     def api_get_unit():
@@ -368,6 +573,7 @@ def register_routes(app):
             
             # 创建文件夹
             os.makedirs(full_path, exist_ok=True)
+            catalog.add_folder(f"{parent_path}/{name}" if parent_path else name)
             
             return jsonify({'message': '文件夹创建成功'}), 201
             
@@ -407,12 +613,9 @@ def register_routes(app):
             
             # 重命名文件夹
             os.rename(old_full_path, new_full_path)
-            
-            # 同时重命名缩略图目录中的对应文件夹（如果存在）
-            old_thumbnail_path = os.path.join(THUMBNAIL_DIR, old_path)
-            new_thumbnail_path = os.path.join(THUMBNAIL_DIR, new_path)
-            if os.path.exists(old_thumbnail_path):
-                os.rename(old_thumbnail_path, new_thumbnail_path)
+            # 先迁移已有缩略图，再同步索引（索引变化会触发缺失缩略图的生成）
+            rename_thumbnails(old_path, new_path)
+            catalog.rename_folder(old_path, new_path)
             
             return jsonify({'message': '文件夹重命名成功'}), 200
             
@@ -451,11 +654,8 @@ def register_routes(app):
             # 删除文件夹及其所有内容
             import shutil
             shutil.rmtree(full_path)
-            
-            # 同时删除缩略图目录中的对应文件夹（如果存在）
-            thumbnail_path = os.path.join(THUMBNAIL_DIR, path)
-            if os.path.exists(thumbnail_path):
-                shutil.rmtree(thumbnail_path)
+            # 索引移除子树中的单元时会一并删除它们的缩略图
+            catalog.remove_folder(path)
             
             return jsonify({'message': '文件夹删除成功'}), 200
             
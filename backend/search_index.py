@@ -0,0 +1,332 @@
+# 提示词搜索模块
+# 基于单元索引中的 FTS5 倒排索引，按 SD 标签和单词检索提示词内容；
+# 结果由 SQLite 游标惰性产出，支持页码、游标分页和流式输出
+#
+# 查询语法：
+#   1girl smile          两个词都出现（AND）
+#   smile OR grin        任一词出现
+#   -hat / NOT hat       排除
+#   "long hair"          精确匹配整个标签（忽略大小写、括号权重，空格与下划线等价）
+#   tag:long_hair        同上
+#   nep*                 前缀匹配单词；"long"* 前缀匹配标签
+import re
+import sqlite3
+import itertools
+from difflib import SequenceMatcher
+from . import catalog
+from .utils import tag_token, prompt_word_text, name_trigrams, substring_trigrams
+
+# 搜索结果中单元的默认排序：最新优先
+DEFAULT_SEARCH_ORDER = 'date-desc'
+# 命中单元不超过该数量时取出全部命中再排序，超过时沿排序索引扫描
+SPARSE_MATCH_LIMIT = 2000
+
+_QUERY_TOKEN = re.compile(r'-?"[^"]*"\*?|\S+')
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+def _atom(term):
+    """将单个查询词转换为 FTS5 表达式，无法索引的词返回 None"""
+    prefix = term.endswith('*')
+    if prefix:
+        term = term.rstrip('*')
+
+    if term.startswith('"') and term.endswith('"') and len(term) >= 2:
+        token = tag_token(term[1:-1])
+        column = 'tags'
+    elif term.lower().startswith('tag:'):
+        token = tag_token(term[4:])
+        column = 'tags'
+    else:
+        token = prompt_word_text(term).lower().strip()
+        column = 'words'
+
+    if not token:
+        return None
+    return f"{column} : {_quote(token)}" + (' *' if prefix else '')
+
+def parse_query(query):
+    """解析查询，返回 (FTS5 肯定表达式, FTS5 排除表达式)，没有对应部分时为 None"""
+    groups = []
+    negatives = []
+    pending_or = False
+    pending_not = False
+
+    for term in _QUERY_TOKEN.findall(query or ''):
+        if term == 'OR':
+            pending_or = bool(groups)
+            continue
+        if term == 'AND':
+            continue
+        if term == 'NOT':
+            pending_not = True
+            continue
+
+        negate = pending_not
+        if term.startswith('-') and len(term) > 1:
+            negate = True
+            term = term[1:]
+        pending_not = False
+
+        atom = _atom(term)
+        if atom is None:
+            pending_or = False
+            continue
+        if negate:
+            negatives.append(atom)
+        elif pending_or:
+            groups[-1].append(atom)
+        else:
+            groups.append([atom])
+        pending_or = False
+
+    positive = ' AND '.join('(' + ' OR '.join(group) + ')' for group in groups) or None
+    negative = ' OR '.join(negatives) or None
+    return positive, negative
+
+def _valid_match(expression):
+    """FTS5 能否解析该表达式（只取第一行，解析错误在开始查询时就会抛出）"""
+    try:
+        catalog.get_connection().execute(
+            "SELECT 1 FROM prompt_index WHERE prompt_index MATCH ?", (expression,)
+        ).fetchone()
+    except sqlite3.OperationalError as e:
+        print(f"搜索语法错误: {expression}, 错误: {e}")
+        return False
+    return True
+
+def _prompt_matches(query):
+    """提示词命中的单元 rowid 子查询 (SQL, 参数)
+
+    没有可索引的词、没有倒排索引或表达式无法解析时返回 None，此时只按单元名和文件夹名匹配
+    """
+    if not catalog.has_prompt_index():
+        return None
+    positive, negative = parse_query(query)
+    if positive and negative:
+        expression = f"({positive}) NOT ({negative})"
+    else:
+        expression = positive or negative
+    if expression is None or not _valid_match(expression):
+        return None
+    if positive:
+        return "SELECT rowid FROM prompt_index WHERE prompt_index MATCH ?", (expression,)
+    # 只有排除条件时只能取补集
+    return ("SELECT rowid FROM units WHERE rowid NOT IN (SELECT rowid FROM prompt_index WHERE prompt_index MATCH ?)",
+            (expression,))
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _rarest_gram(grams, kind):
+    """倒排记录最少的三元组（每个三元组最多数到 SPARSE_MATCH_LIMIT 条，只为挑选驱动查询的三元组）"""
+    conn = catalog.get_connection()
+    counts = {
+        gram: conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM name_grams WHERE gram = ? AND kind = ? LIMIT ?)",
+            (gram, kind, SPARSE_MATCH_LIMIT)
+        ).fetchone()[0]
+        for gram in grams
+    }
+    return min(grams, key=lambda gram: (counts[gram], gram))
+
+def _name_matches(table, kind, query):
+    """名称包含查询词的单元（units, kind=0）或文件夹（folders, kind=1）的 rowid 子查询 (SQL, 参数)
+
+    由查询词中倒排记录最少的三元组取出候选再用 LIKE 核对；查询词不足三个字符或没有三元组索引时 LIKE 扫描
+    """
+    condition = "name LIKE ? ESCAPE '\\'" + (" AND parent IS NOT NULL" if table == 'folders' else '')
+    grams = substring_trigrams(query)
+    if not grams or not catalog.has_name_index():
+        return f"SELECT rowid FROM {table} WHERE {condition}", (_like_pattern(query),)
+    return (f"SELECT rowid FROM {table} WHERE rowid IN (SELECT id FROM name_grams WHERE gram = ? AND kind = ?) "
+            f"AND {condition}", (_rarest_gram(grams, kind), kind, _like_pattern(query)))
+
+def _unit_match_parts(query):
+    """命中单元的各路 rowid 子查询 [(SQL, 参数)]：提示词内容、单元名、所在文件夹名
+
+    各路分别走自己的索引（提示词倒排索引、名称三元组索引、文件夹索引），不对 units 整表逐行过滤
+    """
+    parts = [_name_matches('units', 0, query)]
+    folder_sql, folder_params = _name_matches('folders', 1, query)
+    parts.append((f"SELECT rowid FROM units WHERE folder IN (SELECT path FROM folders WHERE rowid IN ({folder_sql}))",
+                  folder_params))
+    prompt = _prompt_matches(query)
+    if prompt is not None:
+        parts.insert(0, prompt)
+    return parts
+
+def _join_parts(parts):
+    return ' UNION ALL '.join(sql for sql, _ in parts), sum((params for _, params in parts), ())
+
+def _unit_matches(query):
+    """命中的单元 rowid 子查询 (SQL, 参数)，各路结果直接合并，可能有重复的 rowid，只用于 IN 条件或去重计数"""
+    return _join_parts(_unit_match_parts(query))
+
+def _is_sparse(sql, params):
+    """命中的单元是否不超过 SPARSE_MATCH_LIMIT 个（最多读取 SPARSE_MATCH_LIMIT + 1 个 rowid）"""
+    count = catalog.get_connection().execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM ({sql}) LIMIT ?)", params + (SPARSE_MATCH_LIMIT + 1,)
+    ).fetchone()[0]
+    return count <= SPARSE_MATCH_LIMIT
+
+def iter_folder_matches(query):
+    """惰性产出名称命中的文件夹"""
+    sql, params = _name_matches('folders', 1, query)
+    rows = catalog.get_connection().execute(
+        f"SELECT path, name FROM folders WHERE rowid IN ({sql}) ORDER BY path", params
+    )
+    for row in rows:
+        yield {
+            'name': row['name'],
+            'path': row['path'],
+            'value': '📁 文件夹匹配',
+            'modified': 0,
+            'is_dir': True
+        }
+
+def _iter_unit_rows(query, after=None, offset=0, limit=None, order=DEFAULT_SEARCH_ORDER):
+    sql, params = _unit_matches(query)
+    sparse = _is_sparse(sql, params)
+    # 命中较少时由命中的 rowid 逐个取行再排序；命中较多时沿排序索引扫描并检查是否命中（+ 禁止用 rowid 驱动），
+    # 很快就能凑满一页，不需要对全部命中排序
+    sql = f"{'' if sparse else '+'}rowid IN ({sql})"
+    expression, condition, order_params, order_by = catalog.unit_order_clause(order, after)
+    if condition:
+        sql += f" AND {condition}"
+        params += tuple(order_params)
+    yield from catalog.get_connection().execute(
+        f"SELECT *, {expression} AS sort_key FROM units WHERE {sql} ORDER BY {order_by} LIMIT ? OFFSET ?",
+        params + (-1 if limit is None else limit, offset)
+    )
+
+def _unit_item(row):
+    item = catalog.row_to_file(row)
+    item['is_dir'] = False
+    return item
+
+def iter_unit_matches(query, after=None, offset=0, limit=None, order=DEFAULT_SEARCH_ORDER):
+    """惰性产出命中的单元，按 order 排序（排序方式同 catalog.UNIT_ORDERS，默认修改时间倒序）
+
+    after 为解析后的 (排序值, 路径) 游标，从该单元之后继续
+    """
+    return (_unit_item(row) for row in _iter_unit_rows(query, after, offset, limit, order))
+
+def _count_folders(query):
+    sql, params = _name_matches('folders', 1, query)
+    return catalog.get_connection().execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+def _count_units(query, estimate=False):
+    """统计命中的单元数量，返回 (数量, 是否为估计值)
+
+    estimate 为 True 且命中超过 SPARSE_MATCH_LIMIT 个时不做去重，按各路命中数之和（不超过单元总数）估计
+    """
+    conn = catalog.get_connection()
+    parts = _unit_match_parts(query)
+    sql, params = _join_parts(parts)
+    if not estimate or _is_sparse(sql, params):
+        return conn.execute(f"SELECT COUNT(DISTINCT rowid) FROM ({sql})", params).fetchone()[0], False
+    total = sum(conn.execute(f"SELECT COUNT(*) FROM ({part})", part_params).fetchone()[0] for part, part_params in parts)
+    return min(total, conn.execute("SELECT COUNT(*) FROM units").fetchone()[0]), True
+
+def count_matches(query):
+    """统计命中的文件夹数量和单元数量（只数各索引取出的 rowid，不读取行内容）"""
+    return _count_folders(query), _count_units(query)[0]
+
+def iter_search(query, order=DEFAULT_SEARCH_ORDER):
+    """惰性产出全部搜索结果：先文件夹，再按 order 排序的单元"""
+    return itertools.chain(iter_folder_matches(query), iter_unit_matches(query, order=order))
+
+def search_page(query, page=1, per_page=200, after=None, order=DEFAULT_SEARCH_ORDER):
+    """分页搜索，返回 (结果列表, 分页信息)
+
+    after 为解析后的游标（见 catalog.decode_unit_cursor）时从该单元之后继续（不再返回文件夹，
+    也不重复统计总数），否则按页码分页；下一页游标与文件夹列表的游标格式相同。
+    命中的单元很多时总数为估计值（pagination 的 estimated 为 True），翻页以 has_more 为准
+    """
+    if after is not None:
+        folders = []
+        rows = list(_iter_unit_rows(query, after=after, limit=per_page + 1, order=order))
+        pagination = {'per_page': per_page}
+    else:
+        folder_total = _count_folders(query)
+        unit_total, estimated = _count_units(query, estimate=True)
+        start = (page - 1) * per_page
+        # 文件夹排在最前，剩余名额和偏移量交给单元查询
+        folders = list(itertools.islice(iter_folder_matches(query), start, start + per_page)) if start < folder_total else []
+        unit_offset = max(start - folder_total, 0)
+        rows = list(_iter_unit_rows(query, offset=unit_offset, limit=per_page - len(folders) + 1, order=order))
+        pagination = {
+            'page': page,
+            'per_page': per_page,
+            'total': folder_total + unit_total,
+            'folders': folder_total,
+            'estimated': estimated
+        }
+    has_more = len(folders) + len(rows) > per_page
+    rows = rows[:per_page - len(folders)]
+    pagination['has_more'] = has_more
+    pagination['next_cursor'] = catalog.encode_unit_cursor(order, rows[-1]) if has_more and rows else None
+    return folders + [_unit_item(row) for row in rows], pagination
+
+# 模糊搜索：候选数量为返回数量的倍数，最低相似度以下的结果丢弃
+FUZZY_CANDIDATES = 10
+FUZZY_MIN_SCORE = 0.3
+
+def fuzzy_search(query, limit=20):
+    """按名称三元组容错搜索单元和文件夹，返回按相似度排序的前 limit 个结果
+
+    先用三元组索引按共有三元组数量取出候选，再按查询在名称中的三元组覆盖率、
+    编辑相似度排序（拼错一两个字母仍能命中，如 tatsumkai -> tatsumaki）
+    """
+    grams = name_trigrams(query)
+    if not grams or not catalog.has_name_index():
+        return []
+    conn = catalog.get_connection()
+    placeholders = ', '.join('?' * len(grams))
+    candidates = conn.execute(
+        f"SELECT kind, id, COUNT(*) AS shared FROM name_grams WHERE gram IN ({placeholders}) "
+        "GROUP BY kind, id ORDER BY shared DESC LIMIT ?",
+        tuple(grams) + (limit * FUZZY_CANDIDATES,)
+    ).fetchall()
+
+    shared = {(row['kind'], row['id']): row['shared'] for row in candidates}
+    unit_ids = [row['id'] for row in candidates if row['kind'] == 0]
+    folder_ids = [row['id'] for row in candidates if row['kind'] == 1]
+    items = []
+    if unit_ids:
+        rows = conn.execute(
+            f"SELECT rowid, * FROM units WHERE rowid IN ({', '.join('?' * len(unit_ids))})", unit_ids
+        )
+        for row in rows:
+            item = catalog.row_to_file(row)
+            item['is_dir'] = False
+            items.append((shared[(0, row['rowid'])], item))
+    if folder_ids:
+        rows = conn.execute(
+            f"SELECT rowid, path, name FROM folders WHERE rowid IN ({', '.join('?' * len(folder_ids))})", folder_ids
+        )
+        for row in rows:
+            items.append((shared[(1, row['rowid'])], {
+                'name': row['name'],
+                'path': row['path'],
+                'value': '📁 文件夹匹配',
+                'modified': 0,
+                'is_dir': True
+            }))
+
+    query_lower = query.lower()
+    results = []
+    for count, item in items:
+        name_lower = item['name'].lower()
+        coverage = count / len(grams)
+        similarity = SequenceMatcher(None, query_lower, name_lower).ratio()
+        # 名称包含查询词时不受名称长度影响
+        score = 1.0 if query_lower in name_lower else max(coverage * 0.8, similarity)
+        if score >= FUZZY_MIN_SCORE:
+            item['score'] = round(score, 3)
+            results.append(item)
+    results.sort(key=lambda x: (-x['score'], len(x['name']), x['path']))
+    return results[:limit]
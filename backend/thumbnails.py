@@ -0,0 +1,825 @@
+# 缩略图模块
+# 所有缩略图存放在同一个按内容寻址的存储中：键 = sha1(单元路径 + 原图 mtime + 大小 + 规格) + 格式扩展名，
+# 按键的前两位十六进制分散到 256 个子目录；生成记录登记在单元索引的 thumbnails 表中
+import os
+import re
+import json
+import time
+import heapq
+import struct
+import hashlib
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from .config import (IMAGE_DIR, THUMBNAIL_DIR, THUMBNAIL_PROFILES, THUMBNAIL_DEFAULT_PROFILE, THUMBNAIL_ACCEPT_FORMATS,
+                     THUMBNAIL_WORKERS, THUMBNAIL_BATCH_CACHE_PAGES, THUMBNAIL_BACKOFF, THUMBNAIL_BUDGET_MB,
+                     THUMBNAIL_MEMORY_CACHE_MB, THUMBNAIL_PRERENDER_FORMATS)
+from .utils import render_thumbnail
+from . import catalog
+
+DEFAULT_PROFILE = THUMBNAIL_DEFAULT_PROFILE
+
+# 输出格式 -> 文件扩展名、MIME 类型
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'AVIF': '.avif'}
+FORMAT_MIMETYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'AVIF': 'image/avif'}
+
+# 存储版本标记，存在时说明旧布局已清理完成
+STORE_MARKER = '.store-v1'
+_KEY_FILE = re.compile(r'^[0-9a-f]{40}\.(jpg|png|webp|avif)$')
+
+# 缩略图生成进程池（首次使用时创建，不可用时回退到当前线程生成）
+_executor = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+engine_stats = {
+    'workers': 0,
+    'generated': 0,
+    'failed': 0,
+    'pending': 0
+}
+# 正在生成的缩略图：键 -> 结果 Future（同一键只生成一次，其余请求等待同一结果）
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# 后台生成任务优先级（数值越小越先生成）：正在浏览的文件夹 > 新增或变化的单元 > 启动时的全量补齐
+PRIORITY_VISIBLE = 0
+PRIORITY_CHANGED = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_VISIBLE: 'visible', PRIORITY_CHANGED: 'changed', PRIORITY_BACKGROUND: 'background'}
+
+# 后台任务调度：堆中为 (优先级, 序号, 任务)，任务 = (单元路径, 规格, 格式)；
+# _job_entries 记录每个任务当前有效的 (优先级, 序号, 入队时间)，重复提交时合并为一项并保留更高的优先级
+_jobs = []
+_job_entries = {}
+_job_seq = itertools.count()
+_job_cond = threading.Condition()
+_scheduler = None
+# 正在按需生成的交互请求数与最近一次结束的时间，后台任务在此期间让出进程池
+_interactive = 0
+_last_interactive = 0.0
+scheduler_stats = {
+    'scheduled': 0,
+    'merged': 0,
+    'started': 0,
+    'skipped': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0
+}
+
+# 最近被请求的缩略图：键 -> 时间，批量写入清单的 served 列，作为容量超限时淘汰的依据
+_served = {}
+_served_lock = threading.Lock()
+_served_flushed = time.time()
+SERVED_FLUSH_INTERVAL = 30
+
+# 容量检查结果缓存 (检查时间, 是否超限)，避免每个后台任务都统计一次
+_budget_check = [0.0, False]
+
+# 常用缩略图的内存缓存：键 -> 文件内容，按最近使用淘汰；键包含原图路径、mtime 和大小，原图变化后旧内容不会再命中
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+memory_stats = {
+    'bytes': 0,
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0
+}
+
+# 缩略图包缓存：(文件夹, 偏移, 数量, 规格标识) -> (签名, 数据)，按最近使用淘汰
+_batch_cache = OrderedDict()
+_batch_lock = threading.Lock()
+
+def variant_settings(profile=DEFAULT_PROFILE, image_format=None):
+    """规格在指定格式下的编码设置 (格式, 质量, 额外编码参数)，未指定格式时使用规格自身的格式"""
+    spec = THUMBNAIL_PROFILES[profile]
+    if image_format is None or image_format == spec['format']:
+        return spec['format'], spec['quality'], {}
+    options = dict(THUMBNAIL_ACCEPT_FORMATS[image_format])
+    return image_format, options.pop('quality'), options
+
+def profile_id(profile=DEFAULT_PROFILE, image_format=None):
+    """规格标识（名称 + 尺寸 + 格式 + 质量 + 缩小余量 + 编码参数），规格参数变化后标识随之变化"""
+    spec = THUMBNAIL_PROFILES[profile]
+    width, height = spec['size']
+    image_format, quality, options = variant_settings(profile, image_format)
+    extra = ''.join(f":{name}{value}" for name, value in sorted(options.items()))
+    return f"{profile}:{width}x{height}:{image_format.lower()}:q{quality}:g{spec.get('reducing_gap')}{extra}"
+
+def profile_extension(profile=DEFAULT_PROFILE, image_format=None):
+    """规格输出格式对应的文件扩展名"""
+    return FORMAT_EXTENSIONS[image_format or THUMBNAIL_PROFILES[profile]['format']]
+
+def get_accept_formats():
+    """可按 Accept 请求头协商的格式（按优先级，只包含当前 Pillow 能够编码的格式）"""
+    Image.init()
+    return [image_format for image_format in THUMBNAIL_ACCEPT_FORMATS if image_format in Image.SAVE]
+
+def negotiate_format(accepted_mimetypes):
+    """从客户端明确接受的 MIME 类型中选出优先级最高的协商格式，没有时返回 None（使用规格自身的格式）"""
+    for image_format in get_accept_formats():
+        if FORMAT_MIMETYPES[image_format] in accepted_mimetypes:
+            return image_format
+    return None
+
+def thumbnail_mimetype(thumbnail_path):
+    """缩略图文件的 MIME 类型"""
+    extension = os.path.splitext(thumbnail_path)[1]
+    for image_format, format_extension in FORMAT_EXTENSIONS.items():
+        if format_extension == extension:
+            return FORMAT_MIMETYPES[image_format]
+    return 'image/jpeg'
+
+def thumbnail_key(rel_path, source_modified, source_size, profile_key, extension):
+    """根据单元路径、原图 mtime、大小和规格标识计算缩略图键（带扩展名，即存储中的文件名）"""
+    raw = f"{rel_path}\n{source_modified!r}\n{source_size}\n{profile_key}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest() + extension
+
+def get_thumbnail_path(key):
+    """缩略图键对应的存储路径"""
+    return os.path.join(THUMBNAIL_DIR, key[:2], key)
+
+def resolve_profile(profile=None, width=None):
+    """按名称或所需宽度选择规格：指定宽度时取宽度足够的最小规格，都不够时取最大规格；无效时返回 None"""
+    if profile:
+        return profile if profile in THUMBNAIL_PROFILES else None
+    if not width:
+        return DEFAULT_PROFILE
+    by_width = sorted(THUMBNAIL_PROFILES, key=lambda name: THUMBNAIL_PROFILES[name]['size'][0])
+    for name in by_width:
+        if THUMBNAIL_PROFILES[name]['size'][0] >= width:
+            return name
+    return by_width[-1]
+
+def get_srcset_profiles():
+    """列表中 srcset 的候选规格（按宽度升序）"""
+    profiles = [
+        {'profile': name, 'width': spec['size'][0], 'height': spec['size'][1]}
+        for name, spec in THUMBNAIL_PROFILES.items() if spec.get('srcset')
+    ]
+    return sorted(profiles, key=lambda item: item['width'])
+
+def get_prerender_variants():
+    """需要为所有单元预生成的 (规格, 格式)：THUMBNAIL_PRERENDER_FORMATS 中当前 Pillow 能够编码的格式，
+    都不可用时使用规格自身的格式
+    """
+    profiles = [name for name, spec in THUMBNAIL_PROFILES.items() if spec.get('prerender')] or [DEFAULT_PROFILE]
+    available = get_accept_formats()
+    formats = [image_format for image_format in THUMBNAIL_PRERENDER_FORMATS
+               if image_format is None or image_format in available] or [None]
+    return [(profile, image_format) for profile in profiles for image_format in formats]
+
+def get_profile_ids():
+    """当前所有规格及可协商格式的规格标识"""
+    formats = [None] + get_accept_formats()
+    return [profile_id(name, image_format) for name in THUMBNAIL_PROFILES for image_format in formats]
+
+def _remove_files(keys):
+    _forget_memory(keys)
+    for key in keys:
+        try:
+            os.remove(get_thumbnail_path(key))
+        except OSError:
+            pass
+
+def read_thumbnail(key):
+    """读取缩略图内容：优先从内存缓存读取，未命中时读文件并放入缓存，文件不存在时返回 None"""
+    with _memory_lock:
+        data = _memory_cache.get(key)
+        if data is not None:
+            _memory_cache.move_to_end(key)
+            memory_stats['hits'] += 1
+            return data
+        memory_stats['misses'] += 1
+    try:
+        with open(get_thumbnail_path(key), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    budget = THUMBNAIL_MEMORY_CACHE_MB * 1024 * 1024
+    if len(data) <= budget:
+        with _memory_lock:
+            if key not in _memory_cache:
+                _memory_cache[key] = data
+                memory_stats['bytes'] += len(data)
+            while memory_stats['bytes'] > budget:
+                evicted_key, evicted = _memory_cache.popitem(last=False)
+                memory_stats['bytes'] -= len(evicted)
+                memory_stats['evictions'] += 1
+    return data
+
+def _forget_memory(keys):
+    """从内存缓存中移除已删除的缩略图"""
+    with _memory_lock:
+        for key in keys:
+            data = _memory_cache.pop(key, None)
+            if data is not None:
+                memory_stats['bytes'] -= len(data)
+
+def get_memory_cache_status():
+    """内存缓存状态：条目数、占用字节、容量上限与命中统计"""
+    with _memory_lock:
+        status = dict(memory_stats)
+        status['entries'] = len(_memory_cache)
+    requests = status['hits'] + status['misses']
+    status['budget_bytes'] = THUMBNAIL_MEMORY_CACHE_MB * 1024 * 1024
+    status['hit_rate'] = round(status['hits'] / requests, 4) if requests else 0
+    return status
+
+def locate_thumbnail(rel_path, profile=DEFAULT_PROFILE, image_format=None):
+    """读取原图状态并计算缩略图键，原图不存在时返回 None，否则返回 (stat, 键)"""
+    try:
+        stat = os.stat(os.path.join(IMAGE_DIR, rel_path))
+    except OSError:
+        return None
+    return stat, thumbnail_key(rel_path, stat.st_mtime, stat.st_size, profile_id(profile, image_format),
+                               profile_extension(profile, image_format))
+
+def get_worker_count():
+    """缩略图生成进程数"""
+    return THUMBNAIL_WORKERS or os.cpu_count() or 1
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            try:
+                # 统一使用 spawn：避免在已有监听线程、数据库连接的进程中 fork
+                _executor = ProcessPoolExecutor(max_workers=get_worker_count(),
+                                                mp_context=multiprocessing.get_context('spawn'))
+                engine_stats['workers'] = get_worker_count()
+            except (OSError, NotImplementedError, ValueError) as e:
+                print(f"缩略图进程池不可用，改为在当前线程生成: {e}")
+                _executor = False
+                engine_stats['workers'] = 1
+        return _executor or None
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+def _submit(rel_path, key, profile, image_format=None):
+    """提交一个生成任务，返回 Future；进程池不可用时同步生成并返回已完成的结果"""
+    spec = THUMBNAIL_PROFILES[profile]
+    image_format, quality, options = variant_settings(profile, image_format)
+    args = (os.path.join(IMAGE_DIR, rel_path), get_thumbnail_path(key), spec['size'], quality,
+            spec.get('reducing_gap'), image_format, options)
+    with _stats_lock:
+        engine_stats['pending'] += 1
+    executor = _get_executor()
+    if executor is not None:
+        try:
+            return executor.submit(render_thumbnail, *args)
+        except (BrokenProcessPool, RuntimeError):
+            _reset_executor()
+    future = Future()
+    try:
+        future.set_result(render_thumbnail(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def _finish(rel_path, key, profile_key, stat, future):
+    """登记生成结果并更新统计，返回缩略图路径，失败时返回 None"""
+    try:
+        size = future.result()
+    except BrokenProcessPool as e:
+        # 子进程异常退出（如内存不足），下次使用时重建进程池
+        _reset_executor()
+        print(f"缩略图进程池异常，已重置: {e}")
+        size = None
+    except Exception as e:
+        print(f"生成缩略图失败: {rel_path}, 错误: {e}")
+        size = None
+    with _stats_lock:
+        engine_stats['pending'] -= 1
+        engine_stats['generated' if size else 'failed'] += 1
+    if not size:
+        return None
+    superseded = catalog.record_thumbnail(key, rel_path, profile_key, stat.st_mtime, stat.st_size, size)
+    # 原图变化后旧版本缩略图不再使用
+    _remove_files(superseded)
+    return get_thumbnail_path(key)
+
+def _claim(key):
+    """登记正在生成的键，返回 (结果 Future, 是否由调用方负责生成)"""
+    with _inflight_lock:
+        waiter = _inflight.get(key)
+        if waiter is not None:
+            return waiter, False
+        waiter = Future()
+        _inflight[key] = waiter
+        return waiter, True
+
+def _settle(key, waiter, result):
+    """结束一个键的生成，唤醒所有等待者"""
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    waiter.set_result(result)
+
+def _complete(rel_path, key, profile_key, stat, future, waiter):
+    try:
+        result = _finish(rel_path, key, profile_key, stat, future)
+    except Exception as e:
+        print(f"登记缩略图失败: {rel_path}, 错误: {e}")
+        result = None
+    _settle(key, waiter, result)
+    return result
+
+def ensure_thumbnail(rel_path, profile=DEFAULT_PROFILE, image_format=None):
+    """确保单元缩略图存在且为最新，返回缩略图路径，失败时返回 None
+
+    同一缩略图的并发请求只生成一次，不同缩略图之间互不阻塞；image_format 为空时使用规格自身的格式
+    """
+    located = locate_thumbnail(rel_path, profile, image_format)
+    if located is None:
+        return None
+    stat, key = located
+    thumbnail_path = get_thumbnail_path(key)
+    # 键包含原图 mtime 和大小，文件存在即为最新
+    if os.path.exists(thumbnail_path):
+        touch_thumbnails([key])
+        return thumbnail_path
+    waiter, owner = _claim(key)
+    if not owner:
+        return waiter.result()
+    # 取得生成权后再检查一次：可能刚被其他请求生成完毕
+    if os.path.exists(thumbnail_path):
+        _settle(key, waiter, thumbnail_path)
+        return thumbnail_path
+    _begin_interactive()
+    try:
+        result = _complete(rel_path, key, profile_id(profile, image_format), stat,
+                           _submit(rel_path, key, profile, image_format), waiter)
+    finally:
+        _end_interactive()
+    if result:
+        print(f"缩略图已生成: {thumbnail_path}")
+    return result
+
+def touch_thumbnails(keys):
+    """记录缩略图被请求的时间（先记在内存中，定期批量写入清单）"""
+    now = time.time()
+    with _served_lock:
+        for key in keys:
+            _served[key] = now
+        due = now - _served_flushed >= SERVED_FLUSH_INTERVAL
+    if due:
+        flush_served()
+
+def flush_served():
+    """将内存中的请求时间写入清单"""
+    global _served_flushed
+    with _served_lock:
+        served = dict(_served)
+        _served.clear()
+        _served_flushed = time.time()
+    if served:
+        catalog.touch_thumbnails(served)
+
+def _begin_interactive():
+    global _interactive
+    with _job_cond:
+        _interactive += 1
+
+def _end_interactive():
+    global _interactive, _last_interactive
+    with _job_cond:
+        _interactive -= 1
+        _last_interactive = time.time()
+        _job_cond.notify_all()
+
+def _backoff_delay():
+    """后台任务还需让出进程池的秒数（调用方持有 _job_cond）"""
+    if _interactive:
+        return THUMBNAIL_BACKOFF or 0.1
+    return max(0.0, _last_interactive + THUMBNAIL_BACKOFF - time.time())
+
+def schedule_thumbnails(paths, priority=PRIORITY_CHANGED, variants=None):
+    """将单元的缩略图加入后台生成队列（默认生成预生成规格），已在队列中的任务合并并提升到更高的优先级"""
+    global _scheduler
+    variants = variants or get_prerender_variants()
+    now = time.time()
+    with _job_cond:
+        for rel_path in paths:
+            for profile, image_format in variants:
+                job = (rel_path, profile, image_format)
+                entry = _job_entries.get(job)
+                if entry is not None:
+                    scheduler_stats['merged'] += 1
+                    if priority >= entry[0]:
+                        continue
+                    # 提升优先级：堆中的旧项出队时发现序号不符即丢弃，等待时间仍从首次入队算起
+                    entry = (priority, next(_job_seq), entry[2])
+                else:
+                    scheduler_stats['scheduled'] += 1
+                    entry = (priority, next(_job_seq), now)
+                _job_entries[job] = entry
+                heapq.heappush(_jobs, (entry[0], entry[1], job))
+        _job_cond.notify_all()
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run_scheduler, daemon=True)
+            _scheduler.start()
+
+def _pop_job():
+    """取出优先级最高的有效任务 (任务, 入队时间)，队列为空时返回 None（调用方持有 _job_cond）"""
+    while _jobs:
+        priority, seq, job = heapq.heappop(_jobs)
+        entry = _job_entries.get(job)
+        if entry is None or entry[1] != seq:
+            continue
+        del _job_entries[job]
+        return job, priority, entry[2]
+    return None
+
+def _dispatch(job, priority, enqueued, in_flight):
+    """提交一个后台任务到进程池；缩略图已存在、正由其他请求生成，或容量已超限时的全量补齐任务跳过"""
+    rel_path, profile, image_format = job
+    if priority == PRIORITY_BACKGROUND and _over_budget():
+        # 补齐的缩略图随后又会被淘汰，只按需生成
+        scheduler_stats['skipped'] += 1
+        return
+    located = locate_thumbnail(rel_path, profile, image_format)
+    if located is None or os.path.exists(get_thumbnail_path(located[1])):
+        scheduler_stats['skipped'] += 1
+        return
+    stat, key = located
+    waiter, owner = _claim(key)
+    if not owner:
+        scheduler_stats['skipped'] += 1
+        return
+    waited = time.time() - enqueued
+    scheduler_stats['started'] += 1
+    scheduler_stats['wait_total'] += waited
+    scheduler_stats['wait_max'] = max(scheduler_stats['wait_max'], waited)
+    future = _submit(rel_path, key, profile, image_format)
+    in_flight[future] = (rel_path, key, profile_id(profile, image_format), stat, waiter)
+
+def _run_scheduler():
+    """后台调度线程：按优先级提交任务，同时在途的任务数有上限，交互请求生成期间暂停提交"""
+    window = get_worker_count() * 2
+    in_flight = {}
+    run = None
+    while True:
+        job = None
+        with _job_cond:
+            delay = _backoff_delay()
+            if len(in_flight) < window and not delay:
+                job = _pop_job()
+            if job is None and not in_flight:
+                if run and not _job_entries:
+                    _report_run(run, final=True)
+                    run = None
+                    if THUMBNAIL_BUDGET_MB:
+                        # 本轮生成结束后按容量上限淘汰（在锁外执行）
+                        threading.Thread(target=enforce_budget, daemon=True).start()
+                # 没有可做的事：等待新任务，或等待退避结束
+                _job_cond.wait(delay or None)
+                continue
+        if run is None:
+            run = {'started': time.time(), 'generated': 0, 'failed': 0, 'reported': time.time()}
+        if job is not None:
+            try:
+                _dispatch(job[0], job[1], job[2], in_flight)
+            except Exception as e:
+                print(f"提交缩略图任务失败: {job[0][0]}, 错误: {e}")
+        if not in_flight:
+            continue
+        if job is not None and len(in_flight) < window:
+            # 窗口未满时只收取已完成的任务，尽快唤醒等待同一缩略图的请求
+            done = [future for future in in_flight if future.done()]
+        else:
+            done, _ = wait(list(in_flight), timeout=THUMBNAIL_BACKOFF or None, return_when=FIRST_COMPLETED)
+        for future in done:
+            rel_path, key, profile_key, stat, waiter = in_flight.pop(future)
+            run['generated' if _complete(rel_path, key, profile_key, stat, future, waiter) else 'failed'] += 1
+        if time.time() - run['reported'] >= 5:
+            _report_run(run)
+
+def _report_run(run, final=False):
+    """汇报本轮后台生成的进度与吞吐量"""
+    run['reported'] = time.time()
+    elapsed = run['reported'] - run['started']
+    rate = run['generated'] / elapsed if elapsed else 0
+    if final:
+        if run['generated'] or run['failed']:
+            print(f"后台缩略图生成完成，共生成 {run['generated']} 张缩略图，失败 {run['failed']} 张，"
+                  f"用时 {elapsed:.1f}s（{rate:.1f} 张/秒）")
+    else:
+        print(f"后台生成缩略图: 已生成 {run['generated']} 张，队列剩余 {len(_job_entries)} 个，{rate:.1f} 张/秒")
+
+def get_queue_status():
+    """后台任务队列状态：各优先级的排队数、最久等待时间、累计合并数与平均/最长等待时间"""
+    now = time.time()
+    with _job_cond:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        oldest = 0.0
+        for priority, seq, enqueued in _job_entries.values():
+            depth[PRIORITY_NAMES[priority]] += 1
+            oldest = max(oldest, now - enqueued)
+        stats = dict(scheduler_stats)
+        status = {
+            'depth': len(_job_entries),
+            'by_priority': depth,
+            'oldest_wait': round(oldest, 3),
+            'interactive': _interactive,
+            'backing_off': _backoff_delay() > 0
+        }
+    status.update({
+        'scheduled': stats['scheduled'],
+        'merged': stats['merged'],
+        'started': stats['started'],
+        'skipped': stats['skipped'],
+        'avg_wait': round(stats['wait_total'] / stats['started'], 3) if stats['started'] else 0,
+        'max_wait': round(stats['wait_max'], 3)
+    })
+    return status
+
+def get_engine_status():
+    """缩略图生成引擎状态：进程数、累计生成/失败数、在途任务与后台任务队列"""
+    with _stats_lock:
+        status = dict(engine_stats)
+    status['workers'] = status['workers'] or get_worker_count()
+    status['profiles'] = {name: profile_id(name) for name in THUMBNAIL_PROFILES}
+    status['accept_formats'] = get_accept_formats()
+    status['queue'] = get_queue_status()
+    status['memory_cache'] = get_memory_cache_status()
+    return status
+
+def pack_thumbnails(folder, offset, limit, profile=DEFAULT_PROFILE, image_format=None,
+                    order=catalog.DEFAULT_UNIT_ORDER, after=None, recursive=False):
+    """将文件夹一页单元（按 order 排序，after 为解析后的翻页游标，recursive 时为整个子树）的缩略图打包为一个响应体，
+    返回 (签名, 数据)
+
+    数据格式：4 字节大端序索引长度 + UTF-8 JSON 索引 + 依次拼接的缩略图文件内容；
+    索引记录每张缩略图在内容区的 offset/length，尚未生成的缩略图列在 missing 中（由客户端单独请求），
+    next_cursor 为下一页的游标。
+    签名由成员的缩略图键计算，成员改名、修改或删除后签名随之变化，缓存的包也随之失效
+    """
+    folder = catalog.normalize_path(folder)
+    profile_key = profile_id(profile, image_format)
+    members = []
+    units, next_cursor = catalog.page_units(folder, limit, order, offset=offset, after=after, recursive=recursive)
+    for unit in units:
+        located = locate_thumbnail(unit['path'], profile, image_format)
+        members.append((unit['path'], located[1] if located else None))
+    signature = hashlib.sha1(
+        json.dumps([profile_key, members], ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+    cache_key = (folder, offset, limit, profile_key, order, after, recursive)
+    with _batch_lock:
+        cached = _batch_cache.get(cache_key)
+        cached = cached if cached and cached[0] == signature else None
+        if cached:
+            _batch_cache.move_to_end(cache_key)
+    if cached:
+        touch_thumbnails([key for rel_path, key in members])
+        return cached
+
+    items = []
+    missing = []
+    served = []
+    chunks = []
+    position = 0
+    for rel_path, key in members:
+        try:
+            if key is None:
+                raise FileNotFoundError(rel_path)
+            with open(get_thumbnail_path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            missing.append(rel_path)
+            continue
+        items.append({'path': rel_path, 'offset': position, 'length': len(data)})
+        served.append(key)
+        chunks.append(data)
+        position += len(data)
+    image_format, _, _ = variant_settings(profile, image_format)
+    index = json.dumps({
+        'profile': profile,
+        'mimetype': FORMAT_MIMETYPES[image_format],
+        'items': items,
+        'missing': missing,
+        'next_cursor': next_cursor
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    touch_thumbnails(served)
+    if missing:
+        # 正在浏览的页面缺少的缩略图优先生成
+        schedule_thumbnails(missing, PRIORITY_VISIBLE, [(profile, image_format)])
+        # 不完整的包签名不同于完整的包，缺少的缩略图生成后客户端不会按旧签名继续使用不完整的包
+        signature = hashlib.sha1(
+            json.dumps([signature, missing], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+    packed = (signature, b''.join([struct.pack('>I', len(index)), index] + chunks))
+    # 缺少缩略图的包不缓存，生成完成后下次请求即可拿到完整的包
+    if not missing:
+        with _batch_lock:
+            _batch_cache[cache_key] = packed
+            while len(_batch_cache) > THUMBNAIL_BATCH_CACHE_PAGES:
+                _batch_cache.popitem(last=False)
+    return packed
+
+def _drop_batches(folders):
+    """丢弃涉及这些文件夹的缩略图包缓存"""
+    with _batch_lock:
+        for cache_key in [cache_key for cache_key in _batch_cache if cache_key[0] in folders]:
+            del _batch_cache[cache_key]
+
+def rename_thumbnails(old_path, new_path):
+    """单元或文件夹改名后迁移已有缩略图（原图内容未变，无需重新生成）"""
+    old_path = catalog.normalize_path(old_path)
+    new_path = catalog.normalize_path(new_path)
+    moves = []
+    for record in catalog.list_thumbnails(old_path):
+        path = new_path + record['path'][len(old_path):]
+        key = thumbnail_key(path, record['source_modified'], record['source_size'], record['profile'],
+                            os.path.splitext(record['key'])[1])
+        target = get_thumbnail_path(key)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(get_thumbnail_path(record['key']), target)
+        except OSError:
+            continue
+        moves.append((record['key'], key, path))
+    catalog.rekey_thumbnails(moves)
+
+def discard_thumbnails(paths):
+    """删除单元（或文件夹子树）的所有缩略图"""
+    _remove_files(catalog.pop_thumbnails(paths))
+
+def migrate_legacy_thumbnails():
+    """清理旧版两种布局（平铺的 safe 文件名、镜像 images 的子目录）留下的缩略图
+
+    旧版缩略图均为 200x200，与现有规格都不一致，直接删除，由批量生成按新规格重建
+    """
+    if os.path.exists(os.path.join(THUMBNAIL_DIR, STORE_MARKER)):
+        return
+    print("开始清理旧版缩略图...")
+    removed = 0
+    for root, dirs, files in os.walk(THUMBNAIL_DIR, topdown=False):
+        rel_dir = os.path.relpath(root, THUMBNAIL_DIR).replace('\\', '/')
+        in_shard = len(rel_dir) == 2 and all(c in '0123456789abcdef' for c in rel_dir)
+        for file in files:
+            if in_shard and _KEY_FILE.match(file):
+                continue
+            file_path = os.path.join(root, file)
+            try:
+                os.remove(file_path)
+                removed += 1
+            except OSError as e:
+                print(f"清理缩略图失败: {file_path}, 错误: {e}")
+        # 清理旧布局留下的空目录
+        if rel_dir != '.' and not in_shard:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+    with open(os.path.join(THUMBNAIL_DIR, STORE_MARKER), 'w', encoding='utf-8') as f:
+        f.write('1')
+    print(f"旧版缩略图清理完成: 清理 {removed} 张")
+
+def _over_budget():
+    """缩略图存储是否已超过容量上限（结果缓存 5 秒）"""
+    if not THUMBNAIL_BUDGET_MB:
+        return False
+    now = time.time()
+    if now - _budget_check[0] >= 5:
+        _budget_check[:] = [now, catalog.get_thumbnail_totals()[1] > THUMBNAIL_BUDGET_MB * 1024 * 1024]
+    return _budget_check[1]
+
+def enforce_budget(dry_run=False, exclude=()):
+    """容量超限时按最近使用时间淘汰，直到降到上限的 90%，返回 {'count', 'bytes'}（exclude 中的键视为已删除）"""
+    result = {'count': 0, 'bytes': 0}
+    if not THUMBNAIL_BUDGET_MB:
+        return result
+    flush_served()
+    exclude = set(exclude)
+    total = 0
+    records = []
+    for key, size in catalog.iter_thumbnails_by_use():
+        if key not in exclude:
+            total += size
+            records.append((key, size))
+    target = THUMBNAIL_BUDGET_MB * 1024 * 1024
+    if total <= target:
+        return result
+    target *= 0.9
+    with _inflight_lock:
+        busy = set(_inflight)
+    evicted = []
+    for key, size in records:
+        if total <= target:
+            break
+        if key in busy:
+            continue
+        evicted.append(key)
+        total -= size
+        result['bytes'] += size
+    result['count'] = len(evicted)
+    if not dry_run and evicted:
+        catalog.delete_thumbnail_records(evicted)
+        _remove_files(evicted)
+        _budget_check[0] = 0
+        print(f"缩略图容量超过 {THUMBNAIL_BUDGET_MB}MB，已淘汰 {len(evicted)} 张最久未使用的缩略图"
+              f"（{result['bytes'] / 1024 / 1024:.1f}MB）")
+    return result
+
+def collect_garbage(dry_run=True):
+    """清理缩略图存储，返回各类可清理项的数量与字节数；dry_run 时只统计不删除
+
+    依次检查：原图已不存在、原图已变化（旧版本）、规格已修改或移除的登记，文件已丢失的登记，
+    没有登记的文件（写入中途退出等留下的，1 分钟内的新文件跳过），最后按容量上限淘汰最久未使用的缩略图
+    """
+    started = time.time()
+    current_profiles = set(get_profile_ids())
+    with _inflight_lock:
+        busy = set(_inflight)
+    report = {'dry_run': dry_run}
+    garbage = {'missing_source': [], 'outdated': [], 'stale_profile': []}
+    records = catalog.list_thumbnail_records()
+    for record in records:
+        if record['key'] in busy:
+            continue
+        if record['gone']:
+            garbage['missing_source'].append(record)
+        elif record['outdated']:
+            garbage['outdated'].append(record)
+        elif record['profile'] not in current_profiles:
+            garbage['stale_profile'].append(record)
+
+    # 对照存储目录中的实际文件
+    files = {}
+    for root, dirs, names in os.walk(THUMBNAIL_DIR):
+        for name in names:
+            if name != STORE_MARKER:
+                files[name] = os.path.join(root, name)
+    recorded = set()
+    garbage['missing_file'] = []
+    for record in records:
+        name = os.path.basename(get_thumbnail_path(record['key']))
+        recorded.add(name)
+        if name not in files:
+            garbage['missing_file'].append(record)
+    orphans = []
+    for name, file_path in files.items():
+        if name in recorded:
+            continue
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        if started - stat.st_mtime >= 60:
+            orphans.append((file_path, stat.st_size))
+
+    removed_keys = []
+    for category, items in garbage.items():
+        report[category] = {'count': len(items), 'bytes': sum(item['bytes'] for item in items)}
+        removed_keys.extend(item['key'] for item in items)
+    report['orphan_file'] = {'count': len(orphans), 'bytes': sum(size for file_path, size in orphans)}
+    if not dry_run:
+        catalog.delete_thumbnail_records(removed_keys)
+        _remove_files(removed_keys)
+        for file_path, size in orphans:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+    total = sum(record['bytes'] for record in records)
+    report['evicted'] = enforce_budget(dry_run, exclude=removed_keys)
+    freed = sum(report[category]['bytes'] for category in garbage) + report['evicted']['bytes']
+    report.update({
+        'total_bytes': total,
+        'total_bytes_after': total - freed,
+        'budget_bytes': THUMBNAIL_BUDGET_MB * 1024 * 1024,
+        'elapsed': round(time.time() - started, 3)
+    })
+    if not dry_run:
+        count = sum(report[category]['count'] for category in list(garbage) + ['orphan_file'])
+        if count:
+            print(f"缩略图清理完成: 删除 {count} 项，释放 {(freed + report['orphan_file']['bytes']) / 1024 / 1024:.1f}MB")
+    return report
+
+def generate_all_thumbnails():
+    """为所有单元排队生成预生成规格的缩略图（最低优先级，正在浏览的文件夹和新变化的单元优先）"""
+    migrate_legacy_thumbnails()
+    # 服务未运行期间删除或修改的原图、修改过的规格留下的缩略图在这里清理
+    collect_garbage(dry_run=False)
+    paths = [row[0] for row in catalog.get_connection().execute("SELECT path FROM units")]
+    schedule_thumbnails(paths, PRIORITY_BACKGROUND)
+    print(f"已为 {len(paths)} 个单元排队生成缩略图（{get_worker_count()} 个进程）")
+
+def on_catalog_changed(changed, removed, folders):
+    """单元索引变化时：为新增或变化的单元排队生成缩略图，删除已移除单元的缩略图，丢弃相关文件夹的缩略图包"""
+    _drop_batches({catalog.parent_of(path) for path in list(changed) + list(removed)} | set(folders))
+    if removed:
+        discard_thumbnails(removed)
+    if changed:
+        schedule_thumbnails(changed, PRIORITY_CHANGED)
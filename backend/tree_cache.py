@@ -0,0 +1,131 @@
+# 目录树缓存模块
+# 每种排序方式的目录树常驻内存，文件夹变化时只失效对应子树及其祖先链
+import json
+import hashlib
+import threading
+from . import catalog
+
+_lock = threading.RLock()
+_children = {}       # 文件夹路径 -> 子文件夹记录列表（来自单元索引）
+_loaded = False      # 是否已整体加载过文件夹记录
+_nodes = {}          # 排序方式 -> {文件夹路径: 已构建的子树节点列表}
+_payloads = {}       # 排序方式 -> (ETag, 序列化后的响应体)
+
+def _sort_options(sort_type):
+    if sort_type in ('date-desc', 'date-asc'):
+        return (lambda row: row['modified']), sort_type == 'date-desc'
+    return (lambda row: row['name']), sort_type == 'name-desc'
+
+def _load_all():
+    global _loaded
+    _children.clear()
+    rows = catalog.get_connection().execute(
+        "SELECT path, parent, name, modified FROM folders WHERE parent IS NOT NULL"
+    )
+    for row in rows:
+        _children.setdefault(row['parent'], []).append(dict(row))
+    _loaded = True
+
+def _get_children(path):
+    if not _loaded:
+        _load_all()
+    return _children.get(path, [])
+
+def _query_children(path):
+    rows = catalog.get_connection().execute(
+        "SELECT path, parent, name, modified FROM folders WHERE parent = ?", (path,)
+    )
+    return [dict(row) for row in rows]
+
+def _load_subtree(path):
+    # 新出现的文件夹（如重命名、整体移入）连同其下所有子文件夹一次性从索引读入
+    _purge_subtree(path)
+    rows = catalog.get_connection().execute(
+        "SELECT path, parent, name, modified FROM folders WHERE path >= ? AND path < ?", (path + '/', path + '0')
+    )
+    for row in rows:
+        _children.setdefault(row['parent'], []).append(dict(row))
+
+def _build(path, sort_type):
+    nodes = _nodes.setdefault(sort_type, {})
+    if path in nodes:
+        return nodes[path]
+    sort_key, reverse = _sort_options(sort_type)
+    result = [{
+        'name': row['name'],
+        'path': row['path'],
+        'children': _build(row['path'], sort_type)
+    } for row in sorted(_get_children(path), key=sort_key, reverse=reverse)]
+    nodes[path] = result
+    return result
+
+def _purge_subtree(path):
+    prefix = path + '/'
+    for key in [k for k in _children if k == path or k.startswith(prefix)]:
+        del _children[key]
+    for nodes in _nodes.values():
+        for key in [k for k in nodes if k == path or k.startswith(prefix)]:
+            del nodes[key]
+
+def get_tree(sort_type='name-asc'):
+    """获取目录树（内存缓存，未失效的子树直接复用）"""
+    with _lock:
+        return _build('', sort_type)
+
+def get_level(path='', sort_type='name-asc'):
+    """获取某个文件夹下一层的子文件夹，附带子文件夹数量与单元数量"""
+    path = catalog.normalize_path(path)
+    sort_key, reverse = _sort_options(sort_type)
+    with _lock:
+        rows = sorted(_get_children(path), key=sort_key, reverse=reverse)
+        child_counts = [len(_get_children(row['path'])) for row in rows]
+    unit_counts = catalog.count_units_by_folder([row['path'] for row in rows])
+    return [{
+        'name': row['name'],
+        'path': row['path'],
+        'has_children': child_count > 0,
+        'child_count': child_count,
+        'unit_count': unit_counts.get(row['path'], 0)
+    } for row, child_count in zip(rows, child_counts)]
+
+def get_tree_payload(sort_type='name-asc'):
+    """获取目录树响应体及其 ETag"""
+    with _lock:
+        cached = _payloads.get(sort_type)
+        if cached:
+            return cached
+        body = json.dumps({'tree': _build('', sort_type)}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        _payloads[sort_type] = (etag, body)
+        return etag, body
+
+def invalidate(path):
+    """文件夹的子目录列表变化：重新读取该文件夹的子目录，并失效它及其祖先的已构建节点"""
+    path = catalog.normalize_path(path)
+    with _lock:
+        if _loaded:
+            old = {row['path'] for row in _children.get(path, [])}
+            rows = _query_children(path)
+            if rows:
+                _children[path] = rows
+            else:
+                _children.pop(path, None)
+            current = {row['path'] for row in rows}
+            # 已消失（删除或重命名）的子文件夹整棵子树作废，新出现的子文件夹整棵子树读入
+            for gone in old - current:
+                _purge_subtree(gone)
+            for added in current - old:
+                _load_subtree(added)
+        for nodes in _nodes.values():
+            current = path
+            while True:
+                nodes.pop(current, None)
+                if not current:
+                    break
+                current = catalog.parent_of(current)
+        _payloads.clear()
+
+def on_catalog_changed(changed, removed, folders):
+    """单元索引中文件夹变化时按子树失效目录树缓存"""
+    for path in folders:
+        invalidate(path)
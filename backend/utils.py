@@ -1,6 +1,8 @@
 import os
+import re
+import json
 import threading
-from .config import IMAGE_DIR, THUMBNAIL_DIR, ALLOWED_EXTENSIONS
+from .config import IMAGE_DIR, ALLOWED_EXTENSIONS
 from PIL import Image
 
 def get_safe_filename(filename):
@@ -17,13 +19,60 @@ def get_safe_filename(filename):
         filename = name[:200-len(ext)] + ext
     return filename.strip() or 'unnamed'
 
-def create_thumbnail(image_path, size=(200, 200)):
-    """创建缩略图"""
+# 提示词按逗号（含中文逗号）和换行拆分为 SD 标签
+_TAG_SPLIT = re.compile(r'[,，\n]+')
+_TAG_WEIGHT = re.compile(r':\s*-?\d+(?:\.\d+)?')
+_NON_WORD = re.compile(r'[\W_]+')
+
+def tag_token(tag):
+    """将单个 SD 标签编码为索引词元（忽略大小写与权重，括号、空格、下划线等价）"""
+    return _NON_WORD.sub('_', _TAG_WEIGHT.sub('', tag.lower())).strip('_')
+
+def prompt_tag_tokens(value):
+    """提示词中所有标签的索引词元，以空格分隔"""
+    tokens = (tag_token(tag) for tag in _TAG_SPLIT.split(value or ''))
+    return ' '.join(token for token in tokens if token)
+
+def prompt_word_text(value):
+    """用于分词索引的提示词文本（下划线视为空格）"""
+    return (value or '').replace('_', ' ')
+
+def name_trigrams(name):
+    """名称的三元组集合（按单词拆分，词首补两个空格、词尾补一个空格，与 pg_trgm 一致）"""
+    grams = set()
+    for word in _NON_WORD.split((name or '').lower()):
+        if word:
+            padded = f"  {word} "
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def substring_trigrams(text):
+    """名称包含 text 时名称三元组中必然出现的三元组（text 各单词内部的三元组，不含补位），text 过短时为空集"""
+    grams = set()
+    for word in _NON_WORD.split((text or '').lower()):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+def name_trigrams_json(name):
+    """三元组集合的 JSON 数组形式，供 SQLite 触发器通过 json_each 展开"""
+    return json.dumps(sorted(name_trigrams(name)), ensure_ascii=False)
+
+def create_thumbnail(image_path, size=(200, 200), reducing_gap=2.0):
+    """创建缩略图
+
+    两步缩小：先用廉价的整数倍缩小（JPEG 通过 draft 直接以 1/2、1/4、1/8 比例解码，其他格式用 reduce），
+    保留目标尺寸 reducing_gap 倍的余量，再用 LANCZOS 完成最后一步；reducing_gap 为 None 时全程 LANCZOS
+    """
     try:
         with Image.open(image_path) as img:
+            if img.format == 'JPEG' and reducing_gap:
+                # 在解码前设置 draft，CMYK 等 JPEG 也由解码器直接输出 RGB
+                img.draft('RGB', (int(size[0] * reducing_gap), int(size[1] * reducing_gap)))
+            # 比目标尺寸小的图片 thumbnail 不会解码，先读入内存，离开 with 后文件已关闭
+            img.load()
             # 转换为RGB模式（如果需要）
             if img.mode in ('RGBA', 'LA', 'P'):
-                # 创建白色背景
+                # 创建白色背景（在原尺寸上合成比缩小带透明通道的图片更快）
                 background = Image.new('RGB', img.size, (255, 255, 255))
                 if img.mode == 'P':
                     img = img.convert('RGBA')
@@ -31,255 +80,181 @@ def create_thumbnail(image_path, size=(200, 200)):
                 img = background
             
             # 保持宽高比
-            img.thumbnail(size, Image.Resampling.LANCZOS)
+            img.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
             
             return img
     except Exception as e:
         print(f"缩略图创建失败: {e}")
         return None
 
-def get_directory_tree(base_path, sort_type='name-asc'):
-    """获取目录树结构"""
-    def build_tree(path):
-        tree = []
-        try:
-            if not os.path.exists(path):
-                # 目录不存在时返回空列表而不是报错
-                return tree
-                
-            items = os.listdir(path)
-            dirs = [item for item in items if os.path.isdir(os.path.join(path, item))]
-            
-            # 根据排序类型进行排序
-            if sort_type == 'name-asc':
-                dirs.sort()
-            elif sort_type == 'name-desc':
-                dirs.sort(reverse=True)
-            elif sort_type == 'date-desc' or sort_type == 'date-asc':
-                # 按修改时间排序
-                dirs_with_time = []
-                for dir_name in dirs:
-                    dir_path = os.path.join(path, dir_name)
-                    try:
-                        modified_time = os.path.getmtime(dir_path)
-                    except:
-                        modified_time = 0
-                    dirs_with_time.append((dir_name, modified_time))
-                
-                # 按修改时间排序
-                dirs_with_time.sort(key=lambda x: x[1], reverse=(sort_type == 'date-desc'))
-                dirs = [item[0] for item in dirs_with_time]
-            else:
-                # 默认按名称升序
-                dirs.sort()
-            
-            for dir_name in dirs:
-                dir_path = os.path.join(path, dir_name)
-                relative_path = os.path.relpath(dir_path, base_path).replace('\\', '/')
-                tree.append({
-                    'name': dir_name,
-                    'path': relative_path,
-                    'children': build_tree(dir_path)
-                })
-        except PermissionError:
-            print(f"无权限访问目录: {path}")
-        except Exception as e:
-            print(f"读取目录时出错: {path}, 错误: {e}")
-        return tree
-    
-    return build_tree(base_path)
+def render_thumbnail(image_path, thumbnail_path, size, quality, reducing_gap=2.0, image_format='JPEG', options=None):
+    """生成缩略图并原子写入（先写临时文件再改名，可在子进程中执行），返回文件大小，失败时返回 None
 
-def get_files_in_directory(directory_path):
-    """获取目录中的文件列表"""
-    files = []
+    options 为额外的编码参数（如 WebP 的 method、AVIF 的 speed）
+    """
+    thumbnail = create_thumbnail(image_path, size, reducing_gap)
+    if not thumbnail:
+        return None
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    temp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        if not os.path.exists(directory_path):
-            # 目录不存在时返回空列表而不是报错
-            return files
-            
-        items = os.listdir(directory_path)
-        # 分离文件和目录
-        file_items = [item for item in items if os.path.isfile(os.path.join(directory_path, item))]
-        # 只处理允许的扩展名的文件
-        image_files = [item for item in file_items if os.path.splitext(item)[1].lower() in ALLOWED_EXTENSIONS]
-        image_files.sort()
-        
-        for file_name in image_files:
-            name, ext = os.path.splitext(file_name)
-            file_path = os.path.join(directory_path, file_name)
-            relative_path = os.path.relpath(file_path, IMAGE_DIR).replace('\\', '/')
-            
-            # 读取对应的txt文件内容
-            txt_path = os.path.join(directory_path, f"{name}.txt")
-            txt_content = ""
-            if os.path.exists(txt_path):
-                try:
-                    with open(txt_path, 'r', encoding='utf-8') as f:
-                        txt_content = f.read().strip()
-                except Exception as e:
-                    print(f"读取txt文件失败: {e}")
-            
-            # 获取文件修改时间
-            try:
-                modified_time = os.path.getmtime(file_path)
-            except:
-                modified_time = 0
-            
-            files.append({
-                'name': name,
-                'path': relative_path,
-                'value': txt_content,
-                'modified': modified_time
-            })
-    except PermissionError:
-        print(f"无权限访问目录: {directory_path}")
+        thumbnail.save(temp_path, image_format, quality=quality, **(options or {}))
+        os.replace(temp_path, thumbnail_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return os.path.getsize(thumbnail_path)
+
+def source_version(modified, size):
+    """原图版本号（由 mtime 和大小计算），与单元索引中的 modified/size 一致，用于带版本的图片地址"""
+    return f"{int(modified * 1000):x}-{size:x}"
+
+def source_etag(stat):
+    """原图的强校验值（纳秒 mtime、大小与 inode），原地替换为同样大小和 mtime 的文件时也会变化"""
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{stat.st_ino:x}"
+
+def pack_columns(items):
+    """将条目列表转换为列式结构：键名只出现一次，path 只保留公共文件夹前缀之后的部分
+
+    返回 {'count': 条数, 'prefix': 公共前缀, 'columns': {字段: 值数组}}，缺少某字段的条目在该列中为 None
+    """
+    keys = []
+    for item in items:
+        for key in item:
+            if key not in keys:
+                keys.append(key)
+    columns = {key: [item.get(key) for item in items] for key in keys}
+    prefix = ''
+    if 'path' in columns:
+        prefix = os.path.commonprefix(columns['path'])
+        prefix = prefix[:prefix.rfind('/') + 1]
+        columns['path'] = [path[len(prefix):] for path in columns['path']]
+    return {'count': len(items), 'prefix': prefix, 'columns': columns}
+
+def read_prompt(txt_path):
+    """读取单元配对的txt提示词，文件不存在时返回空字符串"""
+    if not os.path.exists(txt_path):
+        return ""
+    try:
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
     except Exception as e:
-        print(f"读取目录文件时出错: {directory_path}, 错误: {e}")
-    
-    return files
+        print(f"读取txt文件失败: {e}")
+        return ""
 
-def search_all_files(query):
-    """全局搜索文件名和内容"""
-    from .config import ALLOWED_EXTENSIONS, IMAGE_DIR
-    
-    results = []
-    query_lower = query.lower()
-    
-    # 存储匹配的文件夹路径
-    matched_folders = set()  # 使用set避免重复
-    
-    # 第一步：优先搜索单元名（文件名）
-    for root, dirs, files in os.walk(IMAGE_DIR):
-        # 检查当前目录是否存在
-        if not os.path.exists(root):
-            continue
-            
-        for file in files:
-            name, ext = os.path.splitext(file)
-            if ext.lower() in ALLOWED_EXTENSIONS:
-                # 模糊搜索文件名
-                if query_lower in name.lower():
-                    file_path = os.path.join(root, file)
-                    txt_path = os.path.join(root, f"{name}.txt")
-                    txt_content = ""
-                    
-                    if os.path.exists(txt_path):
-                        try:
-                            with open(txt_path, 'r', encoding='utf-8') as f:
-                                txt_content = f.read().strip()
-                        except:
-                            pass
-                    
-                    try:
-                        modified_time = os.path.getmtime(file_path)
-                    except:
-                        modified_time = 0
-                    
-                    relative_path = os.path.relpath(file_path, IMAGE_DIR).replace('\\', '/')
-                    
-                    results.append({
-                        'name': name,
-                        'path': relative_path,
-                        'value': txt_content,
-                        'modified': modified_time,
-                        'is_dir': False
-                    })
-    
-    # 第二步：搜索菜单名（文件夹名）
-    for root, dirs, files in os.walk(IMAGE_DIR):
-        # 检查当前目录是否存在
-        if not os.path.exists(root):
-            continue
-            
-        for dir_name in dirs:
-            # 模糊搜索文件夹名
-            if query_lower in dir_name.lower():
-                dir_path = os.path.join(root, dir_name)
-                relative_path = os.path.relpath(dir_path, IMAGE_DIR).replace('\\', '/')
-                matched_folders.add(dir_path)  # 添加到匹配的文件夹集合
-                
-                results.append({
-                    'name': dir_name,
-                    'path': relative_path,
-                    'value': '📁 文件夹匹配',
-                    'modified': 0,
-                    'is_dir': True
-                })
-    
-    # 第三步：如果搜索词匹配了某个文件夹，展示该文件夹下的所有单元
-    for folder_path in matched_folders:
-        try:
-            if not os.path.exists(folder_path):
+def natural_sort_key(name):
+    """自然排序键：忽略大小写，数字按数值比较（img2 排在 img10 之前）"""
+    return re.sub(r'\d+', lambda m: m.group().zfill(20), name.casefold())
+
+def read_image_size(image_path):
+    """只解析文件头读取图片尺寸，无法识别时返回 (0, 0)"""
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except Exception:
+        return 0, 0
+
+def same_unit_stats(unit, known):
+    """比较单元的图片/txt 的 mtime 与大小是否与已知记录一致（尚未记录图片尺寸的旧记录视为不一致）"""
+    return (known is not None
+            and known['modified'] == unit['modified'] and known['size'] == unit['size']
+            and known['txt_modified'] == unit['txt_modified'] and known['txt_size'] == unit['txt_size']
+            and known['width'] is not None)
+
+def scan_directory(directory_path, known=None):
+    """扫描单个目录，按配对规则返回 (单元记录列表, 子目录名列表)
+
+    known 为 {相对路径: 已知记录}，mtime 与大小均未变化的单元直接复用已知的提示词和图片尺寸，不再读取文件
+    """
+    units = []
+    subdirs = []
+    if not os.path.exists(directory_path):
+        # 目录不存在时返回空列表而不是报错
+        return units, subdirs
+
+    folder = os.path.relpath(directory_path, IMAGE_DIR).replace('\\', '/')
+    if folder == '.':
+        folder = ''
+
+    # 一次 scandir 同时拿到文件类型和 stat 信息
+    images = []
+    txt_stats = {}
+    with os.scandir(directory_path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+                name, ext = os.path.splitext(entry.name)
+                ext_lower = ext.lower()
+                if ext_lower in ALLOWED_EXTENSIONS:
+                    images.append((entry.name, name, ext, entry.stat()))
+                elif ext_lower == '.txt':
+                    txt_stats[name] = entry.stat()
+            except OSError:
                 continue
-                
-            folder_files = os.listdir(folder_path)
-            for file in folder_files:
-                name, ext = os.path.splitext(file)
-                if ext.lower() in ALLOWED_EXTENSIONS:
-                    file_path = os.path.join(folder_path, file)
-                    txt_path = os.path.join(folder_path, f"{name}.txt")
-                    txt_content = ""
-                    
-                    if os.path.exists(txt_path):
-                        try:
-                            with open(txt_path, 'r', encoding='utf-8') as f:
-                                txt_content = f.read().strip()
-                        except:
-                            pass
-                    
-                    try:
-                        modified_time = os.path.getmtime(file_path)
-                    except:
-                        modified_time = 0
-                    
-                    relative_path = os.path.relpath(file_path, IMAGE_DIR).replace('\\', '/')
-                    
-                    # 避免重复添加（检查路径是否已存在）
-                    if not any(item['path'] == relative_path for item in results):
-                        results.append({
-                            'name': name,
-                            'path': relative_path,
-                            'value': txt_content,
-                            'modified': modified_time,
-                            'is_dir': False
-                        })
-        except PermissionError:
-            print(f"无权限访问目录: {folder_path}")
-        except Exception as e:
-            print(f"搜索文件夹内容时出错: {folder_path}, 错误: {e}")
-    
-    # 按照是否为文件夹和修改时间排序，文件夹在前，然后按修改时间倒序排列
-    results.sort(key=lambda x: (not x['is_dir'], -x['modified']))
-    
-    return results
+    images.sort()
+
+    for file_name, name, ext, stat in images:
+        relative_path = f"{folder}/{file_name}" if folder else file_name
+        txt_stat = txt_stats.get(name)
+        unit = {
+            'name': name,
+            'path': relative_path,
+            'folder': folder,
+            'ext': ext,
+            'value': "",
+            'modified': stat.st_mtime,
+            'size': stat.st_size,
+            'txt_modified': txt_stat.st_mtime if txt_stat else 0,
+            'txt_size': txt_stat.st_size if txt_stat else 0,
+            'natural_name': natural_sort_key(name),
+            'width': 0,
+            'height': 0
+        }
+        previous = known.get(relative_path) if known else None
+        if same_unit_stats(unit, previous):
+            unit['value'] = previous['value']
+            unit['width'], unit['height'] = previous['width'], previous['height']
+        else:
+            if txt_stat is not None:
+                unit['value'] = read_prompt(os.path.join(directory_path, f"{name}.txt"))
+            unit['width'], unit['height'] = read_image_size(os.path.join(directory_path, file_name))
+        units.append(unit)
+    return units, subdirs
+
+def scan_single_unit(directory_path, file_name):
+    """按配对规则读取目录中的单个单元，图片不存在时返回 None"""
+    name, ext = os.path.splitext(file_name)
+    if ext.lower() not in ALLOWED_EXTENSIONS:
+        return None
+    try:
+        stat = os.stat(os.path.join(directory_path, file_name))
+    except OSError:
+        return None
+    txt_path = os.path.join(directory_path, f"{name}.txt")
+    try:
+        txt_stat = os.stat(txt_path)
+    except OSError:
+        txt_stat = None
 
-def generate_all_thumbnails():
-    """批量生成所有图片的缩略图（后台线程执行）"""
-    print("开始批量生成缩略图...")
-    count = 0
-    for root, dirs, files in os.walk(IMAGE_DIR):
-        for file in files:
-            name, ext = os.path.splitext(file)
-            if ext.lower() in ALLOWED_EXTENSIONS:
-                try:
-                    image_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(image_path, IMAGE_DIR).replace('\\', '/')
-                    thumbnail_name = get_safe_filename(name) + '.jpg'
-                    thumbnail_path = os.path.join(THUMBNAIL_DIR, relative_path.replace(ext, '.jpg'))
-                    thumbnail_dir = os.path.dirname(thumbnail_path)
-                    
-                    # 确保缩略图目录存在
-                    os.makedirs(thumbnail_dir, exist_ok=True)
-                    
-                    # 检查缩略图是否需要重新生成
-                    if not os.path.exists(thumbnail_path) or os.path.getmtime(image_path) > os.path.getmtime(thumbnail_path):
-                        thumbnail = create_thumbnail(image_path)
-                        if thumbnail:
-                            thumbnail.save(thumbnail_path, 'JPEG', quality=85)
-                            count += 1
-                            if count % 50 == 0:
-                                print(f"已生成 {count} 张缩略图...")
-                except Exception as e:
-                    print(f"生成缩略图失败: {image_path}, 错误: {e}")
-    
-    print(f"缩略图生成完成，共生成 {count} 张缩略图")
\ No newline at end of file
+    folder = os.path.relpath(directory_path, IMAGE_DIR).replace('\\', '/')
+    if folder == '.':
+        folder = ''
+    width, height = read_image_size(os.path.join(directory_path, file_name))
+    return {
+        'name': name,
+        'path': f"{folder}/{file_name}" if folder else file_name,
+        'folder': folder,
+        'ext': ext,
+        'value': read_prompt(txt_path) if txt_stat else "",
+        'modified': stat.st_mtime,
+        'size': stat.st_size,
+        'txt_modified': txt_stat.st_mtime if txt_stat else 0,
+        'txt_size': txt_stat.st_size if txt_stat else 0,
+        'natural_name': natural_sort_key(name),
+        'width': width,
+        'height': height
+    }
@@ -0,0 +1,190 @@
+# 文件系统监听模块
+# 将 images/ 下的增删改名事件按目录合并后推送到单元索引，请求路径上不做任何轮询
+import os
+import sys
+import time
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from .config import IMAGE_DIR, WATCHER_BACKEND, WATCHER_POLL_INTERVAL, WATCHER_FULL_INTERVAL, WATCHER_DEBOUNCE
+from . import catalog
+
+# inotify 事件常量
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+# 单批最长等待时间，避免持续写入时一直不刷新
+MAX_BATCH_DELAY = 5
+
+class InotifyWatcher:
+    """基于 Linux inotify 的监听器，每个目录一个 watch"""
+
+    name = 'inotify'
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        self.watches = {}   # wd -> 相对目录
+        self.paths = {}     # 相对目录 -> wd
+        self.dirty = set()
+        self.overflow = False
+        self.running = False
+
+    def add_watch(self, rel_dir):
+        if rel_dir in self.paths:
+            return
+        full_dir = os.path.join(IMAGE_DIR, rel_dir) if rel_dir else IMAGE_DIR
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(full_dir), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'无法监听目录: {full_dir}')
+        self.watches[wd] = rel_dir
+        self.paths[rel_dir] = wd
+
+    def sync_watches(self):
+        """按单元索引中的文件夹列表补齐 watch"""
+        conn = catalog.get_connection()
+        folders = [row[0] for row in conn.execute("SELECT path FROM folders")]
+        for rel_dir in folders:
+            try:
+                self.add_watch(rel_dir)
+            except FileNotFoundError:
+                continue
+
+    def read_events(self):
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            # 只需要按目录合并，跳过事件中的文件名
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflow = True
+                continue
+            rel_dir = self.watches.get(wd)
+            if rel_dir is None:
+                continue
+            if mask & IN_IGNORED:
+                # 目录已被删除或移走，watch 自动失效
+                self.watches.pop(wd, None)
+                if self.paths.get(rel_dir) == wd:
+                    del self.paths[rel_dir]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.dirty.add(catalog.parent_of(rel_dir))
+                continue
+            self.dirty.add(rel_dir)
+
+    def run(self):
+        self.running = True
+        self.sync_watches()
+        first_event = None
+        while self.running:
+            ready, _, _ = select.select([self.fd], [], [], WATCHER_DEBOUNCE)
+            if ready:
+                self.read_events()
+                if first_event is None:
+                    first_event = time.time()
+                # 事件仍在持续到达时继续合并，直到静默或达到最长等待时间
+                if time.time() - first_event < MAX_BATCH_DELAY:
+                    continue
+            if self.overflow:
+                self.overflow = False
+                self.dirty.clear()
+                first_event = None
+                catalog.reconcile_catalog()
+                self.sync_watches()
+                continue
+            if self.dirty:
+                batch, self.dirty = self.dirty, set()
+                first_event = None
+                process_batch(batch)
+                self.sync_watches()
+
+    def stop(self):
+        self.running = False
+
+class PollingWatcher:
+    """轮询监听器：周期性按目录 mtime 增量对账（Windows 等无 inotify 的平台）
+
+    原地修改的txt不改变目录 mtime，每隔 full_interval 秒做一次完整对账（列出所有目录，只重新读取变化的文件）
+    """
+
+    name = 'polling'
+
+    def __init__(self, interval=WATCHER_POLL_INTERVAL, full_interval=WATCHER_FULL_INTERVAL):
+        self.interval = interval
+        self.full_interval = full_interval
+        self.running = False
+
+    def run(self):
+        self.running = True
+        last_full = time.time()
+        while self.running:
+            time.sleep(self.interval)
+            full = bool(self.full_interval) and time.time() - last_full >= self.full_interval
+            try:
+                catalog.reconcile_catalog(full=full, quiet=True)
+            except Exception as e:
+                print(f"轮询对账失败: {e}")
+            if full:
+                last_full = time.time()
+
+    def stop(self):
+        self.running = False
+
+def process_batch(dirs):
+    """按目录处理一批变化：重新列出目录并同步到单元索引"""
+    # 先处理浅层目录：父目录会一并收录新出现的子目录、移除消失的子目录
+    for rel_dir in sorted(dirs, key=lambda d: d.count('/')):
+        try:
+            catalog.refresh_directory(rel_dir)
+        except Exception as e:
+            print(f"同步目录变化失败: {rel_dir}, 错误: {e}")
+
+def create_watcher(backend=WATCHER_BACKEND):
+    """根据配置创建监听器，inotify 不可用时回退到轮询"""
+    if backend == 'off':
+        return None
+    if backend in ('auto', 'inotify') and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用，改用轮询监听: {e}")
+    return PollingWatcher()
+
+def start_watcher():
+    """在后台线程中启动文件系统监听"""
+    watcher = create_watcher()
+    if watcher is None:
+        return None
+
+    def run():
+        try:
+            watcher.run()
+        except OSError as e:
+            # watch 数量超出系统限制等情况下回退到轮询
+            print(f"{watcher.name} 监听失败，改用轮询: {e}")
+            PollingWatcher().run()
+
+    threading.Thread(target=run, daemon=True).start()
+    print(f"文件系统监听已启动: {watcher.name}")
+    return watcher
@@ -0,0 +1,192 @@
+# 搜索基准测试
+# 在临时目录生成合成图集，对比旧版 search_all_files（每次搜索遍历文件系统，两次遍历 + 线性去重）
+# 与 /api/search 实际使用的单元索引搜索（search_index.search_page 第一页、iter_search 全部结果、fuzzy_search 容错搜索），
+# 并单独统计提示词标签查询的第一页与游标翻页耗时
+#
+# 用法：python benchmarks/bench_search.py [--units 100000] [--per-folder 100] [--query 查询词]
+# 旧版线性去重的最坏情况可用 --query folder_0（全部文件夹命中，10 万单元下旧版约需数分钟）
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def legacy_search_all_files(query, image_dir, allowed_extensions):
+    """旧版实现（原样保留用于对比）"""
+    results = []
+    query_lower = query.lower()
+    matched_folders = set()
+
+    for root, dirs, files in os.walk(image_dir):
+        if not os.path.exists(root):
+            continue
+        for file in files:
+            name, ext = os.path.splitext(file)
+            if ext.lower() in allowed_extensions:
+                if query_lower in name.lower():
+                    file_path = os.path.join(root, file)
+                    txt_path = os.path.join(root, f"{name}.txt")
+                    txt_content = ""
+                    if os.path.exists(txt_path):
+                        try:
+                            with open(txt_path, 'r', encoding='utf-8') as f:
+                                txt_content = f.read().strip()
+                        except:
+                            pass
+                    try:
+                        modified_time = os.path.getmtime(file_path)
+                    except:
+                        modified_time = 0
+                    relative_path = os.path.relpath(file_path, image_dir).replace('\\', '/')
+                    results.append({
+                        'name': name,
+                        'path': relative_path,
+                        'value': txt_content,
+                        'modified': modified_time,
+                        'is_dir': False
+                    })
+
+    for root, dirs, files in os.walk(image_dir):
+        if not os.path.exists(root):
+            continue
+        for dir_name in dirs:
+            if query_lower in dir_name.lower():
+                dir_path = os.path.join(root, dir_name)
+                relative_path = os.path.relpath(dir_path, image_dir).replace('\\', '/')
+                matched_folders.add(dir_path)
+                results.append({
+                    'name': dir_name,
+                    'path': relative_path,
+                    'value': '📁 文件夹匹配',
+                    'modified': 0,
+                    'is_dir': True
+                })
+
+    for folder_path in matched_folders:
+        if not os.path.exists(folder_path):
+            continue
+        for file in os.listdir(folder_path):
+            name, ext = os.path.splitext(file)
+            if ext.lower() in allowed_extensions:
+                file_path = os.path.join(folder_path, file)
+                txt_path = os.path.join(folder_path, f"{name}.txt")
+                txt_content = ""
+                if os.path.exists(txt_path):
+                    try:
+                        with open(txt_path, 'r', encoding='utf-8') as f:
+                            txt_content = f.read().strip()
+                    except:
+                        pass
+                try:
+                    modified_time = os.path.getmtime(file_path)
+                except:
+                    modified_time = 0
+                relative_path = os.path.relpath(file_path, image_dir).replace('\\', '/')
+                if not any(item['path'] == relative_path for item in results):
+                    results.append({
+                        'name': name,
+                        'path': relative_path,
+                        'value': txt_content,
+                        'modified': modified_time,
+                        'is_dir': False
+                    })
+
+    results.sort(key=lambda x: (not x['is_dir'], -x['modified']))
+    return results
+
+def build_tree(image_dir, units, per_folder):
+    """生成合成图集：group_xx/folder_xxxx/img_xxxxxx.png + 同名 txt"""
+    folders = (units + per_folder - 1) // per_folder
+    created = 0
+    for folder_index in range(folders):
+        folder = os.path.join(image_dir, f"group_{folder_index // 100:02d}", f"folder_{folder_index:04d}")
+        os.makedirs(folder, exist_ok=True)
+        for _ in range(min(per_folder, units - created)):
+            name = f"img_{created:06d}"
+            open(os.path.join(folder, name + '.png'), 'wb').close()
+            with open(os.path.join(folder, name + '.txt'), 'w', encoding='utf-8') as f:
+                f.write(f"1girl, solo, tag_{created % 997}")
+            # 错开修改时间，使排序有意义
+            os.utime(os.path.join(folder, name + '.png'), (created, created))
+            created += 1
+
+def measure(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='对比旧版文件系统搜索与单元索引搜索')
+    parser.add_argument('--units', type=int, default=100000, help='合成单元数量')
+    parser.add_argument('--per-folder', type=int, default=100, help='每个文件夹的单元数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每个查询重复次数（取最快一次）')
+    parser.add_argument('--query', action='append', help='查询词，可多次指定')
+    args = parser.parse_args()
+    queries = args.query or [
+        'img_00001',    # 少量单元名命中
+        'img_01',       # 大量单元名命中
+        'folder_00',    # 100 个文件夹命中，展开其中单元
+    ]
+
+    work_dir = tempfile.mkdtemp(prefix='bench_search_')
+    try:
+        # 配置中的目录是相对当前工作目录的
+        os.chdir(work_dir)
+        sys.path.insert(0, PROJECT_ROOT)
+        from backend.config import IMAGE_DIR, ALLOWED_EXTENSIONS
+        from backend import catalog
+        from backend.search_index import search_page, iter_search, fuzzy_search, DEFAULT_SEARCH_ORDER
+
+        print(f"生成 {args.units} 个单元...")
+        start = time.perf_counter()
+        build_tree(IMAGE_DIR, args.units, args.per_folder)
+        print(f"生成完成，用时 {time.perf_counter() - start:.1f}s")
+
+        # 建立单元索引（服务启动时的首次对账，之后由文件监听增量维护）
+        catalog.init_catalog()
+        start = time.perf_counter()
+        catalog.reconcile_catalog(quiet=True)
+        print(f"建立单元索引，用时 {time.perf_counter() - start:.1f}s")
+
+        print(f"{'查询':<12}{'结果数':>8}{'旧版(s)':>12}{'首页(s)':>12}{'全部(s)':>12}{'加速':>8}")
+        for query in queries:
+            old_time, old_results = measure(
+                lambda: legacy_search_all_files(query, IMAGE_DIR, ALLOWED_EXTENSIONS), args.repeat)
+            page_time, _ = measure(lambda: search_page(query, per_page=200), args.repeat)
+            all_time, new_results = measure(lambda: list(iter_search(query)), args.repeat)
+            # 索引搜索还会命中提示词内容，只检查旧版结果都被包含
+            if not {item['path'] for item in old_results} <= {item['path'] for item in new_results}:
+                print(f"警告：查询 {query} 的索引搜索结果缺少旧版结果")
+            print(f"{query:<12}{len(new_results):>8}{old_time:>12.3f}{page_time:>12.3f}{all_time:>12.3f}"
+                  f"{old_time / page_time:>7.1f}x")
+
+        # 提示词查询（旧版不搜索提示词，只统计索引搜索）：少量命中的标签、全部命中的标签、带排除条件
+        print(f"{'提示词查询':<16}{'结果数':>8}{'首页(ms)':>12}{'翻页(ms)':>12}")
+        for query in ('"tag_5"', 'tag_5', '"1girl"', '"1girl" -tag_5'):
+            page_time, (files, pagination) = measure(lambda: search_page(query, per_page=200), args.repeat)
+            next_time = 0.0
+            if pagination['next_cursor']:
+                after = catalog.decode_unit_cursor(pagination['next_cursor'], DEFAULT_SEARCH_ORDER)
+                next_time, _ = measure(lambda: search_page(query, per_page=200, after=after), args.repeat)
+            total = ('~' if pagination['estimated'] else '') + str(pagination['total'])
+            print(f"{query:<16}{total:>8}{page_time * 1000:>12.1f}{next_time * 1000:>12.1f}")
+
+        # 容错搜索：漏掉一个字符的单元名、字母顺序颠倒的文件夹名
+        for typo in ('img_0123', 'fodler_0042'):
+            fuzzy_time, results = measure(lambda: fuzzy_search(typo, 20), args.repeat)
+            best = results[0]['name'] if results else '-'
+            print(f"容错搜索 {typo:<12}{len(results):>6} 个结果，最佳 {best}，用时 {fuzzy_time:.3f}s")
+    finally:
+        os.chdir(PROJECT_ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
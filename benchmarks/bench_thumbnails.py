@@ -0,0 +1,140 @@
+# 缩略图生成基准测试
+# 1. 在临时目录生成合成原图（JPEG / PNG / 带透明通道 PNG / WebP），对比全程 LANCZOS（完整解码）与两步缩小
+#    （JPEG draft 解码 + reduce 预缩小 + LANCZOS）在不同 reducing_gap 下的速度与画质（以全程 LANCZOS 结果为基准的 PSNR）
+# 2. 按卡片规格对比各输出格式（规格自身格式与 Accept 协商格式）的编码耗时和每页 200 张卡片的传输字节数
+#
+# 用法：python benchmarks/bench_thumbnails.py [--width 1024] [--height 1536] [--repeat 5] [--gap 2.0]
+#       [--source-dir images] [--limit 200]
+# 格式对比默认使用合成原图，合成图过于平滑，--source-dir 指向真实图集时结果更有参考价值
+import io
+import os
+import sys
+import glob
+import math
+import time
+import shutil
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def build_sources(work_dir, width, height):
+    """生成合成原图：曼德博集合 + 渐变 + 模糊噪声，兼顾细节与平滑区域"""
+    from PIL import Image, ImageFilter, ImageChops
+
+    base = Image.effect_mandelbrot((width, height), (-2.2, -1.4, 0.8, 1.4), 64).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), 48).convert('RGB').filter(ImageFilter.GaussianBlur(2))
+    image = ImageChops.add(Image.blend(base, gradient, 0.4), noise, scale=1.5)
+
+    sources = {}
+    sources['jpeg'] = os.path.join(work_dir, 'source.jpg')
+    image.save(sources['jpeg'], quality=92)
+    sources['jpeg-2x'] = os.path.join(work_dir, 'source_2x.jpg')
+    image.resize((width * 2, height * 2), Image.Resampling.BICUBIC).save(sources['jpeg-2x'], quality=92)
+    sources['png'] = os.path.join(work_dir, 'source.png')
+    image.save(sources['png'])
+    sources['png-alpha'] = os.path.join(work_dir, 'source_alpha.png')
+    alpha = Image.radial_gradient('L').resize((width, height))
+    rgba = image.copy()
+    rgba.putalpha(ImageChops.invert(alpha))
+    rgba.save(sources['png-alpha'])
+    sources['webp'] = os.path.join(work_dir, 'source.webp')
+    image.save(sources['webp'], quality=90)
+    return sources
+
+def psnr(reference, image):
+    """峰值信噪比（dB），尺寸不一致时返回 None"""
+    from PIL import ImageChops, ImageStat
+
+    if reference.size != image.size:
+        return None
+    mse = sum(ImageStat.Stat(ImageChops.difference(reference, image).convert('RGB')).sum2) / (
+        reference.size[0] * reference.size[1] * 3)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def measure(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def compare_formats(paths, limit):
+    """按卡片规格生成缩略图，比较各输出格式的平均字节数与编码耗时"""
+    from backend.config import ALLOWED_EXTENSIONS
+    from backend.utils import create_thumbnail
+    from backend.thumbnails import DEFAULT_PROFILE, THUMBNAIL_PROFILES, variant_settings, get_accept_formats
+
+    spec = THUMBNAIL_PROFILES[DEFAULT_PROFILE]
+    paths = [path for path in paths if os.path.splitext(path)[1].lower() in ALLOWED_EXTENSIONS][:limit]
+    thumbnails = [create_thumbnail(path, spec['size'], spec.get('reducing_gap')) for path in paths]
+    thumbnails = [thumbnail for thumbnail in thumbnails if thumbnail]
+    if not thumbnails:
+        print("没有可用的原图")
+        return
+    print(f"\n{DEFAULT_PROFILE} 规格 {spec['size'][0]}x{spec['size'][1]}，{len(thumbnails)} 张原图")
+    print(f"{'格式':<8}{'平均字节':>10}{'200 张(KB)':>12}{'节省':>8}{'编码 ms/张':>12}")
+    baseline = None
+    for image_format in [None] + get_accept_formats():
+        image_format, quality, options = variant_settings(DEFAULT_PROFILE, image_format)
+        total = 0
+        start = time.perf_counter()
+        for thumbnail in thumbnails:
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, image_format, quality=quality, **options)
+            total += buffer.tell()
+        elapsed = (time.perf_counter() - start) / len(thumbnails)
+        average = total / len(thumbnails)
+        baseline = baseline or average
+        print(f"{image_format:<8}{average:>10.0f}{average * 200 / 1024:>12.0f}{1 - average / baseline:>8.0%}"
+              f"{elapsed * 1000:>12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='对比缩略图生成的全程 LANCZOS 与两步缩小')
+    parser.add_argument('--width', type=int, default=1024, help='合成原图宽度')
+    parser.add_argument('--height', type=int, default=1536, help='合成原图高度')
+    parser.add_argument('--size', type=int, default=200, help='缩略图最大边长')
+    parser.add_argument('--repeat', type=int, default=5, help='每项重复次数（取最快一次）')
+    parser.add_argument('--gap', type=float, action='append', help='reducing_gap，可多次指定')
+    parser.add_argument('--source-dir', help='格式对比使用的真实图集目录（递归查找图片）')
+    parser.add_argument('--limit', type=int, default=200, help='格式对比最多使用的原图数量')
+    args = parser.parse_args()
+    source_dir = os.path.abspath(args.source_dir) if args.source_dir else None
+    gaps = args.gap or [1.5, 2.0, 3.0]
+    size = (args.size, args.size)
+
+    work_dir = tempfile.mkdtemp(prefix='bench_thumbnails_')
+    try:
+        # 配置中的目录是相对当前工作目录的
+        os.chdir(work_dir)
+        sys.path.insert(0, PROJECT_ROOT)
+        from backend.utils import create_thumbnail
+
+        sources = build_sources(work_dir, args.width, args.height)
+        print(f"原图 {args.width}x{args.height}（jpeg-2x 为两倍尺寸），缩略图 {args.size}x{args.size}")
+        print(f"{'原图':<12}{'方式':<14}{'ms/张':>10}{'张/s':>10}{'PSNR(dB)':>10}")
+        for label, path in sources.items():
+            base_time, reference = measure(lambda: create_thumbnail(path, size, None), args.repeat)
+            print(f"{label:<12}{'LANCZOS':<14}{base_time * 1000:>10.1f}{1 / base_time:>10.1f}{'基准':>10}")
+            for gap in gaps:
+                elapsed, image = measure(lambda: create_thumbnail(path, size, gap), args.repeat)
+                quality = psnr(reference, image)
+                quality = '尺寸不同' if quality is None else f"{quality:.1f}"
+                print(f"{'':<12}{f'gap={gap:g}':<14}{elapsed * 1000:>10.1f}{1 / elapsed:>10.1f}{quality:>10}"
+                      f"  ({base_time / elapsed:.2f}x)")
+
+        if source_dir:
+            paths = sorted(glob.glob(os.path.join(source_dir, '**', '*'), recursive=True))
+        else:
+            paths = list(sources.values())
+        compare_formats(paths, args.limit)
+    finally:
+        os.chdir(PROJECT_ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ class ImageGalleryApp {
         this.currentPath = '';
         this.folderSortType = 'name-asc';  // 文件夹排序类型
         this.contentSortType = 'name-asc'; // 内容排序类型
+        this.recursiveListing = false; // 是否列出子文件夹中的单元
         this.isCreating = false;
         this.debounceTimer = null;
         // 添加分页相关属性
@@ -14,6 +15,15 @@ class ImageGalleryApp {
         this.isLoading = false;
         this.allLoadedFiles = []; // 缓存已加载的文件
         this.isScrollLoading = false; // 防止重复加载
+        this.searchQuery = null; // 当前搜索词（为空时表示浏览文件夹）
+        this.searchCursor = null; // 搜索结果翻页游标
+        this.folderCursor = null; // 文件夹单元翻页游标（新增或删除单元不会让后续页错位）
+        this.promptPreviewLength = 300; // 列表中提示词只取前若干字符（卡片只显示三行），编辑和复制时再获取完整内容
+        // 缩略图 srcset 候选规格（以列表接口返回的 thumbnails 为准）
+        this.thumbnailSizes = [{ profile: 'grid', width: 220 }, { profile: 'grid2x', width: 440 }];
+        // 缩略图包：浏览器可解码的图片格式（请求缩略图包时作为 Accept）与当前卡片使用的对象 URL
+        this.imageAccept = this.detectImageAccept();
+        this.batchObjectUrls = [];
         // 添加图片预加载相关属性
         this.imageObserver = null;
         this.preloadMargin = 600; // 提前加载距离
@@ -29,6 +39,7 @@ class ImageGalleryApp {
             currentPath: document.getElementById('currentPath'),
             folderSortSelect: document.getElementById('sortSelect'),
             contentSortSelect: document.getElementById('contentSortSelect'),
+            recursiveToggle: document.getElementById('recursiveToggle'),
             refreshBtn: document.getElementById('refreshBtn'),
             contentArea: document.getElementById('contentArea'),
             loadingOverlay: document.getElementById('loadingOverlay'),
@@ -77,6 +88,8 @@ class ImageGalleryApp {
                 this.contentSortType = state.contentSortType || 'name-asc';
                 this.elements.folderSortSelect.value = this.folderSortType;
                 this.elements.contentSortSelect.value = this.contentSortType;
+                this.recursiveListing = Boolean(state.recursiveListing);
+                this.elements.recursiveToggle.checked = this.recursiveListing;
                 if (state.searchQuery) {
                     this.elements.searchInput.value = state.searchQuery;
                 }
@@ -93,6 +106,7 @@ class ImageGalleryApp {
                 currentPath: this.currentPath,
                 folderSortType: this.folderSortType,
                 contentSortType: this.contentSortType,
+                recursiveListing: this.recursiveListing,
                 searchQuery: this.elements.searchInput.value.trim(),
                 expandedPaths: this.getExpandedPaths()
             };
@@ -124,6 +138,7 @@ class ImageGalleryApp {
         // 排序和刷新
         this.elements.folderSortSelect.addEventListener('change', () => this.handleFolderSortChange());
         this.elements.contentSortSelect.addEventListener('change', () => this.handleContentSortChange());
+        this.elements.recursiveToggle.addEventListener('change', () => this.handleRecursiveChange());
         this.elements.refreshBtn.addEventListener('click', () => this.handleRefresh());
         
         // 文件夹相关按钮
@@ -155,7 +170,11 @@ class ImageGalleryApp {
                     // 获取图片 URL
                     const imageUrl = img.dataset.src;
                     if (imageUrl) {
-                        // 设置图片源
+                        // 设置图片源（srcset 由浏览器按设备像素比选择规格）
+                        if (img.dataset.srcset) {
+                            img.sizes = img.dataset.sizes;
+                            img.srcset = img.dataset.srcset;
+                        }
                         img.src = imageUrl;
                         // 移除观察器，避免重复加载
                         this.imageObserver.unobserve(img);
@@ -200,7 +219,15 @@ class ImageGalleryApp {
     }
 
     // 处理刷新按钮点击
-    handleRefresh() {
+    async handleRefresh() {
+        // 先让服务端完整对账当前文件夹及其子文件夹，原地修改的提示词等监听可能遗漏的变化也会同步
+        try {
+            const params = new URLSearchParams({ full: 1 });
+            if (this.currentPath) params.set('path', this.currentPath);
+            await fetch(`/api/catalog/reconcile?${params}`, { method: 'POST' });
+        } catch (error) {
+            console.error('同步文件系统失败:', error);
+        }
         // 重置分页相关状态
         this.currentPage = 1;
         this.hasMore = true;
@@ -229,6 +256,11 @@ class ImageGalleryApp {
     handleContentSortChange() {
         this.contentSortType = this.elements.contentSortSelect.value;
         this.saveStateToStorage();
+        // 搜索模式下按新的排序方式重新搜索
+        if (this.searchQuery) {
+            this.performSearch(this.searchQuery);
+            return;
+        }
         // 修复：右边排序方式应该只影响右边图片，不影响左边菜单栏
         this.loadData();
         // 排序变化时也预加载缩略图
@@ -237,6 +269,16 @@ class ImageGalleryApp {
         }, 1000);
     }
 
+    // 切换是否包含子文件夹中的单元
+    handleRecursiveChange() {
+        this.recursiveListing = this.elements.recursiveToggle.checked;
+        this.saveStateToStorage();
+        this.loadData(1, false, false);
+        setTimeout(() => {
+            this.preloadAllThumbnails();
+        }, 1000);
+    }
+
     // 键盘事件处理
     handleKeydown(e) {
         if (e.key === 'Escape' && !this.elements.editModal.classList.contains('hidden')) {
@@ -305,8 +347,8 @@ class ImageGalleryApp {
         }, 2000);
     }
 
-    // 修改loadData方法支持分页
-    async loadData(page = 1, append = false) {
+    // 修改loadData方法支持分页（refreshTree 为 false 时只加载文件，不刷新目录树）
+    async loadData(page = 1, append = false, refreshTree = true) {
         if (this.isLoading && !append) return;
         // 如果是滚动加载且正在加载中，则跳过
         if (this.isScrollLoading && append) return;
@@ -315,6 +357,8 @@ class ImageGalleryApp {
             this.isScrollLoading = true;
         } else {
             this.isLoading = true;
+            // 退出搜索模式，滚动加载改为加载文件夹内容
+            this.searchQuery = null;
             // 使用延迟显示加载状态的方式
             this.showLoading(true);
             // 清除搜索结果统计信息
@@ -334,19 +378,36 @@ class ImageGalleryApp {
         try {
             // 处理API请求中的路径参数
             const apiPath = this.currentPath;
-            // 修复：使用文件夹排序类型来获取目录树数据
-            const response = await fetch(`/api/data?path=${encodeURIComponent(apiPath)}&page=${page}&per_page=200&sort=${this.folderSortType}`);
+            // 目录树与文件列表分开加载，滚动分页只携带单元数据
+            if (!append && refreshTree) {
+                this.loadTreeData();
+            }
+            // 滚动加载时从上一页的游标继续
+            const cursor = append ? this.folderCursor : null;
+            const params = new URLSearchParams({
+                path: apiPath, page, per_page: 200, order: this.contentSortType, preview: this.promptPreviewLength,
+                compact: 1
+            });
+            if (cursor) params.set('cursor', cursor);
+            if (this.recursiveListing) params.set('recursive', 1);
+            // 同时请求这一页的缩略图包，卡片直接使用包内的缩略图，不再逐张请求
+            const [response, thumbnails] = await Promise.all([
+                fetch(`/api/files?${params}`),
+                this.fetchThumbnailBatch(apiPath, page, 200, cursor)
+            ]);
             if (!response.ok) throw new Error('网络请求失败');
             
             const data = await response.json();
+            data.files = this.unpackColumns(data.files);
             
             // 更新分页信息
             this.currentPage = data.pagination.page;
             this.hasMore = data.pagination.has_more;
+            this.folderCursor = data.pagination.next_cursor;
+            this.updateThumbnailSizes(data);
             
             if (!append) {
-                // 首次加载，渲染树结构和清空卡片
-                this.renderTree(data.tree);
+                // 首次加载，清空卡片
                 this.elements.cardsGrid.innerHTML = '';
                 this.allLoadedFiles = [];
             }
@@ -354,8 +415,8 @@ class ImageGalleryApp {
             // 添加到已加载文件列表
             this.allLoadedFiles = [...this.allLoadedFiles, ...data.files];
             
-            // 渲染卡片
-            this.renderCards(data.files, append);
+            // 渲染卡片（单元已由服务端按 contentSortType 排序）
+            this.renderCards(data.files, append, thumbnails);
             
             // 绑定滚动事件（仅在首次加载时）
             if (!append) {
@@ -376,67 +437,49 @@ class ImageGalleryApp {
         }
     }
 
-    // 专门用于加载树形结构数据的方法
+    // 专门用于加载树形结构数据的方法（只加载顶层，展开的节点按需加载）
     async loadTreeData() {
         try {
-            // 只获取目录树数据，不获取文件数据
-            const response = await fetch(`/api/data?path=${encodeURIComponent(this.currentPath)}&page=1&per_page=1&sort=${this.folderSortType}`);
-            if (!response.ok) throw new Error('网络请求失败');
-            
-            const data = await response.json();
-            // 只渲染树结构
-            this.renderTree(data.tree);
+            const nodes = await this.fetchTreeLevel('');
+            await this.renderTree(nodes);
         } catch (error) {
             console.error('加载目录树数据失败:', error);
             this.showNotification('加载目录树数据失败，请检查服务器连接', 'error');
         }
     }
 
-    // 无阻塞的数据加载方法（用于导航优化）
+    // 获取某个文件夹下一层的子文件夹（服务端带 ETag，未变化时浏览器直接复用缓存）
+    async fetchTreeLevel(path) {
+        const response = await fetch(`/api/tree?path=${encodeURIComponent(path)}&depth=1&sort=${this.folderSortType}`);
+        if (!response.ok) throw new Error('网络请求失败');
+        const data = await response.json();
+        return data.children;
+    }
+
+    // 无阻塞的数据加载方法（用于导航优化，目录树已在页面上，无需刷新）
     loadDataWithoutBlocking() {
         // 使用setTimeout将数据加载放到下一个事件循环中，避免阻塞UI
         setTimeout(() => {
-            this.loadData();
+            this.loadData(1, false, false);
         }, 0);
     }
 
-    // 预加载所有缩略图到缓存（优化版本）
+    // 预加载后续几页的缩略图包到浏览器缓存（优化版本）
     async preloadAllThumbnails() {
         try {
-            // 获取当前目录下的所有文件
-            const response = await fetch(`/api/data?path=${encodeURIComponent(this.currentPath)}&page=1&per_page=1000&sort=${this.contentSortType}`);
-            if (!response.ok) throw new Error('网络请求失败');
-            
-            const data = await response.json();
-            const files = data.files;
-            
-            // 创建预加载图片数组
-            const preloadImages = [];
-            
-            // 限制同时预加载的图片数量，避免过多并发请求
-            const maxConcurrent = 20;  // 增加并发数量从10到20
+            const path = this.currentPath;
             let loadedCount = 0;
-            
-            // 分批预加载图片
-            for (let i = 0; i < files.length; i += maxConcurrent) {
-                const batch = files.slice(i, i + maxConcurrent);
-                const batchPromises = batch.map(file => {
-                    return new Promise((resolve) => {
-                        const img = new Image();
-                        img.onload = () => {
-                            loadedCount++;
-                            resolve();
-                        };
-                        img.onerror = () => {
-                            loadedCount++;
-                            resolve(); // 即使出错也继续
-                        };
-                        img.src = `/api/thumbnail?path=${encodeURIComponent(file.path)}`;
-                    });
-                });
-                
-                // 等待这一批图片加载完成
-                await Promise.all(batchPromises);
+            // 第一页随列表一起加载（这里按 ETag 确认后取得下一页游标），依次预取后续页（最多 1000 个单元），
+            // 之后滚动加载时请求同样的游标地址，只需按 ETag 确认
+            let cursor = null;
+            for (let page = 1; page <= 5; page++) {
+                if (path !== this.currentPath) return;
+                const buffer = await this.fetchThumbnailBatchBuffer(path, page, 200, cursor);
+                if (!buffer) break;
+                const { index } = this.parseThumbnailBatch(buffer);
+                if (page > 1) loadedCount += index.items.length;
+                cursor = index.next_cursor;
+                if (!cursor) break;
             }
             
             console.log(`预加载了 ${loadedCount} 张缩略图`);
@@ -445,31 +488,146 @@ class ImageGalleryApp {
         }
     }
 
+    // 检测浏览器能解码的缩略图格式，返回请求缩略图包时使用的 Accept（图片元素会自动携带，fetch 不会）
+    async detectImageAccept() {
+        const probes = {
+            'image/avif': 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAADrbWV0YQAAAAAAAAAhaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAAAAAAAOcGl0bQAAAAAAAQAAAB5pbG9jAAAAAEQAAAEAAQAAAAEAAAETAAAAKAAAAChpaW5mAAAAAAABAAAAGmluZmUCAAAAAAEAAGF2MDFDb2xvcgAAAABqaXBycAAAAEtpcGNvAAAAFGlzcGUAAAAAAAAAAQAAAAEAAAAQcGl4aQAAAAADCAgIAAAADGF2MUOBAAwAAAAAE2NvbHJuY2x4AAEADQAGgAAAABdpcG1hAAAAAAAAAAEAAQQBAoMEAAAAMG1kYXQSAAoIGAAGiAhoNCAyGhlHh4Yhh5555oAAAJBAyRxhSytNj1FFTqSg',
+            'image/webp': 'data:image/webp;base64,UklGRjgAAABXRUJQVlA4ICwAAACQAQCdASoBAAEAAsBMJaACdLoAA5gA/u5DH+5sc4twV/9tD/9aH/60P+lAAA=='
+        };
+        const supported = await Promise.all(Object.entries(probes).map(([type, uri]) => new Promise((resolve) => {
+            const img = new Image();
+            img.onload = () => resolve(img.width === 1 ? type : null);
+            img.onerror = () => resolve(null);
+            img.src = uri;
+        })));
+        return [...supported.filter(Boolean), '*/*'].join(',');
+    }
+
+    // 缩略图包 URL（分页与排序与 /api/files 一致，规格与卡片在当前设备上选用的规格一致）
+    thumbnailBatchUrl(path, page, perPage, cursor = null) {
+        const params = new URLSearchParams({
+            path, page, per_page: perPage, order: this.contentSortType, profile: this.preferredThumbnailProfile()
+        });
+        if (cursor) params.set('cursor', cursor);
+        if (this.recursiveListing) params.set('recursive', 1);
+        return `/api/thumbnails/batch?${params}`;
+    }
+
+    // 请求缩略图包的原始数据，失败时返回 null
+    async fetchThumbnailBatchBuffer(path, page, perPage, cursor = null) {
+        try {
+            const response = await fetch(this.thumbnailBatchUrl(path, page, perPage, cursor), {
+                headers: { Accept: await this.imageAccept }
+            });
+            return response.ok ? await response.arrayBuffer() : null;
+        } catch (error) {
+            console.error('缩略图包加载失败:', error);
+            return null;
+        }
+    }
+
+    // 解析缩略图包：4 字节大端序索引长度 + JSON 索引 + 拼接的缩略图数据
+    parseThumbnailBatch(buffer) {
+        const indexLength = new DataView(buffer).getUint32(0);
+        const index = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, indexLength)));
+        return { index, dataStart: 4 + indexLength };
+    }
+
+    // 请求一页单元的缩略图包，返回 路径 -> 对象 URL（包内没有的缩略图由卡片单独请求）
+    async fetchThumbnailBatch(path, page, perPage, cursor = null) {
+        const thumbnails = new Map();
+        const buffer = await this.fetchThumbnailBatchBuffer(path, page, perPage, cursor);
+        if (!buffer) return thumbnails;
+        try {
+            const { index, dataStart } = this.parseThumbnailBatch(buffer);
+            index.items.forEach(item => {
+                const blob = new Blob([new Uint8Array(buffer, dataStart + item.offset, item.length)], { type: index.mimetype });
+                thumbnails.set(item.path, URL.createObjectURL(blob));
+            });
+        } catch (error) {
+            console.error('缩略图包解析失败:', error);
+        }
+        return thumbnails;
+    }
+
+    // 释放已清空卡片占用的缩略图对象 URL
+    revokeBatchThumbnails() {
+        this.batchObjectUrls.forEach(url => URL.revokeObjectURL(url));
+        this.batchObjectUrls = [];
+    }
+
     // 修改搜索功能以支持分页
-    async performSearch(query) {
-        // 搜索时禁用分页，一次性加载所有结果
-        this.showLoading(true);
+    async performSearch(query, append = false) {
+        // 搜索结果分页加载，滚动到底部时按游标继续
+        if (this.isScrollLoading && append) return;
+        if (append) {
+            this.isScrollLoading = true;
+        } else {
+            this.showLoading(true);
+            this.searchQuery = query;
+            this.searchCursor = null;
+            this.currentPage = 1;
+            this.hasMore = false;
+        }
         try {
-            const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
+            // 单元由服务端按 contentSortType 排序，游标按同一排序方式翻页
+            const params = new URLSearchParams({
+                q: query, per_page: 200, order: this.contentSortType, preview: this.promptPreviewLength, compact: 1
+            });
+            if (append) {
+                if (this.searchCursor) {
+                    params.set('cursor', this.searchCursor);
+                } else {
+                    params.set('page', this.currentPage + 1);
+                }
+            }
+            const response = await fetch(`/api/search?${params}`);
             if (!response.ok) throw new Error('搜索请求失败');
             
-            const results = await response.json();
-            // 搜索结果不分页，直接显示所有匹配的文件
-            this.renderCards(results.filter(item => !item.is_dir), false);
+            const data = await response.json();
+            // 搜索词已变化时丢弃过期结果
+            if (query !== this.searchQuery) return;
+            data.files = this.unpackColumns(data.files);
+            
+            this.searchCursor = data.pagination.next_cursor;
+            this.updateThumbnailSizes(data);
+            if (data.pagination.page) {
+                this.currentPage = data.pagination.page;
+            }
+            this.hasMore = data.pagination.has_more;
+            
+            if (!append && data.pagination.total === 0) {
+                // 没有精确匹配时按名称容错搜索（拼写错误的角色名等）
+                const fuzzyResponse = await fetch(`/api/search?${new URLSearchParams({ q: query, fuzzy: 1, limit: 50 })}`);
+                const suggestions = fuzzyResponse.ok ? await fuzzyResponse.json() : [];
+                if (query !== this.searchQuery) return;
+                const units = suggestions.filter(item => !item.is_dir);
+                this.renderCards(units, false);
+                this.showSearchResultInfo(query, units.length, true);
+                return;
+            }
+            this.renderCards(data.files.filter(item => !item.is_dir), append);
             
-            // 显示搜索结果统计信息
-            const resultCount = results.filter(item => !item.is_dir).length;
-            this.showSearchResultInfo(query, resultCount);
+            if (!append) {
+                // 显示搜索结果统计信息
+                const resultCount = data.pagination.total - data.pagination.folders;
+                this.showSearchResultInfo(query, resultCount, false, data.pagination.estimated);
+                this.bindScrollEvent();
+            }
         } catch (error) {
             console.error('搜索失败:', error);
             this.showNotification('搜索失败，请稍后重试', 'error');
         } finally {
-            this.showLoading(false);
+            if (append) {
+                this.isScrollLoading = false;
+            } else {
+                this.showLoading(false);
+            }
         }
     }
 
     // 显示搜索结果统计信息
-    showSearchResultInfo(query, count) {
+    showSearchResultInfo(query, count, fuzzy = false, estimated = false) {
         const toolbar = document.querySelector('.flex.justify-between.items-center.p-4.bg-slate-900.border-b.border-slate-700');
         if (!toolbar) return;
         
@@ -483,7 +641,9 @@ class ImageGalleryApp {
         const infoElement = document.createElement('div');
         infoElement.id = 'searchResultInfo';
         infoElement.className = 'text-sm text-slate-400';
-        infoElement.textContent = `与"${query}"相关的图像共计${count}张`;
+        infoElement.textContent = fuzzy
+            ? `未找到"${query}"，显示${count}张名称相近的图像`
+            : `与"${query}"相关的图像${estimated ? '约' : '共计'}${count}张`;
         
         // 将统计信息插入到排序选择框的左侧
         const sortSelect = document.getElementById('contentSortSelect');
@@ -501,9 +661,13 @@ class ImageGalleryApp {
     }
 
     // 修改renderCards方法支持追加
-    renderCards(files, append = false) {
+    renderCards(files, append = false, thumbnails = null) {
         if (!append) {
             this.elements.cardsGrid.innerHTML = '';
+            this.revokeBatchThumbnails();
+        }
+        if (thumbnails) {
+            this.batchObjectUrls.push(...thumbnails.values());
         }
         
         if (files.length === 0 && !append) {
@@ -513,21 +677,11 @@ class ImageGalleryApp {
         
         this.elements.emptyState.classList.add('hidden');
         
-        // 排序文件
-        files.sort((a, b) => {
-            switch (this.contentSortType) {
-                case 'name-asc': return a.name.localeCompare(b.name);
-                case 'name-desc': return b.name.localeCompare(a.name);
-                case 'date-desc': return b.modified - a.modified;
-                case 'date-asc': return a.modified - b.modified;
-                default: return 0;
-            }
-        });
-
+        // 文件夹单元和搜索结果均由服务端排序，模糊搜索结果保持相似度顺序，这里按返回顺序渲染
         // 直接创建包含缩略图的卡片
         const fragment = document.createDocumentFragment();
         files.forEach((file) => {
-            const card = this.createCardWithThumbnail(file);
+            const card = this.createCardWithThumbnail(file, thumbnails && thumbnails.get(file.path));
             fragment.appendChild(card);
         });
         this.elements.cardsGrid.appendChild(fragment);
@@ -551,7 +705,7 @@ class ImageGalleryApp {
             const data = await response.json();
 
             this.elements.modalTitle.textContent = '编辑单元';
-            this.elements.modalImage.src = `/api/thumbnail?path=${encodeURIComponent(path)}`;
+            this.elements.modalImage.src = this.thumbnailUrl(path, this.preferredThumbnailProfile(), data.version);
             this.elements.unitNameInput.value = data.name;
             this.elements.unitValueTextarea.value = data.value;
             
@@ -791,8 +945,8 @@ class ImageGalleryApp {
         this.elements.editModal.classList.add('hidden');
     }
 
-    // 渲染目录树
-    renderTree(tree) {
+    // 渲染目录树（顶层节点），并按层级恢复展开状态
+    async renderTree(tree) {
         // 保存当前展开状态
         let expandedPaths = new Set();
         
@@ -825,22 +979,15 @@ class ImageGalleryApp {
             this.elements.treeView.appendChild(this.createTreeNode(node, 0));
         });
         
-        // 恢复展开状态
-        expandedPaths.forEach(path => {
-            const nodeEl = document.querySelector(`[data-path="${path}"]`);
+        // 恢复展开状态（先展开浅层，子节点加载后再展开深层）
+        const sortedPaths = [...expandedPaths].sort((a, b) => a.split('/').length - b.split('/').length);
+        for (const path of sortedPaths) {
+            const nodeEl = this.elements.treeView.querySelector(`.tree-node[data-path="${CSS.escape(path)}"]`);
             if (nodeEl) {
                 const container = nodeEl.closest('.tree-node-container');
-                const childContainer = container?.querySelector('.tree-children');
-                const arrow = nodeEl.querySelector('.tree-arrow');
-                
-                if (childContainer) {
-                    childContainer.classList.remove('hidden');
-                    if (arrow) {
-                        arrow.classList.add('expanded');
-                    }
-                }
+                await this.expandTreeNode(container);
             }
-        });
+        }
         
         // 更新选中状态
         if (this.currentPath) {
@@ -852,10 +999,26 @@ class ImageGalleryApp {
         }
     }
 
+    // 展开树节点，首次展开时向服务端加载子文件夹
+    async expandTreeNode(nodeContainer) {
+        const childContainer = nodeContainer.querySelector(':scope > .tree-children');
+        if (!childContainer) return;
+        if (childContainer.dataset.loaded !== 'true') {
+            const level = parseInt(childContainer.dataset.level, 10);
+            const children = await this.fetchTreeLevel(childContainer.dataset.path);
+            childContainer.innerHTML = '';
+            children.forEach(child => {
+                childContainer.appendChild(this.createTreeNode(child, level));
+            });
+            childContainer.dataset.loaded = 'true';
+        }
+        childContainer.classList.remove('hidden');
+    }
+
     // 创建树节点
     createTreeNode(node, level) {
         const nodeEl = document.createElement('div');
-        const hasChildren = node.children && node.children.length > 0;
+        const hasChildren = node.has_children;
         // 动态判断活跃状态
         const isActive = this.currentPath === node.path;
         
@@ -888,7 +1051,7 @@ class ImageGalleryApp {
             
             if (hasChildren) {
                 // 查找子菜单容器
-                const childContainer = nodeContainer.querySelector('.tree-children');
+                const childContainer = nodeContainer.querySelector(':scope > .tree-children');
                 
                 if (childContainer) {
                     const isExpanded = !childContainer.classList.contains('hidden');
@@ -897,12 +1060,13 @@ class ImageGalleryApp {
                     if (isExpanded) {
                         // 收纳当前菜单
                         childContainer.classList.add('hidden');
+                        this.saveStateToStorage(); // 保存展开状态
                     } else {
-                        // 展开当前菜单
-                        childContainer.classList.remove('hidden');
+                        // 展开当前菜单（首次展开时加载子文件夹）
+                        this.expandTreeNode(nodeContainer)
+                            .then(() => this.saveStateToStorage())
+                            .catch(error => console.error('加载子文件夹失败:', error));
                     }
-                    
-                    this.saveStateToStorage(); // 保存展开状态
                 }
             }
             
@@ -954,14 +1118,13 @@ class ImageGalleryApp {
 
         nodeContainer.appendChild(nodeEl);
 
-        // 如果有子节点，创建子节点容器（默认隐藏）
+        // 如果有子节点，创建子节点容器（默认隐藏，展开时再加载）
         if (hasChildren) {
             const childContainer = document.createElement('div');
             childContainer.className = 'tree-children hidden';
-            
-            node.children.forEach(child => {
-                childContainer.appendChild(this.createTreeNode(child, level + 1));
-            });
+            childContainer.dataset.path = node.path;
+            childContainer.dataset.level = level + 1;
+            childContainer.dataset.loaded = 'false';
             
             nodeContainer.appendChild(childContainer);
         }
@@ -1042,20 +1205,76 @@ class ImageGalleryApp {
         }, 500); // 缩短延迟时间
     }
 
-    // 创建包含缩略图的卡片
-    createCardWithThumbnail(file) {
+    // 还原列式单元列表（compact=1）：每列一个数组，path 省略了公共前缀，null 表示该条目没有这个字段
+    unpackColumns(files) {
+        if (Array.isArray(files)) return files;
+        const { count, prefix, columns } = files;
+        const keys = Object.keys(columns);
+        const items = new Array(count);
+        for (let i = 0; i < count; i++) {
+            const item = {};
+            keys.forEach(key => {
+                const value = columns[key][i];
+                if (value !== null) item[key] = value;
+            });
+            item.path = prefix + columns.path[i];
+            items[i] = item;
+        }
+        return items;
+    }
+
+    // 缩略图 URL（不指定规格时使用服务端默认规格；带上列表给出的原图版本号时浏览器可长期缓存，原图变化后地址随之变化）
+    thumbnailUrl(path, profile, version) {
+        const params = new URLSearchParams({ path });
+        if (profile) params.set('profile', profile);
+        if (version) params.set('v', version);
+        return `/api/thumbnail?${params}`;
+    }
+
+    // 原图 URL（版本号同缩略图）
+    imageUrl(path, version) {
+        const params = new URLSearchParams({ path });
+        if (version) params.set('v', version);
+        return `/api/image?${params}`;
+    }
+
+    // 缩略图 srcset：按宽度列出各规格，由浏览器只下载当前屏幕需要的像素
+    thumbnailSrcset(path, version) {
+        return this.thumbnailSizes
+            .map(item => `${this.thumbnailUrl(path, item.profile, version)} ${item.width}w`).join(', ');
+    }
+
+    // 当前设备像素比下卡片需要的缩略图规格
+    preferredThumbnailProfile() {
+        const needed = 220 * (window.devicePixelRatio || 1);
+        const match = this.thumbnailSizes.find(item => item.width >= needed);
+        return (match || this.thumbnailSizes[this.thumbnailSizes.length - 1]).profile;
+    }
+
+    // 从列表接口的响应中更新 srcset 候选规格
+    updateThumbnailSizes(data) {
+        if (data.thumbnails && data.thumbnails.length) {
+            this.thumbnailSizes = data.thumbnails;
+        }
+    }
+
+    // 创建包含缩略图的卡片（batchUrl 为缩略图包中的对象 URL，没有时按 srcset 单独请求）
+    createCardWithThumbnail(file, batchUrl = null) {
         const card = document.createElement('div');
         card.className = 'unit-card';
         card.dataset.path = file.path;
         
         // 使用预生成的缩略图 URL
-        const thumbnailUrl = `/api/thumbnail?path=${encodeURIComponent(file.path)}`;
+        const thumbnailUrl = this.thumbnailUrl(file.path, this.thumbnailSizes[0].profile, file.version);
+        // 列表中的提示词可能已被截断
+        const promptText = file.truncated ? `${file.value}…` : file.value;
         
         card.innerHTML = `
-            <div class="unit-name">${this.escapeHtml(file.name)}</div>
+            <div class="unit-name" title="${this.escapeHtml(file.path)}">${this.escapeHtml(file.name)}</div>
             <div class="image-container" style="position: relative; width: 220px; height: 264px; background-color: #1f2937;">
                 <img class="unit-image" 
-                     data-src="${thumbnailUrl}" 
+                     data-src="${batchUrl || thumbnailUrl}" 
+                     ${batchUrl ? '' : `data-srcset="${this.thumbnailSrcset(file.path, file.version)}" data-sizes="220px"`}
                      alt="${this.escapeHtml(file.name)}"
                      loading="lazy"
                      decoding="async"
@@ -1071,7 +1290,7 @@ class ImageGalleryApp {
                             onclick="app.retryImageLoad(this, '${thumbnailUrl}')">重新加载</button>
                 </div>
             </div>
-            <div class="unit-value" title="${this.escapeHtml(file.value)}">${this.escapeHtml(file.value)}</div>
+            <div class="unit-value" title="${this.escapeHtml(promptText)}">${this.escapeHtml(promptText)}</div>
             <div class="unit-actions">
                 <button class="text-blue-400 hover:text-blue-300 text-xs font-medium" 
                         onclick="app.editUnit('${file.path}')">编辑</button>
@@ -1080,7 +1299,7 @@ class ImageGalleryApp {
                 <button class="text-green-400 hover:text-green-300 text-xs font-medium" 
                         onclick="app.copyUnit('${file.path}')">复制</button>
                 <button class="preview-btn" 
-                        onclick="app.openImagePreview('${file.path}')">
+                        onclick="app.openImagePreview('${file.path}', '${file.version || ''}')">
                     <svg class="w-3 h-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
                         <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z"></path>
                         <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z"></path>
@@ -1092,9 +1311,10 @@ class ImageGalleryApp {
     }
 
     // 打开图片预览
-    openImagePreview(imagePath) {
-        // 使用API路径获取原图，而不是缩略图
-        const originalImageUrl = `/api/image?path=${encodeURIComponent(imagePath)}`;
+    openImagePreview(imagePath, version) {
+        // 使用预览规格的缩略图，不下载完整原图；预览图不可用时回退到原图
+        const previewUrl = this.thumbnailUrl(imagePath, 'preview', version);
+        const originalImageUrl = this.imageUrl(imagePath, version);
         
         // 创建预览模态框
         const previewModal = document.createElement('div');
@@ -1116,11 +1336,12 @@ class ImageGalleryApp {
         
         // 图片加载失败处理
         previewImage.onerror = () => {
-            previewImage.src = `/api/thumbnail?path=${encodeURIComponent(imagePath)}`;
+            previewImage.onerror = null;
+            previewImage.src = originalImageUrl;
             previewImage.style.transform = 'scale(2.5)';
         };
         
-        previewImage.src = originalImageUrl;
+        previewImage.src = previewUrl;
         previewModal.appendChild(previewImage);
         
         // 点击关闭预览
@@ -1180,6 +1401,8 @@ class ImageGalleryApp {
         errorPlaceholder.style.display = 'none';
         imgElement.style.display = 'block';
         imgElement.style.opacity = '0';
+        // 重试时只请求基础规格，避免浏览器继续使用 srcset 中失败的地址
+        imgElement.removeAttribute('srcset');
         
         const newUrl = originalUrl + (originalUrl.includes('?') ? '&' : '?') + 't=' + Date.now();
         imgElement.src = newUrl;
@@ -1199,7 +1422,11 @@ class ImageGalleryApp {
             // 检查是否滚动到底部（提前200px开始加载，从100增加到200）
             if (contentArea.scrollTop + contentArea.clientHeight >= contentArea.scrollHeight - 200) {
                 if (this.hasMore && !this.isScrollLoading && !this.isLoading) {
-                    this.loadData(this.currentPage + 1, true);
+                    if (this.searchQuery) {
+                        this.performSearch(this.searchQuery, true);
+                    } else {
+                        this.loadData(this.currentPage + 1, true);
+                    }
                 }
             }
         };
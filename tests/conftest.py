@@ -0,0 +1,64 @@
+import os
+import sys
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import catalog, tree_cache
+
+
+def write_unit(image_dir, rel_path, prompt=None):
+    """在测试图片目录中写入一个单元（占位图片 + 可选的 txt 提示词）"""
+    path = os.path.join(image_dir, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'not an image')
+    if prompt is not None:
+        with open(os.path.splitext(path)[0] + '.txt', 'w', encoding='utf-8') as f:
+            f.write(prompt)
+    return path
+
+
+def write_image(image_dir, rel_path, size=(64, 48), color='red'):
+    """在测试图片目录中写入一张可以生成缩略图的真实图片"""
+    path = os.path.join(image_dir, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size, color).save(path)
+    return path
+
+
+def bump_mtime(path, seconds=10):
+    """推后文件或目录的 mtime，避免依赖文件系统的时间精度"""
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime + seconds, stat.st_mtime + seconds))
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    """在临时目录中使用独立的图片目录和单元索引"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('images')
+    monkeypatch.setattr(catalog, '_listeners', [])
+    monkeypatch.setattr(catalog, '_local', type(catalog._local)())
+    monkeypatch.setattr(tree_cache, '_children', {})
+    monkeypatch.setattr(tree_cache, '_nodes', {})
+    monkeypatch.setattr(tree_cache, '_payloads', {})
+    monkeypatch.setattr(tree_cache, '_loaded', False)
+    catalog.init_catalog()
+    yield str(tmp_path / 'images')
+    catalog.get_connection().close()
+
+
+@pytest.fixture
+def client(image_dir, monkeypatch):
+    """测试用的应用客户端（不启动文件监听和后台缩略图生成）"""
+    from backend import app as app_module, routes
+    os.makedirs('thumbnails')
+    monkeypatch.setattr(app_module, 'start_watcher', lambda: None)
+    monkeypatch.setattr(routes, 'schedule_thumbnails', lambda *args, **kwargs: None)
+    app = app_module.create_app()
+    app.config['THUMBNAIL_GENERATION_STARTED'] = True
+    # 只保留目录树缓存的监听，单元变化不触发后台缩略图生成
+    catalog._listeners[:] = [tree_cache.on_catalog_changed]
+    return app.test_client()
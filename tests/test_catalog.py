@@ -0,0 +1,121 @@
+import os
+import base64
+import pytest
+
+from backend import catalog
+from conftest import write_unit, bump_mtime
+
+
+def reconcile(**kwargs):
+    stats = catalog.reconcile_catalog(quiet=True, **kwargs)
+    return {key: stats[key] for key in ('listed_dirs', 'changed', 'skipped', 'removed')}
+
+
+def test_reconcile_add_modify_delete(image_dir):
+    write_unit(image_dir, 'a/one.png', 'smile')
+    write_unit(image_dir, 'a/two.png')
+    write_unit(image_dir, 'b/three.png', 'hat')
+    assert reconcile() == {'listed_dirs': 3, 'changed': 3, 'skipped': 0, 'removed': 0}
+    # 没有变化时不重新列出任何目录
+    assert reconcile() == {'listed_dirs': 0, 'changed': 0, 'skipped': 0, 'removed': 0}
+
+    write_unit(image_dir, 'a/four.png')
+    bump_mtime(os.path.join(image_dir, 'a'))
+    assert reconcile() == {'listed_dirs': 1, 'changed': 1, 'skipped': 2, 'removed': 0}
+
+    # 原地修改 txt 不改变目录 mtime，需要完整对账
+    with open(os.path.join(image_dir, 'b', 'three.txt'), 'a', encoding='utf-8') as f:
+        f.write(', glasses')
+    assert reconcile(full=True) == {'listed_dirs': 3, 'changed': 1, 'skipped': 3, 'removed': 0}
+    assert catalog.get_unit('b/three.png')['value'] == 'hat, glasses'
+
+    os.remove(os.path.join(image_dir, 'a', 'two.png'))
+    bump_mtime(os.path.join(image_dir, 'a'), 20)
+    assert reconcile() == {'listed_dirs': 1, 'changed': 0, 'skipped': 2, 'removed': 1}
+    assert catalog.get_unit('a/two.png') is None
+    assert catalog.count_units('', recursive=True) == 3
+
+
+def test_reconcile_removes_vanished_folder(image_dir):
+    write_unit(image_dir, 'a/b/one.png')
+    write_unit(image_dir, 'a/b/c/two.png')
+    reconcile()
+    for name in ('c/two.png', 'one.png'):
+        os.remove(os.path.join(image_dir, 'a', 'b', name))
+    os.rmdir(os.path.join(image_dir, 'a', 'b', 'c'))
+    os.rmdir(os.path.join(image_dir, 'a', 'b'))
+    bump_mtime(os.path.join(image_dir, 'a'))
+    assert reconcile()['removed'] == 2
+    assert catalog.count_units('', recursive=True) == 0
+
+
+@pytest.mark.parametrize('order', ['name-asc', 'natural-asc', 'date-desc', 'size-asc', 'dimensions-desc', 'prompt-asc'])
+def test_cursor_round_trip(order):
+    row = {'sort_key': 12.5 if order == 'date-desc' else 'x', 'path': '人物/img 2.png'}
+    cursor = catalog.encode_unit_cursor(order, row)
+    assert catalog.decode_unit_cursor(cursor, order) == (row['sort_key'], row['path'])
+
+
+def test_cursor_default_direction_matches():
+    cursor = catalog.encode_unit_cursor('name', {'sort_key': 'a', 'path': 'a.png'})
+    assert catalog.decode_unit_cursor(cursor, 'name-asc') == ('a', 'a.png')
+
+
+def _raw_cursor(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    _raw_cursor('not json'),
+    _raw_cursor('["name-asc", "a"]'),
+    _raw_cursor('["name-asc", "a", 3]'),
+    _raw_cursor('["bogus-asc", "a", "a.png"]'),
+    _raw_cursor('["name-asc", ["a"], "a.png"]'),
+    _raw_cursor('["name-asc", {"a": 1}, "a.png"]'),
+    _raw_cursor('["name-asc", true, "a.png"]'),
+    _raw_cursor('[["name-asc"], "a", "a.png"]'),
+])
+def test_malformed_cursor_rejected(cursor):
+    with pytest.raises(ValueError):
+        catalog.decode_unit_cursor(cursor, 'name-asc')
+
+
+def test_cursor_for_other_order_rejected():
+    cursor = catalog.encode_unit_cursor('date-desc', {'sort_key': 1.0, 'path': 'a.png'})
+    with pytest.raises(ValueError):
+        catalog.decode_unit_cursor(cursor, 'date-asc')
+
+
+def test_cursor_pages_cover_folder(image_dir):
+    for i in range(7):
+        write_unit(image_dir, f'a/img{i}.png', 'x' * i)
+    reconcile()
+    seen = []
+    after = None
+    while True:
+        files, cursor = catalog.page_units('a', 3, order='prompt-desc', after=after)
+        seen.extend(f['path'] for f in files)
+        if cursor is None:
+            break
+        after = catalog.decode_unit_cursor(cursor, 'prompt-desc')
+    assert seen == [f'a/img{i}.png' for i in reversed(range(7))]
+
+
+def test_unlistable_folder_keeps_subtree(image_dir, monkeypatch):
+    write_unit(image_dir, 'a/one.png')
+    write_unit(image_dir, 'a/b/two.png')
+    write_unit(image_dir, 'c/three.png')
+    reconcile()
+
+    diff_directory = catalog._diff_directory
+
+    def locked(conn, rel_dir, full_dir):
+        if rel_dir == 'a':
+            raise PermissionError(full_dir)
+        return diff_directory(conn, rel_dir, full_dir)
+
+    monkeypatch.setattr(catalog, '_diff_directory', locked)
+    assert reconcile(full=True)['removed'] == 0
+    assert catalog.count_units('', recursive=True) == 3
+    assert catalog.get_connection().execute("SELECT COUNT(*) FROM folders").fetchone()[0] == 4
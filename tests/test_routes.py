@@ -0,0 +1,162 @@
+import pytest
+
+from conftest import write_unit
+
+
+@pytest.mark.parametrize('url', [
+    '/api/files?path=&order=bogus',
+    '/api/files?path=&order=name-sideways',
+    '/api/search?q=hat&per_page=10&order=bogus',
+    '/api/thumbnails/batch?path=&order=bogus',
+])
+def test_invalid_order_is_json_400(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == {'error': '无效的排序方式'}
+
+
+def test_files_lists_units(client, image_dir):
+    write_unit(image_dir, 'a/one.png', 'hat')
+    client.post('/api/catalog/reconcile')
+    response = client.get('/api/files?path=a')
+    assert response.status_code == 200
+    assert [item['path'] for item in response.get_json()['files']] == ['a/one.png']
+
+
+def _cursor(payload):
+    import base64
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+@pytest.mark.parametrize('endpoint', ['/api/files?path=', '/api/search?q=hat', '/api/thumbnails/batch?path='])
+@pytest.mark.parametrize('cursor', [
+    'garbage',
+    _cursor('["name-asc", ["a"], "a.png"]'),
+    _cursor('["name-asc", {"a": 1}, "a.png"]'),
+    _cursor('["date-desc", 1.0, "a.png"]'),
+])
+def test_invalid_cursor_is_json_400(client, image_dir, endpoint, cursor):
+    write_unit(image_dir, 'a.png', 'hat')
+    client.post('/api/catalog/reconcile')
+    response = client.get(f'{endpoint}&order=name-asc&cursor={cursor}')
+    assert response.status_code == 400
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == {'error': '无效的游标'}
+
+
+def test_huge_page_is_clamped(client):
+    assert client.get(f'/api/files?path=&page={10 ** 20}').status_code == 200
+    assert client.get(f'/api/search?q=hat&page={10 ** 20}').status_code == 200
+
+
+@pytest.fixture
+def thumbnail_client(client, monkeypatch):
+    """在当前线程生成缩略图、使用空内存缓存的客户端"""
+    from collections import OrderedDict
+    from backend import thumbnails
+    monkeypatch.setattr(thumbnails, '_executor', False)
+    monkeypatch.setattr(thumbnails, '_memory_cache', OrderedDict())
+    monkeypatch.setattr(thumbnails, 'memory_stats', dict.fromkeys(thumbnails.memory_stats, 0))
+    return client
+
+
+def test_thumbnail_served_from_memory(thumbnail_client, image_dir):
+    import os
+    from backend import thumbnails
+    from conftest import write_image
+
+    write_image(image_dir, 'a/x.png')
+    thumbnail_client.post('/api/catalog/reconcile')
+    first = thumbnail_client.get('/api/thumbnail?path=a/x.png')
+    assert first.status_code == 200 and first.mimetype == 'image/jpeg'
+
+    # 再次请求直接从内存缓存返回，不再读文件
+    os.remove(thumbnails.get_thumbnail_path(thumbnails.locate_thumbnail('a/x.png')[1]))
+    second = thumbnail_client.get('/api/thumbnail?path=a/x.png')
+    assert second.status_code == 200 and second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert thumbnails.memory_stats['hits'] == 1
+
+
+def test_thumbnail_conditional_requests(thumbnail_client, image_dir):
+    from conftest import write_image, bump_mtime
+
+    path = write_image(image_dir, 'a/x.png')
+    thumbnail_client.post('/api/catalog/reconcile')
+    first = thumbnail_client.get('/api/thumbnail?path=a/x.png')
+    etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'no-cache'
+
+    def get(**headers):
+        return thumbnail_client.get('/api/thumbnail?path=a/x.png', headers=headers)
+
+    for response in (get(**{'If-None-Match': etag}), get(**{'If-Modified-Since': last_modified})):
+        assert response.status_code == 304 and response.data == b''
+        assert response.headers['ETag'] == etag
+    assert get(**{'If-None-Match': '"other"'}).status_code == 200
+    assert get(**{'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}).status_code == 200
+    # 有 If-None-Match 时不再看 If-Modified-Since
+    assert get(**{'If-None-Match': '"other"', 'If-Modified-Since': last_modified}).status_code == 200
+
+    # 原图变化后旧校验值不再命中
+    bump_mtime(path)
+    changed = get(**{'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_versioned_thumbnail_is_immutable(thumbnail_client, image_dir):
+    from conftest import write_image
+
+    write_image(image_dir, 'a/x.png')
+    thumbnail_client.post('/api/catalog/reconcile')
+    version = thumbnail_client.get('/api/files?path=a').get_json()['files'][0]['version']
+    response = thumbnail_client.get(f'/api/thumbnail?path=a/x.png&v={version}')
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert thumbnail_client.get('/api/thumbnail?path=a/x.png&v=stale').headers['Cache-Control'] == 'no-cache'
+
+
+@pytest.fixture
+def compress_all(monkeypatch):
+    from backend import compression
+    monkeypatch.setattr(compression, 'COMPRESSION_MIN_SIZE', 1)
+    return compression
+
+
+def test_json_is_gzipped_when_accepted(client, image_dir, compress_all):
+    import gzip
+    import json
+
+    write_unit(image_dir, 'a/one.png', 'hat')
+    client.post('/api/catalog/reconcile')
+    plain = client.get('/api/files?path=a')
+    assert 'Content-Encoding' not in plain.headers
+    response = client.get('/api/files?path=a', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+
+
+def test_brotli_preferred_when_installed(client, compress_all):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/api/version', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.data)
+
+
+def test_brotli_only_without_package_is_uncompressed(client, compress_all, monkeypatch):
+    monkeypatch.setattr(compress_all, 'brotli', None)
+    response = client.get('/api/version', headers={'Accept-Encoding': 'br'})
+    assert 'Content-Encoding' not in response.headers
+    assert client.get('/api/version', headers={'Accept-Encoding': 'gzip, br'}).headers['Content-Encoding'] == 'gzip'
+
+
+def test_ndjson_stream_is_not_compressed(client, image_dir, compress_all):
+    import json
+
+    write_unit(image_dir, 'a/one.png', 'hat')
+    client.post('/api/catalog/reconcile')
+    response = client.get('/api/search?q=hat&format=ndjson', headers={'Accept-Encoding': 'gzip'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert 'Content-Encoding' not in response.headers
+    assert [json.loads(line)['path'] for line in response.data.decode('utf-8').splitlines()] == ['a/one.png']
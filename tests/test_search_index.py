@@ -0,0 +1,150 @@
+from backend.search_index import parse_query
+
+
+def test_plain_terms_are_and():
+    assert parse_query('1girl smile') == ('(words : "1girl") AND (words : "smile")', None)
+
+
+def test_or_joins_adjacent_terms():
+    assert parse_query('smile OR grin hat') == ('(words : "smile" OR words : "grin") AND (words : "hat")', None)
+
+
+def test_leading_or_is_ignored():
+    assert parse_query('OR smile') == ('(words : "smile")', None)
+
+
+def test_not_and_minus_exclude():
+    assert parse_query('smile -hat NOT glasses') == ('(words : "smile")', 'words : "hat" OR words : "glasses"')
+
+
+def test_only_negative():
+    assert parse_query('-hat') == (None, 'words : "hat"')
+
+
+def test_exact_tag():
+    expected = ('(tags : "long_hair")', None)
+    assert parse_query('"Long Hair"') == expected
+    assert parse_query('tag:long_hair') == expected
+    assert parse_query('"(long hair:1.2)"') == expected
+
+
+def test_prefix():
+    assert parse_query('nep*') == ('(words : "nep" *)', None)
+    assert parse_query('"long"*') == ('(tags : "long" *)', None)
+
+
+def test_underscore_is_space_in_words():
+    assert parse_query('long_hair') == ('(words : "long hair")', None)
+
+
+def test_empty_query():
+    assert parse_query('') == (None, None)
+    assert parse_query('AND OR NOT') == (None, None)
+
+
+def test_search_pages_follow_order(image_dir):
+    from backend import catalog
+    from backend.search_index import search_page
+    from conftest import write_unit
+
+    for i in range(12):
+        write_unit(image_dir, f'a/img{i}.png', 'hat, ' + 'x' * ((i * 5) % 12))
+    catalog.reconcile_catalog(quiet=True)
+
+    names = []
+    after = None
+    while True:
+        files, pagination = search_page('hat', per_page=5, after=after, order='natural-asc')
+        names.extend(item['name'] for item in files)
+        if not pagination['next_cursor']:
+            break
+        after = catalog.decode_unit_cursor(pagination['next_cursor'], 'natural-asc')
+    assert names == [f'img{i}' for i in range(12)]
+
+
+def _search_units(image_dir):
+    from backend import catalog
+    from conftest import write_unit
+
+    write_unit(image_dir, 'hats/a.png', 'smile')
+    write_unit(image_dir, 'misc/red_hat.png', 'smile')
+    write_unit(image_dir, 'misc/b.png', 'hat, smile')
+    write_unit(image_dir, 'misc/c.png', 'smile')
+    catalog.reconcile_catalog(quiet=True)
+
+
+def test_search_unions_names_folders_and_prompts(image_dir):
+    from backend.search_index import search_page, count_matches
+
+    _search_units(image_dir)
+    files, pagination = search_page('hat', per_page=10, order='name-asc')
+    assert [item['path'] for item in files] == ['hats', 'hats/a.png', 'misc/b.png', 'misc/red_hat.png']
+    assert count_matches('hat') == (1, 3)
+    assert pagination['total'] == 4 and not pagination['estimated']
+
+
+def test_dense_search_pages_match_sparse(image_dir, monkeypatch):
+    from backend import catalog, search_index
+
+    _search_units(image_dir)
+    sparse = [item['path'] for item in search_index.iter_search('smile', order='name-desc')]
+    # 命中超过上限时改为沿排序索引扫描，总数为估计值，逐页结果不变
+    monkeypatch.setattr(search_index, 'SPARSE_MATCH_LIMIT', 1)
+    paths = []
+    files, pagination = search_index.search_page('smile', per_page=3, order='name-desc')
+    assert pagination['estimated'] and pagination['total'] >= 4
+    while True:
+        paths.extend(item['path'] for item in files)
+        if not pagination['next_cursor']:
+            break
+        after = catalog.decode_unit_cursor(pagination['next_cursor'], 'name-desc')
+        files, pagination = search_index.search_page('smile', per_page=3, after=after, order='name-desc')
+    assert paths == sparse == ['misc/red_hat.png', 'misc/c.png', 'misc/b.png', 'hats/a.png']
+
+
+def test_unit_matches_do_not_scan_units(image_dir):
+    from backend import catalog
+    from backend.search_index import _unit_matches
+
+    _search_units(image_dir)
+    for query in ['hat', '"hat"', 'hat -smile', 'red_hat']:
+        sql, params = _unit_matches(query)
+        plan = [row['detail'] for row in catalog.get_connection().execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        assert not [detail for detail in plan if detail.startswith('SCAN units') or detail.startswith('SCAN folders')], plan
+
+
+def test_invalid_match_expression_keeps_name_matches(image_dir, monkeypatch):
+    from backend import search_index
+
+    _search_units(image_dir)
+    # FTS5 无法解析的表达式：只丢掉提示词部分，单元名和文件夹名照常命中
+    monkeypatch.setattr(search_index, 'parse_query', lambda query: ('tags : (', None))
+    files, pagination = search_index.search_page('hat', per_page=10, order='name-asc')
+    assert [item['path'] for item in files] == ['hats', 'hats/a.png', 'misc/red_hat.png']
+    assert search_index.count_matches('hat') == (1, 2)
+
+
+def test_fuzzy_search_ranks_by_similarity(image_dir):
+    from backend import catalog
+    from backend.search_index import fuzzy_search
+    from conftest import write_unit
+
+    for path in ['chars/tatsumaki.png', 'chars/tatsumaki_fanart.png', 'chars/fubuki.png', 'tatsumaki set/x.png']:
+        write_unit(image_dir, path)
+    catalog.reconcile_catalog(quiet=True)
+
+    # 拼错的名称仍能命中，相似度高的排在前面，不相关的名称被丢弃
+    results = fuzzy_search('tatsumkai')
+    assert results[0]['path'] == 'chars/tatsumaki.png'
+    assert 'chars/fubuki.png' not in [item['path'] for item in results]
+    assert [item['score'] for item in results] == sorted((item['score'] for item in results), reverse=True)
+
+    # 包含查询词的名称得满分，同分时名称短的在前，文件夹也参与排序
+    results = fuzzy_search('tatsumaki')
+    assert [(item['path'], item['score'], item['is_dir']) for item in results[:3]] == [
+        ('chars/tatsumaki.png', 1.0, False),
+        ('tatsumaki set', 1.0, True),
+        ('chars/tatsumaki_fanart.png', 1.0, False),
+    ]
+    assert fuzzy_search('tatsumaki', limit=1)[0]['path'] == 'chars/tatsumaki.png'
+    assert fuzzy_search('') == []
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend import catalog, thumbnails
+from backend.utils import render_thumbnail
+from conftest import write_image
+
+
+@pytest.fixture
+def store(image_dir, monkeypatch):
+    """空的缩略图存储（在当前线程同步生成，不启动进程池和后台调度）"""
+    os.makedirs('thumbnails')
+    monkeypatch.setattr(thumbnails, '_executor', False)
+    monkeypatch.setattr(thumbnails, '_inflight', {})
+    monkeypatch.setattr(thumbnails, '_served', {})
+    monkeypatch.setattr(thumbnails, '_memory_cache', OrderedDict())
+    monkeypatch.setattr(thumbnails, 'memory_stats', dict.fromkeys(thumbnails.memory_stats, 0))
+    monkeypatch.setattr(thumbnails, '_batch_cache', OrderedDict())
+    monkeypatch.setattr(thumbnails, 'schedule_thumbnails', lambda *args, **kwargs: None)
+    return image_dir
+
+
+def test_concurrent_requests_encode_once(store, monkeypatch):
+    write_image(store, 'a/x.png')
+    catalog.reconcile_catalog(quiet=True)
+    calls = []
+
+    def slow_render(*args):
+        calls.append(args[0])
+        time.sleep(0.2)
+        return render_thumbnail(*args)
+
+    monkeypatch.setattr(thumbnails, 'render_thumbnail', slow_render)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: thumbnails.ensure_thumbnail('a/x.png'), range(8)))
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and os.path.exists(results[0])
+    assert thumbnails._inflight == {}
+
+
+def test_failed_encode_releases_waiters(store, monkeypatch):
+    write_image(store, 'a/x.png')
+    catalog.reconcile_catalog(quiet=True)
+
+    def broken_render(*args):
+        time.sleep(0.1)
+        raise OSError('broken')
+
+    monkeypatch.setattr(thumbnails, 'render_thumbnail', broken_render)
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(lambda _: thumbnails.ensure_thumbnail('a/x.png'), range(4))) == [None] * 4
+    assert thumbnails._inflight == {}
+    # 失败不会留下占位，之后的请求重新生成
+    monkeypatch.setattr(thumbnails, 'render_thumbnail', render_thumbnail)
+    assert os.path.exists(thumbnails.ensure_thumbnail('a/x.png'))
+
+
+def _no_render(*args):
+    raise AssertionError('不应重新生成缩略图')
+
+
+@pytest.mark.parametrize('old_path, new_path, unit_path', [
+    ('a/x.png', 'a/y.png', 'a/y.png'),
+    ('a', 'b', 'b/x.png'),
+])
+def test_rename_moves_thumbnails(store, monkeypatch, old_path, new_path, unit_path):
+    write_image(store, 'a/x.png')
+    catalog.reconcile_catalog(quiet=True)
+    old_thumbnail = thumbnails.ensure_thumbnail('a/x.png')
+
+    # 改名不改变原图的 mtime 和大小，已有缩略图迁移到新键即可
+    os.rename(os.path.join(store, old_path), os.path.join(store, new_path))
+    thumbnails.rename_thumbnails(old_path, new_path)
+    monkeypatch.setattr(thumbnails, 'render_thumbnail', _no_render)
+    new_thumbnail = thumbnails.ensure_thumbnail(unit_path)
+    assert new_thumbnail != old_thumbnail
+    assert os.path.exists(new_thumbnail) and not os.path.exists(old_thumbnail)
+    assert [record['path'] for record in catalog.list_thumbnails(unit_path)] == [unit_path]
+    assert catalog.list_thumbnails('a/x.png') == []
+
+
+def _unpack(data):
+    """按缩略图包格式拆出 (索引, {单元路径: 缩略图内容})"""
+    length = struct.unpack('>I', data[:4])[0]
+    index = json.loads(data[4:4 + length].decode('utf-8'))
+    body = data[4 + length:]
+    return index, {item['path']: body[item['offset']:item['offset'] + item['length']] for item in index['items']}
+
+
+def test_pack_round_trip(store, monkeypatch):
+    for i in range(3):
+        write_image(store, f'a/x{i}.png', color=(i * 80, 0, 0))
+    catalog.reconcile_catalog(quiet=True)
+    for i in range(2):
+        thumbnails.ensure_thumbnail(f'a/x{i}.png')
+    scheduled = []
+    monkeypatch.setattr(thumbnails, 'schedule_thumbnails', lambda paths, *args: scheduled.extend(paths))
+
+    # 缺少的缩略图列在 missing 中并优先排队生成，不完整的包不缓存
+    partial_signature, data = thumbnails.pack_thumbnails('a', 0, 10, order='name-asc')
+    index, contents = _unpack(data)
+    assert index['missing'] == scheduled == ['a/x2.png']
+    assert index['mimetype'] == 'image/jpeg' and index['next_cursor'] is None
+    for path, content in contents.items():
+        with open(thumbnails.get_thumbnail_path(thumbnails.locate_thumbnail(path)[1]), 'rb') as f:
+            assert content == f.read()
+    assert list(contents) == ['a/x0.png', 'a/x1.png']
+
+    thumbnails.ensure_thumbnail('a/x2.png')
+    signature, data = thumbnails.pack_thumbnails('a', 0, 10, order='name-asc')
+    index, contents = _unpack(data)
+    assert signature != partial_signature
+    assert index['missing'] == [] and list(contents) == ['a/x0.png', 'a/x1.png', 'a/x2.png']
+    assert thumbnails.pack_thumbnails('a', 0, 10, order='name-asc') == (signature, data)
+
+    # 分页时返回下一页游标
+    index, contents = _unpack(thumbnails.pack_thumbnails('a', 0, 2, order='name-asc')[1])
+    assert list(contents) == ['a/x0.png', 'a/x1.png'] and index['next_cursor']
+
+
+def _generate(store, count):
+    paths = [f'a/x{i}.png' for i in range(count)]
+    for i, path in enumerate(paths):
+        write_image(store, path, color=(i * 80, 0, 0))
+    catalog.reconcile_catalog(quiet=True)
+    return [thumbnails.ensure_thumbnail(path) for path in paths]
+
+
+def test_collect_garbage_dry_run_then_delete(store):
+    from conftest import bump_mtime
+
+    files = _generate(store, 3)
+    # 原图删除、原图修改各留下一张失效的缩略图，再放一个没有登记的旧文件
+    os.remove(os.path.join(store, 'a/x0.png'))
+    bump_mtime(write_image(store, 'a/x1.png', color='blue'))
+    catalog.reconcile_catalog(quiet=True)
+    orphan = os.path.join('thumbnails', 'ab', 'ab' + '0' * 38 + '.jpg')
+    os.makedirs(os.path.dirname(orphan))
+    with open(orphan, 'wb') as f:
+        f.write(b'x' * 10)
+    bump_mtime(orphan, -120)
+
+    report = thumbnails.collect_garbage(dry_run=True)
+    counts = {category: report[category]['count']
+              for category in ('missing_source', 'outdated', 'stale_profile', 'missing_file', 'orphan_file')}
+    assert counts == {'missing_source': 1, 'outdated': 1, 'stale_profile': 0, 'missing_file': 0, 'orphan_file': 1}
+    assert report['orphan_file']['bytes'] == 10
+    assert all(os.path.exists(path) for path in files + [orphan])
+
+    report = thumbnails.collect_garbage(dry_run=False)
+    assert not report['dry_run'] and report['total_bytes_after'] == os.path.getsize(files[2])
+    assert [os.path.exists(path) for path in files + [orphan]] == [False, False, True, False]
+    assert [record['path'] for record in catalog.list_thumbnails('a')] == ['a/x2.png']
+    assert thumbnails.collect_garbage()['missing_source']['count'] == 0
+
+
+def test_enforce_budget_evicts_least_recently_served(store, monkeypatch):
+    files = _generate(store, 3)
+    keys = [os.path.basename(path) for path in files]
+    # x1 从未被请求，x2 比 x0 更早被请求
+    for key in (keys[2], keys[0]):
+        time.sleep(0.01)
+        thumbnails.touch_thumbnails([key])
+    total = sum(os.path.getsize(path) for path in files)
+    monkeypatch.setattr(thumbnails, '_budget_check', [0.0, False])
+
+    monkeypatch.setattr(thumbnails, 'THUMBNAIL_BUDGET_MB', total / 1024 / 1024)
+    assert thumbnails.enforce_budget() == {'count': 0, 'bytes': 0}
+
+    # 超出上限后淘汰到上限的 90% 以下，dry_run 只统计
+    monkeypatch.setattr(thumbnails, 'THUMBNAIL_BUDGET_MB', (total - 1) / 1024 / 1024)
+    expected = {'count': 1, 'bytes': os.path.getsize(files[1])}
+    assert thumbnails.enforce_budget(dry_run=True) == expected
+    assert all(os.path.exists(path) for path in files)
+    assert thumbnails.enforce_budget() == expected
+    assert [os.path.exists(path) for path in files] == [True, False, True]
+    assert catalog.get_thumbnail_totals()[0] == 2
@@ -0,0 +1,39 @@
+import os
+
+from backend import catalog, tree_cache
+from conftest import write_unit
+
+
+def tree_paths(nodes):
+    paths = []
+    for node in nodes:
+        paths.append(node['path'])
+        paths.extend(tree_paths(node['children']))
+    return paths
+
+
+def test_rename_folder_keeps_subtree(image_dir):
+    catalog.add_listener(tree_cache.on_catalog_changed)
+    write_unit(image_dir, '人物/a/x/one.png')
+    write_unit(image_dir, '人物/b/two.png')
+    catalog.reconcile_catalog(quiet=True)
+    assert tree_paths(tree_cache.get_tree()) == ['人物', '人物/a', '人物/a/x', '人物/b']
+
+    os.rename(os.path.join(image_dir, '人物'), os.path.join(image_dir, 'people'))
+    catalog.rename_folder('人物', 'people')
+
+    assert tree_paths(tree_cache.get_tree()) == ['people', 'people/a', 'people/a/x', 'people/b']
+    level = tree_cache.get_level('')
+    assert [(row['path'], row['child_count']) for row in level] == [('people', 2)]
+    assert [row['path'] for row in tree_cache.get_level('people/a')] == ['people/a/x']
+
+
+def test_new_folder_appears_in_loaded_tree(image_dir):
+    catalog.add_listener(tree_cache.on_catalog_changed)
+    write_unit(image_dir, 'a/one.png')
+    catalog.reconcile_catalog(quiet=True)
+    assert tree_paths(tree_cache.get_tree()) == ['a']
+
+    write_unit(image_dir, 'a/b/c/two.png')
+    catalog.refresh_directory('a')
+    assert tree_paths(tree_cache.get_tree()) == ['a', 'a/b', 'a/b/c']
@@ -0,0 +1,28 @@
+from backend.utils import pack_columns
+
+
+def test_pack_columns_strips_common_folder():
+    packed = pack_columns([
+        {'name': 'x', 'path': 'chars/tatsumaki/x.png', 'modified': 1},
+        {'name': 'y', 'path': 'chars/tatsumaki/sub/y.png', 'modified': 2},
+    ])
+    assert packed == {
+        'count': 2,
+        'prefix': 'chars/tatsumaki/',
+        'columns': {'name': ['x', 'y'], 'path': ['x.png', 'sub/y.png'], 'modified': [1, 2]},
+    }
+
+
+def test_pack_columns_prefix_stops_at_folder_boundary():
+    # 公共前缀 chars/tatsu 不是完整的文件夹名，只去掉 chars/
+    packed = pack_columns([{'path': 'chars/tatsumaki/x.png'}, {'path': 'chars/tatsuya/y.png'}])
+    assert packed['prefix'] == 'chars/'
+    assert packed['columns']['path'] == ['tatsumaki/x.png', 'tatsuya/y.png']
+    assert pack_columns([{'path': 'a.png'}, {'path': 'b/c.png'}])['prefix'] == ''
+
+
+def test_pack_columns_missing_fields_and_empty():
+    packed = pack_columns([{'path': 'a/x.png', 'is_dir': False}, {'path': 'a/y', 'truncated': True}])
+    assert packed['columns']['truncated'] == [None, True]
+    assert packed['columns']['is_dir'] == [False, None]
+    assert pack_columns([]) == {'count': 0, 'prefix': '', 'columns': {}}